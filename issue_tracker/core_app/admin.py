@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Issue, Comment, Label
+from .models import Issue, Comment, Label, ImportJob
+from .cache import bump_issue_generation, issue_detail_cache
+from .comment_counters import refresh_comment_counters
 # Register your models here.
 
 def get_all_fields(model):
@@ -14,6 +16,40 @@ class IssueAdmin(admin.ModelAdmin):
     list_filter = ('status', 'assignee', 'labels')
     search_fields = ('title', 'description')
 
+    # admin edits skip the API write paths, bump the generation so cached
+    # details are not served
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        bump_issue_generation(form.instance.id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        issue_detail_cache.invalidate(obj.id)
+
+    def delete_queryset(self, request, queryset):
+        issue_ids = list(queryset.values_list('id', flat=True))
+        super().delete_queryset(request, queryset)
+        issue_detail_cache.invalidate(*issue_ids)
+
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_display = get_all_fields(Comment)
\ No newline at end of file
+    list_display = get_all_fields(Comment)
+
+    # recounts the issue's comments, which also bumps its generation
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_comment_counters(obj.issue_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_comment_counters(obj.issue_id)
+
+    def delete_queryset(self, request, queryset):
+        issue_ids = list(queryset.values_list('issue_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        refresh_comment_counters(*issue_ids)
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file_type', 'status', 'rows_processed', 'imported_count', 'error_count', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
\ No newline at end of file
@@ -1,6 +1,29 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
 
 
 class CoreAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core_app'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from .cache import invalidate_issue_list, invalidate_renamed_user, invalidate_users
+        from .helpers import check_shared_cache
+        from .label_registry import invalidate_labels
+        from .middleware import install_query_recorder
+        from .models import Issue, Label
+        from .search import ensure_search_index
+
+        checks.register(check_shared_cache, checks.Tags.caches, deploy=True)
+        post_migrate.connect(ensure_search_index, sender=self)
+        connection_created.connect(install_query_recorder, dispatch_uid='query-recorder')
+        post_save.connect(invalidate_labels, sender=Label, dispatch_uid='label-registry-save')
+        post_delete.connect(invalidate_labels, sender=Label, dispatch_uid='label-registry-delete')
+        post_delete.connect(invalidate_issue_list, sender=Issue, dispatch_uid='issue-list-delete')
+        post_save.connect(invalidate_issue_list, sender=User, dispatch_uid='issue-list-user-save')
+        post_delete.connect(invalidate_issue_list, sender=User, dispatch_uid='issue-list-user-delete')
+        pre_save.connect(invalidate_renamed_user, sender=User, dispatch_uid='issue-detail-user-rename')
+        post_delete.connect(invalidate_users, sender=User, dispatch_uid='issue-detail-user-delete')
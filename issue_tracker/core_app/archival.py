@@ -0,0 +1,294 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .cache import ISSUES_GENERATION, issue_detail_cache
+from .helpers import invalidate_generation
+from .models import ArchivedComment, ArchivedIssue, ArchivedIssueLabel, ArchivedLabel, Comment, Issue, Label
+
+logger = logging.getLogger(__name__)
+
+IssueLabel = Issue.labels.through
+
+# summary of the last archive_deleted run, for GET /reports/metrics
+LAST_RUN_KEY = 'archival:last-run'
+
+
+# Moves soft deleted rows whose deletion is older than the retention window
+# out of the live tables into the archive tables (see models.ArchivedIssue),
+# so the tables and their indexes only hold what the API can still serve.
+# A soft delete sets updated_at and nothing writes deleted rows afterwards,
+# so updated_at is the deletion time.
+#
+# Issues go first, each with all its comments and label links, then the
+# deleted comments of live issues, then labels with their links. Every batch
+# of `batch_size` rows is one short transaction that copies and deletes them;
+# the run sleeps `pause` seconds between batches to leave the database to
+# the API. Rows are locked with SKIP LOCKED, so overlapping runs share the
+# work. `max_seconds` bounds a scheduled run, the next one carries on.
+def archive_deleted(retention_days=None, batch_size=None, pause=None, max_seconds=None):
+    retention_days = getattr(settings, 'ARCHIVE_RETENTION_DAYS', 30) if retention_days is None else retention_days
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', 500)
+    pause = getattr(settings, 'ARCHIVE_PAUSE_SECONDS', 0.1) if pause is None else pause
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    run = ArchiveRun(cutoff)
+    for table, archive_batch in (('issues', archive_issue_batch), ('comments', archive_comment_batch), ('labels', archive_label_batch)):
+        while True:
+            if max_seconds is not None and run.elapsed() >= max_seconds:
+                run.complete = False
+                return run.finish()
+            started = time.monotonic()
+            moved = archive_batch(cutoff, batch_size)
+            run.add(moved, time.monotonic() - started)
+            if moved[table] < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return run.finish()
+
+
+# Scheduler entry point (cron, celery beat, ...): one archive_deleted run with
+# the settings, bounded by ARCHIVE_MAX_SECONDS.
+def run_archival():
+    summary = archive_deleted(max_seconds=getattr(settings, 'ARCHIVE_MAX_SECONDS', 0) or None)
+    logger.info(
+        'Archived %s rows in %ss (%s rows/s)',
+        sum(summary['rows'].values()), summary['seconds'], summary['rows_per_second'],
+    )
+    return summary
+
+
+def last_archive_run():
+    return cache.get(LAST_RUN_KEY)
+
+
+class ArchiveRun:
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.started = time.monotonic()
+        self.rows = {'issues': 0, 'comments': 0, 'labels': 0, 'issue_labels': 0}
+        self.batches = 0
+        # time spent in batches, without the pauses
+        self.busy = 0.0
+        self.complete = True
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def add(self, moved, seconds):
+        for table, count in moved.items():
+            self.rows[table] += count
+        self.batches += 1
+        self.busy += seconds
+
+    def finish(self):
+        elapsed = self.elapsed()
+        moved = sum(self.rows.values())
+        summary = {
+            'cutoff': self.cutoff,
+            'finished_at': timezone.now(),
+            'complete': self.complete,
+            'rows': dict(self.rows),
+            'batches': self.batches,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(moved / elapsed, 1) if elapsed else 0.0,
+            'batch_rows_per_second': round(moved / self.busy, 1) if self.busy else 0.0,
+        }
+        cache.set(LAST_RUN_KEY, summary, None)
+        return summary
+
+
+# Ids of up to `limit` rows of `queryset` deleted before `cutoff`, oldest
+# first, locked until the batch commits.
+def deleted_ids(queryset, cutoff, limit):
+    return list(
+        queryset.select_for_update(skip_locked=True)
+        .filter(is_deleted=True, updated_at__lt=cutoff)
+        .order_by('updated_at')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+# Column values of a row as JSON, datetimes at full precision.
+def archived_data(row):
+    return {name: value.isoformat() if isinstance(value, datetime) else value for name, value in row.items()}
+
+
+def archive_comments(comments):
+    rows = list(comments.values())
+    ArchivedComment.objects.bulk_create([
+        ArchivedComment(
+            id=row['id'], issue_id=row['issue_id'], data=archived_data(row),
+            deleted_at=row['updated_at'] if row['is_deleted'] else None,
+        )
+        for row in rows
+    ])
+    comments.delete()
+    return len(rows)
+
+
+def archive_links(links):
+    rows = list(links.values_list('issue_id', 'label_id'))
+    ArchivedIssueLabel.objects.bulk_create(
+        [ArchivedIssueLabel(issue_id=issue_id, label_id=label_id) for issue_id, label_id in rows],
+        ignore_conflicts=True,
+    )
+    links.delete()
+    return len(rows)
+
+
+def archive_issue_batch(cutoff, batch_size):
+    with transaction.atomic():
+        ids = deleted_ids(Issue.objects.all(), cutoff, batch_size)
+        if not ids:
+            return {'issues': 0}
+        comments = archive_comments(Comment.objects.filter(issue_id__in=ids))
+        links = archive_links(IssueLabel.objects.filter(issue_id__in=ids))
+        issues = Issue.objects.filter(id__in=ids)
+        ArchivedIssue.objects.bulk_create([
+            ArchivedIssue(id=row['id'], data=archived_data(row), deleted_at=row['updated_at'])
+            for row in issues.values()
+        ])
+        # comments and label links are gone already, the delete only sends
+        # post_delete, which bumps the issues generation (the list ETag
+        # watermark includes deleted rows)
+        issues.delete()
+    issue_detail_cache.invalidate(*ids)
+    return {'issues': len(ids), 'comments': comments, 'issue_labels': links}
+
+
+def archive_comment_batch(cutoff, batch_size):
+    with transaction.atomic():
+        ids = deleted_ids(Comment.objects.all(), cutoff, batch_size)
+        if not ids:
+            return {'comments': 0}
+        return {'comments': archive_comments(Comment.objects.filter(id__in=ids))}
+
+
+def archive_label_batch(cutoff, batch_size):
+    with transaction.atomic():
+        ids = deleted_ids(Label.objects.all(), cutoff, batch_size)
+        if not ids:
+            return {'labels': 0}
+        links = archive_links(IssueLabel.objects.filter(label_id__in=ids))
+        labels = Label.objects.filter(id__in=ids)
+        ArchivedLabel.objects.bulk_create([
+            ArchivedLabel(id=row['id'], data=archived_data(row), deleted_at=row['updated_at'])
+            for row in labels.values()
+        ])
+        # post_delete reloads the label index
+        labels.delete()
+    return {'labels': len(ids), 'issue_labels': links}
+
+
+# Soft deleted rows the next run would archive, per table.
+def archive_candidates(retention_days=None):
+    retention_days = getattr(settings, 'ARCHIVE_RETENTION_DAYS', 30) if retention_days is None else retention_days
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    return {
+        'issues': Issue.objects.filter(is_deleted=True, updated_at__lt=cutoff).count(),
+        'comments': Comment.objects.filter(is_deleted=True, updated_at__lt=cutoff).count(),
+        'labels': Label.objects.filter(is_deleted=True, updated_at__lt=cutoff).count(),
+    }
+
+
+# Restores archived rows into the live tables as they were archived, still
+# soft deleted, with updated_at set to now so they get a full retention
+# window before the next run archives them again. Raw saves keep the other
+# timestamps. Links come back once both their issue and label are live rows
+# again; users deleted meanwhile are cleared from the rows.
+def restore_rows(model, archived):
+    now = timezone.now()
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    users = [
+        field.attname for field in fields.values()
+        if field.is_relation and field.related_model is User
+    ]
+    rows = []
+    for entry in archived:
+        row = model(**{name: fields[name].to_python(value) for name, value in entry.data.items() if name in fields})
+        if row.is_deleted:
+            row.updated_at = now
+        rows.append(row)
+    user_ids = {getattr(row, name) for row in rows for name in users} - {None}
+    existing = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)) if user_ids else set()
+    for row in rows:
+        for name in users:
+            if getattr(row, name) not in existing:
+                setattr(row, name, None)
+        row.save_base(raw=True, force_insert=True)
+    return len(rows)
+
+
+def restore_links(links):
+    rows = list(links.values_list('issue_id', 'label_id'))
+    IssueLabel.objects.bulk_create(
+        [IssueLabel(issue_id=issue_id, label_id=label_id) for issue_id, label_id in rows],
+        ignore_conflicts=True,
+    )
+    links.delete()
+    return len(rows)
+
+
+# Each restore_* returns the number of rows restored per table and raises
+# ValueError, restoring nothing, when an id is not archived or cannot be
+# restored.
+def restore_issues(*issue_ids):
+    with transaction.atomic():
+        archived = list(ArchivedIssue.objects.select_for_update().filter(id__in=issue_ids).order_by('id'))
+        not_archived(issue_ids, archived, 'Issues')
+        issues = restore_rows(Issue, archived)
+        archived_comments = ArchivedComment.objects.filter(issue_id__in=issue_ids)
+        comments = restore_rows(Comment, archived_comments.order_by('id'))
+        archived_comments.delete()
+        ArchivedIssue.objects.filter(id__in=issue_ids).delete()
+        links = restore_links(ArchivedIssueLabel.objects.filter(
+            Exists(Label.objects.filter(id=OuterRef('label_id'))), issue_id__in=issue_ids,
+        ))
+        invalidate_generation(ISSUES_GENERATION)
+    return {'issues': issues, 'comments': comments, 'issue_labels': links}
+
+
+# Comments archived on their own, their issue has to be a live row.
+def restore_comments(*comment_ids):
+    with transaction.atomic():
+        archived = list(ArchivedComment.objects.select_for_update().filter(id__in=comment_ids).order_by('id'))
+        not_archived(comment_ids, archived, 'Comments')
+        live_issues = set(Issue.objects.filter(id__in={entry.issue_id for entry in archived}).values_list('id', flat=True))
+        orphans = sorted(entry.id for entry in archived if entry.issue_id not in live_issues)
+        if orphans:
+            raise ValueError(f"Comments of archived issues, restore the issues instead: {', '.join(map(str, orphans))}")
+        comments = restore_rows(Comment, archived)
+        ArchivedComment.objects.filter(id__in=comment_ids).delete()
+    return {'comments': comments}
+
+
+def restore_labels(*label_ids):
+    with transaction.atomic():
+        archived = list(ArchivedLabel.objects.select_for_update().filter(id__in=label_ids).order_by('id'))
+        not_archived(label_ids, archived, 'Labels')
+        names = Q()
+        for entry in archived:
+            names |= Q(name__iexact=entry.data['name'])
+        taken = sorted(Label.objects.filter(names).values_list('name', flat=True))
+        if taken:
+            raise ValueError(f"Label names in use: {', '.join(taken)}")
+        labels = restore_rows(Label, archived)
+        ArchivedLabel.objects.filter(id__in=label_ids).delete()
+        links = restore_links(ArchivedIssueLabel.objects.filter(
+            Exists(Issue.objects.filter(id=OuterRef('issue_id'))), label_id__in=label_ids,
+        ))
+    return {'labels': labels, 'issue_labels': links}
+
+
+def not_archived(ids, archived, kind):
+    missing = set(ids) - {entry.id for entry in archived}
+    if missing:
+        raise ValueError(f"{kind} not archived: {', '.join(map(str, sorted(missing)))}")
@@ -0,0 +1,27 @@
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# core_app.urls with the read endpoints served by async views, used by the
+# ASGI application. Other methods on the same URLs still reach the DRF views.
+ASYNC_READ_VIEWS = {
+    'label-list': async_views.label_list,
+    'issue-list': async_views.issue_list,
+    'issue-detail': async_views.issue_retrieve,
+    'issue-top-assignees': async_views.top_assignee,
+    'issue-average-time': async_views.average_time,
+    'issue-cache-stats': async_views.cache_stats,
+    'request-metrics': async_views.request_metrics,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), async_views.read_or_delegate(ASYNC_READ_VIEWS[pattern.name], pattern.callback), name=pattern.name)
+    if pattern.name in ASYNC_READ_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
+
+# only served under ASGI, where an open stream does not hold a thread
+urlpatterns += [
+    path('changes/stream', async_views.async_read_view(async_views.change_stream), name='change-stream'),
+]
@@ -0,0 +1,243 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from user_app.authentication import CachedTokenAuthentication, token_cache_stats
+from .archival import last_archive_run
+from .cache import LABELS_GENERATION, issue_detail_cache, issue_detail_etag, issue_list_etag
+from .facets import cached_facets, issue_facets
+from .helpers import CommentCursorPagination, CustomCursorPagination, etag_matches, get_generation, make_etag
+from .issue_views import build_issue_detail, detail_comments, detail_issue, detail_labels, filter_issues, issue_list_query, latency_filters, latency_report, top_assignees
+from .latency import latency_summary
+from .middleware import route_metrics
+from .models import Issue, Label
+from .routers import replica_monitor, replica_read
+from .streams import parse_stream_filters, stream_changes
+
+# Async variants of the read endpoints, served by the ASGI application (see
+# issue_tracker/asgi.py) at the same URLs and with the same payloads as the
+# DRF views. Other methods on those URLs go to the DRF view.
+
+
+def json_response(data, status=200, etag=None):
+    response = JsonResponse(data, status=status, encoder=JSONEncoder, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+# Runs the independent query functions concurrently. With
+# ASYNC_PARALLEL_QUERIES each runs in an executor thread, on that thread's own
+# database connection, so the queries really overlap; otherwise (and in tests,
+# where only the test transaction's connection sees the data) they run one
+# after the other on the request's connection, like Django's async ORM.
+async def gather_queries(*functions):
+    if not getattr(settings, 'ASYNC_PARALLEL_QUERIES', True):
+        return [await sync_to_async(function)() for function in functions]
+    return await asyncio.gather(*[
+        sync_to_async(pooled(function), thread_sensitive=False)() for function in functions
+    ])
+
+
+# Executor threads outlive requests and keep their connections open, one
+# that failed is dropped so the next query reconnects.
+def pooled(function):
+    def run():
+        try:
+            return function()
+        finally:
+            for connection in connections.all(initialized_only=True):
+                if connection.errors_occurred:
+                    connection.errors_occurred = False
+                    if not connection.is_usable():
+                        connection.close()
+    return run
+
+
+def unauthorized(detail):
+    response = json_response({"detail": detail}, status=401)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+# Token authentication as on the DRF views (CachedTokenAuthentication,
+# IsAuthenticated), with the same 401 payloads.
+def async_read_view(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        header = request.headers.get('Authorization', '').split()
+        if not header or header[0].lower() != 'token':
+            return unauthorized("Authentication credentials were not provided.")
+        if len(header) != 2:
+            return unauthorized("Invalid token header. No credentials provided.")
+        try:
+            user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(header[1])
+        except AuthenticationFailed as e:
+            return unauthorized(str(e.detail))
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+# GET goes to `async_view`, every other method to the DRF `sync_view`.
+def read_or_delegate(async_view, sync_view):
+    async_view = async_read_view(async_view)
+    sync_view = sync_to_async(sync_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            return await async_view(request, *args, **kwargs)
+        return await sync_view(request, *args, **kwargs)
+    return view
+
+
+def paginate(paginator, queryset, request):
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(page).data
+
+
+@replica_read
+async def issue_list(request):
+    try:
+        queryset, paginator = issue_list_query(request.GET)
+        cached = await sync_to_async(cached_facets)(request.GET)
+    except ValueError as e:
+        return json_response({"error": f"Invalid filters: {str(e)}"}, status=400)
+    list_etag = await sync_to_async(issue_list_etag)(request)
+    etag = list_etag if cached is None else make_etag(list_etag, cached.get('stamp'))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    data = await sync_to_async(paginate)(paginator, queryset, Request(request))
+    if cached is not None:
+        facets = await sync_to_async(issue_facets)(request.GET, filter_issues(request.GET), cached)
+        data['facets'] = facets['counts']
+        etag = make_etag(list_etag, facets['stamp'])
+    return json_response(data, etag=etag)
+
+
+# The version check, ETag and cache lookup of IssueViewSet.retrieve, in one
+# executor call.
+def cached_issue_detail(request, pk, page_size):
+    current = Issue.objects.filter(id=pk, is_deleted=False).values_list('version', 'generation').first()
+    if not current:
+        return None, None, None
+    return current, issue_detail_etag(request, pk, *current, page_size), issue_detail_cache.get(pk, *current, page_size)
+
+
+@replica_read
+async def issue_retrieve(request, pk):
+    page_size = CommentCursorPagination().get_page_size(Request(request))
+    current, etag, data = await sync_to_async(cached_issue_detail)(request, pk, page_size)
+    if not current:
+        return json_response({"error": "Issue not found"}, status=404)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if data is None:
+        issue, labels, comments = await gather_queries(
+            lambda: detail_issue(pk), lambda: detail_labels(pk), lambda: detail_comments(pk, page_size),
+        )
+        if not issue:
+            return json_response({"error": "Issue not found"}, status=404)
+        data = build_issue_detail(issue, labels, comments, page_size)
+        generation = data.pop('generation')
+        await sync_to_async(issue_detail_cache.set)(pk, data['version'], generation, page_size, data)
+        if (data['version'], generation) != current:
+            etag = await sync_to_async(issue_detail_etag)(request, pk, data['version'], generation, page_size)
+
+    if data['comments_next']:
+        data = {**data, 'comments_next': request.build_absolute_uri(data['comments_next'])}
+    return json_response({"issue": data}, etag=etag)
+
+
+@replica_read
+async def label_list(request):
+    etag = make_etag('labels', await sync_to_async(get_generation)(LABELS_GENERATION), request.build_absolute_uri())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    labels = Label.objects.filter(is_deleted=False)
+    if request.GET.get('id'):
+        labels = labels.filter(id=request.GET['id'])
+    if request.GET.get('keyword'):
+        labels = labels.filter(name__icontains=request.GET['keyword'])
+    data = await sync_to_async(paginate)(CustomCursorPagination(), labels.values('id', 'name'), Request(request))
+    return json_response(data, etag=etag)
+
+
+@replica_read
+async def top_assignee(request):
+    try:
+        return json_response({
+            "message": "Successfully fetched top 10 assignees",
+            "top_assignees": await sync_to_async(top_assignees)(),
+        })
+    except Exception as e:
+        return json_response({"error": f"Error while fetching top assignees: {str(e)}"}, status=500)
+
+
+@replica_read
+async def average_time(request):
+    try:
+        try:
+            filters = latency_filters(request.GET)
+        except ValueError as e:
+            return json_response(
+                {"error": f"Invalid filters, use start/end as YYYY-MM-DD and one of label or assignee id: {str(e)}"}, status=400,
+            )
+        return json_response(latency_report(await sync_to_async(latency_summary)(*filters)))
+    except Exception as e:
+        return json_response({"error": f"Error while fetching average time: {str(e)}"}, status=500)
+
+
+async def cache_stats(request):
+    if not request.user.is_staff:
+        return json_response({"error": "Only staff users can view cache statistics"}, status=403)
+    return json_response({
+        "message": "Successfully fetched cache statistics",
+        "issue_detail": issue_detail_cache.stats(),
+        "auth_tokens": token_cache_stats(),
+    })
+
+
+async def request_metrics(request):
+    if not request.user.is_staff:
+        return json_response({"error": "Only staff users can view request metrics"}, status=403)
+    return json_response({
+        "message": "Successfully fetched request metrics",
+        "routes": route_metrics.summary(),
+        "databases": replica_monitor.stats(),
+        "archival": last_archive_run(),
+    })
+
+
+# Live change events as server-sent events (ASGI only). Resumes after the
+# Last-Event-ID a reconnecting browser sends, or after `since`, otherwise
+# starts from now.
+async def change_stream(request):
+    try:
+        filters = parse_stream_filters(request.GET)
+        since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+        since = int(since) if since else None
+        if since is not None and since < 0:
+            raise ValueError(since)
+    except ValueError as e:
+        return json_response({"error": f"Invalid filters, use issue and label ids, an assignee id and since as an event id: {str(e)}"}, status=400)
+    response = StreamingHttpResponse(stream_changes(filters, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would buffer the events otherwise
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,472 @@
+import asyncio
+import io
+import itertools
+import math
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .cache import issue_detail_cache
+from .changes import ChangeLog
+from .comment_counters import refresh_comment_counters
+from .exporter import EXPORT_CHUNK_SIZE
+from .facets import facets_cache_key, parse_facets
+from .importer import create_issues
+from .models import Comment, ImportJob, Issue, Label
+
+BENCHMARK_USERNAME = 'benchmark'
+BENCHMARK_PASSWORD = 'benchmark-password'
+BULK_BENCHMARK_SIZE = 50
+IMPORT_BENCHMARK_ROWS = 50
+# transaction control is not counted against a budget, it differs between
+# backends and between a test (savepoints) and a real request
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+# One benchmarked request. `build(ctx)` runs before the timed request (its
+# queries are not counted) and returns the APIClient call arguments, so
+# writes get a fresh target every iteration. `budget` is the most SQL
+# queries one request may run, an int or a function of the context for
+# endpoints that read in chunks.
+class Endpoint:
+    def __init__(self, name, route, method, build, budget, status=200):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.build = build
+        self.budget = budget
+        self.status = status
+
+    def budget_for(self, ctx):
+        return self.budget(ctx) if callable(self.budget) else self.budget
+
+
+# Token of the staff benchmark user, created on first use. Its password is
+# known (the sign-in endpoint is benchmarked), so only use it inside a
+# transaction that is rolled back, as benchmark_api does.
+def benchmark_token():
+    user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME, defaults={'is_staff': True})
+    user.is_staff = True
+    user.set_password(BENCHMARK_PASSWORD)
+    user.save()
+    token, _ = Token.objects.get_or_create(user=user)
+    return token
+
+
+# Token of a throwaway staff user for benchmarks whose requests commit
+# (benchmark_concurrency). The user cannot sign in and is deleted with its
+# token on exit.
+@contextmanager
+def temporary_benchmark_token():
+    user = User(username=f'{BENCHMARK_USERNAME}-{uuid.uuid4().hex[:12]}', is_staff=True)
+    user.set_unusable_password()
+    user.save()
+    try:
+        yield Token.objects.create(user=user)
+    finally:
+        user.delete()
+
+
+# Users, token and sample rows the endpoints run against. The busiest live
+# issue (most comments) is used for the reads, so they run on the realistic
+# worst case of a seeded dataset.
+class BenchmarkContext:
+    def __init__(self):
+        self.counter = itertools.count()
+        self.token = benchmark_token()
+        self.user = self.token.user
+        self.client = APIClient(SERVER_NAME=client_host())
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.label_ids = list(Label.objects.filter(is_deleted=False).order_by('id').values_list('id', flat=True)[:3])
+        if not self.label_ids:
+            self.label_ids = [Label.objects.create(name=f'Benchmark label {index}').id for index in range(3)]
+        self.label_names = list(Label.objects.filter(id__in=self.label_ids).values_list('name', flat=True))
+
+        busiest = (
+            Comment.objects.filter(is_deleted=False, issue__is_deleted=False)
+            .values('issue').annotate(count=Count('id')).order_by('-count').first()
+        )
+        if busiest:
+            self.issue_id = busiest['issue']
+        else:
+            self.issue_id = self.new_issues(1)[0][0]
+            Comment.objects.bulk_create([
+                Comment(issue_id=self.issue_id, author=self.user, comment=f'comment {index}') for index in range(25)
+            ])
+            refresh_comment_counters(self.issue_id)
+        self.issue_ids = list(Issue.objects.filter(is_deleted=False).order_by('-id').values_list('id', flat=True)[:100])
+        self.job_id = ImportJob.objects.create(
+            file='imports/benchmark.csv', file_type='csv', status='completed', created_by=self.user,
+        ).id
+
+    def unique(self, prefix):
+        return f'{prefix} {time.time_ns()} {next(self.counter)}'
+
+    # Creates `count` labelled, assigned issues, returns (id, version) pairs.
+    def new_issues(self, count):
+        changes = ChangeLog(self.user)
+        ids = create_issues([
+            ({'title': self.unique('Benchmark issue'), 'description': 'benchmark', 'assignee_id': self.user.id,
+              'created_by_id': self.user.id, 'updated_by_id': self.user.id}, self.label_ids)
+            for _ in range(count)
+        ], changes)
+        changes.write()
+        return [(issue_id, 1) for issue_id in ids]
+
+    def next_issue_id(self):
+        return self.issue_ids[next(self.counter) % len(self.issue_ids)] if self.issue_ids else self.issue_id
+
+    def live_issue_count(self):
+        return Issue.objects.filter(is_deleted=False).count()
+
+
+# a host the requests are accepted for, 'localhost' passes the DEBUG checks
+def client_host():
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return hosts[-1] if hosts else 'localhost'
+
+
+def request(path, data=None, **extra):
+    return {'path': path, 'data': data, 'format': 'json', **extra}
+
+
+def signup_request(ctx):
+    return request(reverse('user-signup'), {'username': ctx.unique('bench').replace(' ', '_'), 'password': 'secret-password'})
+
+
+def signin_request(ctx):
+    return request(reverse('user-signin'), {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD})
+
+
+def label_create_request(ctx):
+    return request(reverse('label-list'), {'name': ctx.unique('label')})
+
+
+def label_update_request(ctx):
+    label = Label.objects.create(name=ctx.unique('Label'))
+    return request(reverse('label-detail', args=[label.id]), {'name': ctx.unique('renamed')})
+
+
+def label_destroy_request(ctx):
+    label = Label.objects.create(name=ctx.unique('Label'))
+    return request(reverse('label-detail', args=[label.id]))
+
+
+def issue_create_request(ctx):
+    return request(reverse('issue-list'), {
+        'title': 'Benchmark issue', 'description': 'created by the benchmark',
+        'assignee_id': ctx.user.id, 'labels': ctx.label_ids,
+    })
+
+
+def issue_retrieve_request(ctx):
+    return request(reverse('issue-detail', args=[ctx.issue_id]))
+
+
+# a different issue every time, after dropping it from the detail cache
+def issue_retrieve_uncached_request(ctx):
+    issue_id = ctx.next_issue_id()
+    issue_detail_cache.invalidate(issue_id)
+    return request(reverse('issue-detail', args=[issue_id]))
+
+
+def issue_batch_request(ctx):
+    return request(reverse('issue-batch') + '?ids=' + ','.join(str(issue_id) for issue_id in ctx.issue_ids))
+
+
+# the same 100 issues after dropping them from the detail cache
+def issue_batch_uncached_request(ctx):
+    issue_detail_cache.invalidate(*ctx.issue_ids)
+    return issue_batch_request(ctx)
+
+
+FACETS_QUERY = '?facets=status,label,assignee&status=open,in_progress'
+
+
+# the counts of the filter after dropping them from the facets cache
+def issue_facets_uncached_request(ctx):
+    params = QueryDict(FACETS_QUERY[1:])
+    cache.delete(facets_cache_key(params, parse_facets(params['facets'])))
+    return request(reverse('issue-list') + FACETS_QUERY)
+
+
+def issue_not_modified_request(ctx):
+    path = reverse('issue-detail', args=[ctx.issue_id])
+    etag = ctx.client.get(path)['ETag']
+    return request(path, HTTP_IF_NONE_MATCH=etag)
+
+
+def issue_list_not_modified_request(ctx):
+    path = reverse('issue-list')
+    etag = ctx.client.get(path)['ETag']
+    return request(path, HTTP_IF_NONE_MATCH=etag)
+
+
+def issue_update_request(ctx):
+    issue_id, version = ctx.new_issues(1)[0]
+    return request(reverse('issue-detail', args=[issue_id]), {
+        'version': version, 'status': 'resolved', 'title': 'Benchmark issue, resolved', 'labels': ctx.label_ids[:1],
+    })
+
+
+def issue_destroy_request(ctx):
+    issue_id, _ = ctx.new_issues(1)[0]
+    return request(reverse('issue-detail', args=[issue_id]))
+
+
+def comment_add_request(ctx):
+    return request(reverse('issue-comment', args=[ctx.issue_id]), {'comment': 'benchmark comment'})
+
+
+def replace_labels_request(ctx):
+    issue_id, _ = ctx.new_issues(1)[0]
+    return request(reverse('issue-label', args=[issue_id]), {'labels': ctx.label_ids[1:] or ctx.label_ids})
+
+
+def bulk_create_request(ctx):
+    return request(reverse('issue-bulk-create'), [
+        {'title': f'Bulk issue {index}', 'description': 'bulk', 'assignee_id': ctx.user.id, 'labels': ctx.label_ids}
+        for index in range(BULK_BENCHMARK_SIZE)
+    ])
+
+
+def bulk_update_request(ctx):
+    return request(reverse('issue-bulk-create'), [
+        {'id': issue_id, 'version': version, 'status': 'resolved', 'labels': ctx.label_ids[:1]}
+        for issue_id, version in ctx.new_issues(BULK_BENCHMARK_SIZE)
+    ])
+
+
+def bulk_status_request(ctx):
+    return request(reverse('issue-bulk-status-update'), {
+        'ids': [issue_id for issue_id, _ in ctx.new_issues(BULK_BENCHMARK_SIZE)], 'status': 'in_progress',
+    })
+
+
+def import_request(ctx):
+    lines = ['title,description,status,labels']
+    lines += [f'Imported issue {index},imported,open,"{",".join(ctx.label_names)}"' for index in range(IMPORT_BENCHMARK_ROWS)]
+    upload = SimpleUploadedFile('issues.csv', '\n'.join(lines).encode(), content_type='text/csv')
+    return {'path': reverse('issue-import'), 'data': {'file': upload}, 'format': 'multipart'}
+
+
+# the issues are read through one cursor, their labels with a query per
+# EXPORT_CHUNK_SIZE rows
+def export_budget(ctx):
+    return 1 + max(math.ceil(ctx.live_issue_count() / EXPORT_CHUNK_SIZE), 1)
+
+
+ENDPOINTS = [
+    Endpoint('signup', 'user-signup', 'post', signup_request, 2, status=201),
+    Endpoint('signin', 'user-signin', 'post', signin_request, 2),
+    Endpoint('label list', 'label-list', 'get', lambda ctx: request(reverse('label-list')), 1),
+    Endpoint('label create', 'label-list', 'post', label_create_request, 4, status=201),
+    Endpoint('label update', 'label-detail', 'put', label_update_request, 5),
+    Endpoint('label destroy', 'label-detail', 'delete', label_destroy_request, 4, status=204),
+    Endpoint('issue list', 'issue-list', 'get', lambda ctx: request(reverse('issue-list')), 2),
+    Endpoint('issue list, not modified', 'issue-list', 'get', issue_list_not_modified_request, 1, status=304),
+    Endpoint(
+        'issue list, filtered and sorted', 'issue-list', 'get',
+        lambda ctx: request(reverse('issue-list') + '?status=open,in_progress&updated_after=2020-01-01&sort=-updated_at'), 2,
+    ),
+    Endpoint('issue list, by last comment', 'issue-list', 'get', lambda ctx: request(reverse('issue-list') + '?sort=-last_comment_at'), 2),
+    Endpoint('issue list, facets', 'issue-list', 'get', lambda ctx: request(reverse('issue-list') + FACETS_QUERY), 2),
+    Endpoint('issue list, facets uncached', 'issue-list', 'get', issue_facets_uncached_request, 5),
+    Endpoint('issue search', 'issue-list', 'get', lambda ctx: request(reverse('issue-list') + '?keyword=login'), 2),
+    Endpoint('issue create', 'issue-list', 'post', issue_create_request, 8, status=201),
+    Endpoint('issue retrieve', 'issue-detail', 'get', issue_retrieve_request, 1),
+    Endpoint('issue retrieve, uncached', 'issue-detail', 'get', issue_retrieve_uncached_request, 4),
+    Endpoint('issue retrieve, not modified', 'issue-detail', 'get', issue_not_modified_request, 1, status=304),
+    Endpoint('issue batch', 'issue-batch', 'get', issue_batch_request, 1),
+    Endpoint('issue batch, uncached', 'issue-batch', 'get', issue_batch_uncached_request, 4),
+    Endpoint('issue update', 'issue-detail', 'patch', issue_update_request, 13),
+    Endpoint('issue destroy', 'issue-detail', 'delete', issue_destroy_request, 6),
+    Endpoint('comment list', 'issue-comment', 'get', lambda ctx: request(reverse('issue-comment', args=[ctx.issue_id])), 2),
+    Endpoint('comment add', 'issue-comment', 'post', comment_add_request, 5, status=201),
+    Endpoint('label replace', 'issue-label', 'put', replace_labels_request, 7),
+    Endpoint('bulk create', 'issue-bulk-create', 'post', bulk_create_request, 7, status=201),
+    Endpoint('bulk update', 'issue-bulk-create', 'patch', bulk_update_request, 12),
+    Endpoint('bulk status', 'issue-bulk-status-update', 'post', bulk_status_request, 8),
+    Endpoint('export', 'issue-export', 'get', lambda ctx: request(reverse('issue-export') + '?file_type=csv'), export_budget),
+    Endpoint('import', 'issue-import', 'post', import_request, 4, status=201),
+    Endpoint('import status', 'issue-import-status', 'get', lambda ctx: request(reverse('issue-import-status', args=[ctx.job_id])), 1),
+    Endpoint('top assignees', 'issue-top-assignees', 'get', lambda ctx: request(reverse('issue-top-assignees')), 1),
+    Endpoint('latency report', 'issue-average-time', 'get', lambda ctx: request(reverse('issue-average-time')), 1),
+    Endpoint('cache stats', 'issue-cache-stats', 'get', lambda ctx: request(reverse('issue-cache-stats')), 0),
+    Endpoint('request metrics', 'request-metrics', 'get', lambda ctx: request(reverse('request-metrics')), 0),
+    Endpoint('change feed', 'change-list', 'get', lambda ctx: request(reverse('change-list') + '?since=0'), 1),
+]
+
+
+def count_queries(captured_queries):
+    return sum(1 for query in captured_queries if not query['sql'].upper().startswith(TRANSACTION_STATEMENTS))
+
+
+# nearest-rank percentile of sorted `values`
+def percentile(values, fraction):
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+# Runs `endpoint` once to warm the caches, then `iterations` timed times.
+# Streaming responses are read to the end inside the timed window.
+def run_endpoint(ctx, endpoint, iterations):
+    timings = []
+    queries = []
+    for iteration in range(iterations + 1):
+        kwargs = endpoint.build(ctx)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = getattr(ctx.client, endpoint.method)(**kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if response.status_code != endpoint.status:
+            raise BenchmarkError(f'{endpoint.name}: expected status {endpoint.status}, got {response.status_code}')
+        if iteration:
+            timings.append(elapsed * 1000)
+            queries.append(count_queries(captured.captured_queries))
+    timings.sort()
+    budget = endpoint.budget_for(ctx)
+    return {
+        'name': endpoint.name,
+        'method': endpoint.method.upper(),
+        'route': endpoint.route,
+        'iterations': iterations,
+        'p50_ms': percentile(timings, 0.5),
+        'p95_ms': percentile(timings, 0.95),
+        'p99_ms': percentile(timings, 0.99),
+        'max_queries': max(queries),
+        'budget': budget,
+        'over_budget': max(queries) > budget,
+    }
+
+
+def run_benchmarks(iterations=20, names=None, ctx=None):
+    ctx = ctx or BenchmarkContext()
+    return [
+        run_endpoint(ctx, endpoint, iterations)
+        for endpoint in ENDPOINTS
+        if not names or endpoint.name in names
+    ]
+
+
+# Calls a WSGI application the way a threaded WSGI server would, returns the
+# response status.
+def call_wsgi(application, path, headers):
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': client_host(), 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    statuses = []
+    result = application(environ, lambda status, response_headers, exc_info=None: statuses.append(int(status.split()[0])))
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return statuses[0]
+
+
+# Calls an ASGI application the way an ASGI server would, returns the
+# response status.
+async def call_asgi(application, path, headers):
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'server': (client_host(), 80), 'client': ('127.0.0.1', 0),
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    statuses = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+
+    await application(scope, receive, send)
+    finished.set()
+    return statuses[0]
+
+
+def throughput_result(mode, timings, errors, elapsed):
+    timings.sort()
+    return {
+        'mode': mode,
+        'requests': len(timings),
+        'errors': errors,
+        'requests_per_second': len(timings) / elapsed,
+        'p50_ms': percentile(timings, 0.5),
+        'p95_ms': percentile(timings, 0.95),
+        'p99_ms': percentile(timings, 0.99),
+    }
+
+
+# `requests` GETs spread round robin over `paths`, `concurrency` at a time,
+# through the WSGI application on a thread pool.
+def run_wsgi_throughput(application, paths, headers, concurrency, requests):
+    def timed(path):
+        start = time.perf_counter()
+        status = call_wsgi(application, path, headers)
+        return (time.perf_counter() - start) * 1000, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, [paths[index % len(paths)] for index in range(requests)]))
+    elapsed = time.perf_counter() - start
+    return throughput_result('wsgi', [ms for ms, _ in results], sum(status >= 400 for _, status in results), elapsed)
+
+
+# The same load through the ASGI application on one event loop.
+def run_asgi_throughput(application, paths, headers, concurrency, requests):
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(path):
+            async with semaphore:
+                start = time.perf_counter()
+                status = await call_asgi(application, path, headers)
+                return (time.perf_counter() - start) * 1000, status
+
+        return await asyncio.gather(*[timed(paths[index % len(paths)]) for index in range(requests)])
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    return throughput_result('asgi', [ms for ms, _ in results], sum(status >= 400 for _, status in results), elapsed)
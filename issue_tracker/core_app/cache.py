@@ -0,0 +1,136 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Max
+
+from .helpers import LRUCache, get_generation, invalidate_generation, make_etag
+from .models import Issue
+
+LABELS_GENERATION = 'labels'
+# bumped by changes the issue list watermark (see issue_list_etag) cannot see:
+# hard deletes and assignee renames
+ISSUES_GENERATION = 'issues'
+# bumped when a username changes or a user is deleted, issue details show the
+# usernames of the assignee and the comment authors
+USERS_GENERATION = 'users'
+
+
+# Read-through cache for issue detail payloads. Entries are only served for
+# the (version, generation) the caller just read from the issue row and the
+# current label and user generations, so a write can never be served stale; explicit
+# invalidation only frees memory early.
+#
+# Local entries live in an in-process LRU keyed by issue id. When
+# ISSUE_DETAIL_CACHE_BACKEND names a CACHES alias, entries are also shared
+# through it under immutable keys that include the versions.
+class IssueDetailCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = None
+        self.shared_hits = 0
+        self.stale = 0
+
+    def get_local(self):
+        if self.local is None:
+            with self.lock:
+                if self.local is None:
+                    self.local = LRUCache(getattr(settings, 'ISSUE_DETAIL_CACHE_SIZE', 1000))
+        return self.local
+
+    def get_shared(self):
+        alias = getattr(settings, 'ISSUE_DETAIL_CACHE_BACKEND', None)
+        return caches[alias] if alias else None
+
+    def make_key(self, issue_id, version, generation, page_size):
+        return (int(issue_id), version, generation, get_generation(LABELS_GENERATION), get_generation(USERS_GENERATION), page_size)
+
+    def shared_key(self, key):
+        return 'issue-detail:' + ':'.join(str(part) for part in key)
+
+    def get(self, issue_id, version, generation, page_size):
+        key = self.make_key(issue_id, version, generation, page_size)
+        entry = self.get_local().get((key[0], page_size))
+        if entry is not None:
+            if entry[0] == key:
+                return entry[1]
+            self.stale += 1
+        shared = self.get_shared()
+        if shared is not None:
+            data = shared.get(self.shared_key(key))
+            if data is not None:
+                self.shared_hits += 1
+                self.get_local().set((key[0], page_size), (key, data))
+                return data
+        return None
+
+    def set(self, issue_id, version, generation, page_size, data):
+        key = self.make_key(issue_id, version, generation, page_size)
+        self.get_local().set((key[0], page_size), (key, data))
+        shared = self.get_shared()
+        if shared is not None:
+            shared.set(self.shared_key(key), data, getattr(settings, 'ISSUE_DETAIL_CACHE_TIMEOUT', 300))
+
+    def invalidate(self, *issue_ids):
+        local = self.get_local()
+        issue_ids = {int(issue_id) for issue_id in issue_ids}
+        with local.lock:
+            for key in [key for key in local.data if key[0] in issue_ids]:
+                del local.data[key]
+
+    def clear(self):
+        self.get_local().clear()
+
+    def stats(self):
+        stats = self.get_local().stats()
+        # a stale local entry is counted as a local hit by the LRU
+        stats['hits'] -= self.stale
+        stats['misses'] += self.stale
+        stats['stale'] = self.stale
+        stats['shared_hits'] = self.shared_hits
+        stats['shared_backend'] = getattr(settings, 'ISSUE_DETAIL_CACHE_BACKEND', None)
+        return stats
+
+
+issue_detail_cache = IssueDetailCache()
+
+
+# `fields` are set by the same UPDATE
+def bump_issue_generation(*issue_ids, **fields):
+    Issue.objects.filter(id__in=issue_ids).update(generation=F('generation') + 1, **fields)
+    issue_detail_cache.invalidate(*issue_ids)
+
+
+def invalidate_issue_list(**kwargs):
+    invalidate_generation(ISSUES_GENERATION)
+
+
+# pre_save of User. Saves that cannot change the username (e.g. last_login
+# updates) cost nothing, others one lookup of the stored name.
+def invalidate_renamed_user(sender, instance, using=None, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    stored = sender.objects.using(using).filter(pk=instance.pk).values_list('username', flat=True).first()
+    if stored is not None and stored != instance.username:
+        invalidate_generation(USERS_GENERATION)
+
+
+# post_delete of User, its issues lose their assignee without a generation bump
+def invalidate_users(**kwargs):
+    invalidate_generation(USERS_GENERATION)
+
+
+# ETag of an issue detail response, from the same parts as its cache key.
+def issue_detail_etag(request, issue_id, version, generation, page_size):
+    return make_etag('issue', *issue_detail_cache.make_key(issue_id, version, generation, page_size), request.build_absolute_uri())
+
+
+# ETag of an issue list page. Every write sets updated_at (soft deletes
+# included) and inserts raise the max id, so both maxima, read from indexes
+# over the whole table, move whenever a page can change. Writes are assumed
+# to come from hosts with synchronised clocks.
+def issue_list_etag(request):
+    watermark = Issue.objects.aggregate(updated_at=Max('updated_at'), last_id=Max('id'))
+    return make_etag(
+        'issues', watermark['updated_at'], watermark['last_id'], get_generation(ISSUES_GENERATION), request.build_absolute_uri(),
+    )
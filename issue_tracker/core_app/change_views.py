@@ -0,0 +1,40 @@
+from rest_framework import viewsets ,status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from user_app.authentication import CachedTokenAuthentication
+from .changes import changes_since, latest_change_id
+from .routers import replica_read
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 1000
+
+
+class ChangeViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication]
+
+    # Events after `since` in the order they were committed, with the cursor
+    # to pass as `since` next time. since=latest returns no events, only the
+    # cursor of the latest one, to start following from now.
+    @replica_read
+    def list(self, request):
+        since = request.query_params.get('since', '0')
+        if since == 'latest':
+            return Response({"results": [], "cursor": str(latest_change_id()), "has_more": False}, status=200)
+        try:
+            since = int(since)
+            limit = min(int(request.query_params.get('limit', CHANGES_PAGE_SIZE)), CHANGES_MAX_PAGE_SIZE)
+            if since < 0 or limit < 1:
+                raise ValueError(since)
+        except ValueError:
+            return Response(
+                {"error": "Please provide since as a cursor returned by this endpoint and limit as a positive number"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        events, has_more = changes_since(since, limit)
+        return Response({
+            "results": events,
+            "cursor": str(events[-1]['id'] if events else since),
+            "has_more": has_more,
+        }, status=200)
@@ -0,0 +1,103 @@
+import threading
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ChangeEvent, ChangeSequence
+
+
+# Collects the change events of a write and appends them to change_events in
+# two statements: one that takes ids from change_sequence and one INSERT.
+# The sequence row stays locked until the transaction ends, so a reader of
+# GET /changes never sees a later id before an earlier one has committed.
+# Call write() as the last step of the transaction to keep that lock short.
+# Once the events are committed, change_bus tells the event streams of this
+# process (see core_app.streams).
+class ChangeLog:
+    def __init__(self, actor=None):
+        self.actor_id = actor.id if actor is not None else None
+        self.events = []
+
+    def add(self, kind, issue_id=None, label_id=None, **data):
+        self.events.append((kind, issue_id, label_id, data))
+        return self
+
+    def write(self):
+        events, self.events = self.events, []
+        if not events:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            first_id = allocate_ids(len(events))
+            ChangeEvent.objects.bulk_create([
+                ChangeEvent(
+                    id=first_id + offset, kind=kind, issue_id=issue_id, label_id=label_id,
+                    actor_id=self.actor_id, data=data, created_at=now,
+                )
+                for offset, (kind, issue_id, label_id, data) in enumerate(events)
+            ])
+            transaction.on_commit(partial(change_bus.publish, first_id + len(events) - 1))
+
+
+# First of `count` new event ids.
+def allocate_ids(count):
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {table} SET {last} = {last} + %s WHERE {pk} = 1 RETURNING {last}'.format(
+        table=qn(ChangeSequence._meta.db_table), last=qn('last_id'), pk=qn('id'),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [count])
+        row = cursor.fetchone()
+    if row is None:
+        # the row is created by the migration, a flushed database lost it
+        ChangeSequence.objects.get_or_create(id=1, defaults={'last_id': latest_change_id()})
+        return allocate_ids(count)
+    return row[0] - count + 1
+
+
+# Events after the cursor `since` (an event id, 0 for the start), up to
+# `until` when given, oldest first, and whether more follow.
+def changes_since(since, limit, until=None):
+    events = ChangeEvent.objects.filter(id__gt=since)
+    if until is not None:
+        events = events.filter(id__lte=until)
+    events = list(
+        events.order_by('id')
+        .values('id', 'kind', 'issue_id', 'label_id', 'actor_id', 'data', 'created_at')[:limit + 1]
+    )
+    return events[:limit], len(events) > limit
+
+
+def latest_change_id():
+    return ChangeEvent.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+
+# Tells listeners the id of the last event of every commit that wrote some.
+# It is local only: with several workers, the event streams of one worker
+# still find the events written by the others in change_events, at their
+# next poll (STREAM_POLL_SECONDS). A shared implementation of publish() and
+# subscribe() (Redis pub/sub, PostgreSQL LISTEN/NOTIFY) would deliver those
+# immediately too.
+class LocalChangeBus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = set()
+
+    def subscribe(self, listener):
+        with self.lock:
+            self.listeners.add(listener)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            self.listeners.discard(listener)
+
+    def publish(self, last_id):
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(last_id)
+
+
+change_bus = LocalChangeBus()
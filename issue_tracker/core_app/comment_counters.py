@@ -0,0 +1,73 @@
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import ISSUES_GENERATION, issue_detail_cache
+from .helpers import invalidate_generation
+from .models import Comment, Issue
+
+# issues per UPDATE of rebuild_comment_counters
+REBUILD_BATCH_SIZE = 5000
+
+
+# Issue.comment_count and Issue.last_comment_at count the live comments of an
+# issue, so lists and details do not count comments per issue. Every write
+# path that adds, edits or deletes comments updates them in its transaction:
+# add_comment with record_comment, anything else (admin edits, deletes) with
+# refresh_comment_counters. rebuild_comment_counters backfills and repairs
+# them from the comments table.
+def record_comment(issue_id, created_at):
+    Issue.objects.filter(id=issue_id).update(
+        comment_count=F('comment_count') + 1,
+        last_comment_at=Greatest(Coalesce('last_comment_at', Value(created_at)), Value(created_at)),
+        generation=F('generation') + 1,
+    )
+    counters_changed(issue_id)
+
+
+def live_comment_counters():
+    live = Comment.objects.filter(issue=OuterRef('pk'), is_deleted=False).order_by().values('issue')
+    return {
+        'comment_count': Coalesce(Subquery(live.annotate(count=Count('id')).values('count')), 0),
+        'last_comment_at': Subquery(live.annotate(last=Max('created_at')).values('last')),
+    }
+
+
+def refresh_comment_counters(*issue_ids):
+    Issue.objects.filter(id__in=issue_ids).update(**live_comment_counters(), generation=F('generation') + 1)
+    counters_changed(*issue_ids)
+
+
+# the list ETag watermark (issue_list_etag) does not move with the counters
+def counters_changed(*issue_ids):
+    issue_detail_cache.invalidate(*issue_ids)
+    invalidate_generation(ISSUES_GENERATION)
+
+
+# Recounts every issue in id ranges of `batch_size`, one short UPDATE each.
+# Returns the number of issues whose counters were wrong.
+def rebuild_comment_counters(batch_size=REBUILD_BATCH_SIZE):
+    repaired = 0
+    last_id = Issue.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    for start in range(0, last_id, batch_size):
+        stale = find_comment_counter_drift(start, start + batch_size)
+        if stale:
+            Issue.objects.filter(id__in=stale).update(**live_comment_counters(), generation=F('generation') + 1)
+            issue_detail_cache.invalidate(*stale)
+            repaired += len(stale)
+    if repaired:
+        invalidate_generation(ISSUES_GENERATION)
+    return repaired
+
+
+# Ids of the issues in (start, end] (all when not given) whose counters do
+# not match their live comments.
+def find_comment_counter_drift(start=None, end=None):
+    issues = Issue.objects.all()
+    if start is not None:
+        issues = issues.filter(id__gt=start, id__lte=end)
+    counters = live_comment_counters()
+    issues = issues.annotate(live_count=counters['comment_count'], live_last=counters['last_comment_at'])
+    drift = ~Q(comment_count=F('live_count')) | Q(last_comment_at__isnull=True, live_last__isnull=False) | (
+        Q(last_comment_at__isnull=False) & (Q(live_last__isnull=True) | ~Q(last_comment_at=F('live_last')))
+    )
+    return list(issues.filter(drift).order_by('id').values_list('id', flat=True))
@@ -0,0 +1,116 @@
+import csv
+import json
+import tempfile
+from itertools import islice
+
+from openpyxl import Workbook
+
+from .models import Issue
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FILE_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+# title, description, status, labels and assignee are the import columns, so
+# an export can be imported again
+EXPORT_COLUMNS = ['id', 'title', 'description', 'status', 'labels', 'assignee', 'created_at', 'updated_at', 'resolved_at', 'version']
+XLSX_MAX_ROWS = 1048575
+XLSX_READ_SIZE = 64 * 1024
+
+
+# Yields one dict per issue of `queryset`. Issues are read through a
+# server-side cursor (QuerySet.iterator) EXPORT_CHUNK_SIZE rows at a time,
+# and the label names of each chunk are fetched with one extra query.
+def iter_export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    rows = queryset.order_by('-id').values_list(
+        'id', 'title', 'description', 'status', 'assignee__username',
+        'created_at', 'updated_at', 'resolved_at', 'version',
+    ).iterator(chunk_size=chunk_size)
+    IssueLabel = Issue.labels.through
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        labels = {}
+        ids = {row[0] for row in chunk}
+        low, high = chunk[-1][0], chunk[0][0]
+        # a dense chunk reads its id range (cheaper than binding thousands of
+        # ids) and drops issues that are not exported
+        if high - low < 2 * len(chunk):
+            label_qs = IssueLabel.objects.filter(issue_id__gte=low, issue_id__lte=high)
+        else:
+            label_qs = IssueLabel.objects.filter(issue_id__in=ids)
+        for issue_id, name in label_qs.order_by('label_id').values_list('issue_id', 'label__name'):
+            if issue_id in ids:
+                labels.setdefault(issue_id, []).append(name)
+        for issue_id, title, description, issue_status, assignee, created_at, updated_at, resolved_at, version in chunk:
+            yield {
+                'id': issue_id,
+                'title': title,
+                'description': description,
+                'status': issue_status,
+                'labels': ','.join(labels.get(issue_id, [])),
+                'assignee': assignee,
+                'created_at': created_at.isoformat(),
+                'updated_at': updated_at.isoformat(),
+                'resolved_at': resolved_at.isoformat() if resolved_at else None,
+                'version': version,
+            }
+
+
+# csv.writer only needs an object with write(), this one hands the line back.
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield ''.join(
+            writer.writerow(['' if row[column] is None else row[column] for column in EXPORT_COLUMNS])
+            for row in chunk
+        )
+
+
+def stream_ndjson(rows):
+    encoder = json.JSONEncoder()
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+
+
+# xlsx is a zip archive that can only be written once complete, the rows go
+# through a write-only workbook (flushed to a temporary file, not kept in
+# memory) and the finished file is streamed.
+def stream_xlsx(rows):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('issues')
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        sheet.append([row[column] for column in EXPORT_COLUMNS])
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            data = output.read(XLSX_READ_SIZE)
+            if not data:
+                break
+            yield data
+
+
+def stream_export(queryset, file_type):
+    rows = iter_export_rows(queryset)
+    if file_type == 'csv':
+        return stream_csv(rows)
+    if file_type == 'ndjson':
+        return stream_ndjson(rows)
+    return stream_xlsx(rows)
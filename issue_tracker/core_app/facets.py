@@ -0,0 +1,112 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .helpers import ISSUE_RANGE_FILTERS, parse_timestamp
+from .models import Issue
+
+FACETS = ['status', 'label', 'assignee']
+# label and assignee facets list the values with the most issues
+FACET_LIMIT = 20
+
+
+# Counts of the issues matching the list filters (`queryset`), grouped by
+# status, label and assignee, one aggregate query per facet.
+def status_facet(queryset):
+    counts = dict.fromkeys((choice for choice, _ in Issue.STATUS_CHOICES), 0)
+    for row in queryset.order_by().values('status').annotate(count=Count('id')):
+        counts[row['status']] = row['count']
+    return counts
+
+
+# joined from the filtered issues rather than filtering issues_labels with a
+# subquery, the search condition refers to the issues table by name
+def label_facet(queryset):
+    rows = (
+        queryset.order_by().filter(labels__is_deleted=False)
+        .values('labels__id', 'labels__name')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'labels__id')[:FACET_LIMIT]
+    )
+    return [{'id': row['labels__id'], 'name': row['labels__name'], 'count': row['count']} for row in rows]
+
+
+# unassigned issues are counted under id None
+def assignee_facet(queryset):
+    rows = (
+        queryset.order_by().values('assignee_id', 'assignee__username')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'assignee_id')[:FACET_LIMIT]
+    )
+    return [{'id': row['assignee_id'], 'username': row['assignee__username'], 'count': row['count']} for row in rows]
+
+
+FACET_COUNTS = {'status': status_facet, 'label': label_facet, 'assignee': assignee_facet}
+
+
+# Facet names of a `facets=status,label` parameter, raises ValueError for
+# unknown ones.
+def parse_facets(value):
+    names = sorted(set(filter(None, value.split(','))))
+    unknown = set(names) - set(FACETS)
+    if unknown:
+        raise ValueError(f"unknown facet {', '.join(sorted(unknown))}, use {', '.join(FACETS)}")
+    return names
+
+
+# Cache key of the facets of a filter, from the normalized filter values so
+# the same filter written differently (value order, date formats) shares
+# one entry. Paging and sorting parameters do not change the counts.
+def facets_cache_key(filters, names):
+    normalized = {'facets': names}
+    if filters.get('id'):
+        normalized['id'] = int(filters['id'])
+    if filters.get('keyword'):
+        normalized['keyword'] = ' '.join(filters['keyword'].lower().split())
+    if filters.get('status'):
+        normalized['status'] = sorted(set(filters['status'].split(',')))
+    if filters.get('assignee'):
+        normalized['assignee'] = filters['assignee'] if filters['assignee'] == 'none' else int(filters['assignee'])
+    if filters.get('label'):
+        normalized['label'] = sorted({int(label_id) for label_id in filters['label'].split(',')})
+    for param in ISSUE_RANGE_FILTERS:
+        if filters.get(param):
+            normalized[param] = parse_timestamp(filters[param]).isoformat()
+    return 'issue-facets:' + hashlib.md5(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+# The cached facets requested with `facets=` for the list filters in
+# `params`: None when none were requested, {} when they are not cached, else
+# the entry of issue_facets. Only reads the cache, so a conditional request
+# can be answered before counting. Raises ValueError for invalid facet names.
+def cached_facets(params):
+    if not params.get('facets'):
+        return None
+    names = parse_facets(params['facets'])
+    if not getattr(settings, 'FACETS_CACHE_SECONDS', 10):
+        return {}
+    return cache.get(facets_cache_key(params, names)) or {}
+
+
+# Facets of `queryset`, the issues matching the list filters in `params`, as
+# {'stamp': ..., 'counts': {...}}: the `cached` entry of cached_facets, or
+# counted and cached in the default cache for FACETS_CACHE_SECONDS, so counts
+# can lag behind writes by that long. The stamp changes each time they are
+# counted and goes into the list ETag, it is None when caching is disabled
+# and the counts always match the list.
+def issue_facets(params, queryset, cached):
+    if cached:
+        return cached
+    names = parse_facets(params['facets'])
+    timeout = getattr(settings, 'FACETS_CACHE_SECONDS', 10)
+    facets = {
+        'stamp': time.time_ns() if timeout else None,
+        'counts': {name: FACET_COUNTS[name](queryset) for name in names},
+    }
+    if timeout:
+        cache.set(facets_cache_key(params, names), facets, timeout)
+    return facets
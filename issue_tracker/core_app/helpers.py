@@ -1,7 +1,307 @@
-from rest_framework.pagination import CursorPagination
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction
+from django.db.models import BooleanField, F, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.utils.urls import replace_query_param
 
 class CustomCursorPagination(CursorPagination):
     page_size = 30
     page_size_query_param = "limit"
     max_page_size = 100
-    ordering = ['-id']
\ No newline at end of file
+    ordering = ['-id']
+
+class SearchCursorPagination(CustomCursorPagination):
+    # `rank` is annotated by search.search_issues, ties share a position and
+    # are paged with the cursor offset
+    ordering = ['-rank', '-id']
+
+
+# Keyset pagination on `sort_field` with the id as tie-breaker. The cursor
+# holds the sort value and id of the row it starts after, and the page is
+# read with the row comparison (sort_field, id) < (value, id), which an index
+# on (sort_field, id) answers by seeking, however deep the page. Positions of
+# the default '-id' ordering match the ones of CustomCursorPagination.
+# A nullable sort field sorts NULLs as its lowest value, last when
+# descending and first when ascending, on every database. Its NULL rows are
+# read with a query of their own, by id, on the page where they start.
+class KeysetCursorPagination(CustomCursorPagination):
+    def __init__(self, sort_field='-id'):
+        tie_breaker = '-id' if sort_field.startswith('-') else 'id'
+        self.ordering = [sort_field] if sort_field == tie_breaker else [sort_field, tie_breaker]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = self.ordering
+        if reverse:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+        queryset = queryset.order_by(*[self.order_by(queryset.model, name) for name in ordering])
+        conditions = [None] if self.cursor is None else self.after(queryset, ordering, self.cursor.position)
+
+        results = []
+        for condition in conditions:
+            rows = queryset if condition is None else queryset.filter(condition)
+            results += rows[:self.page_size + 1 - len(results)]
+            if len(results) > self.page_size:
+                break
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def order_by(self, model, name):
+        field_name = name.lstrip('-')
+        if not model._meta.get_field(field_name).null:
+            return name
+        return F(field_name).desc(nulls_last=True) if name.startswith('-') else F(field_name).asc(nulls_first=True)
+
+    # Conditions selecting the rows after `position`, in order, the page goes
+    # on with the next one while it is short: (column, ...) < (value, ...), or
+    # > for an ascending ordering. That comparison never matches the NULLs of
+    # a nullable sort field, they get a condition of their own, after the
+    # comparison when descending and before it when ascending. An OR of both
+    # would be a filter over the index rather than a seek.
+    def after(self, queryset, ordering, position):
+        model = queryset.model
+        values = position.split('|') if position else []
+        if len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        db = connections[queryset.db]
+        qn = db.ops.quote_name
+        columns, params = [], []
+        fields = [model._meta.get_field(name.lstrip('-')) for name in ordering]
+        for field, value in zip(fields, values):
+            try:
+                value = None if value == '' and field.null else field.to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            columns.append(f'{qn(model._meta.db_table)}.{qn(field.column)}')
+            params.append(field.get_db_prep_value(value, db))
+        operator = '<' if ordering[0].startswith('-') else '>'
+        if fields[0].null and params[0] is None:
+            nulls = RawSQL(f'({columns[0]} IS NULL AND {columns[1]} {operator} %s)', params[1:], output_field=BooleanField())
+            return [nulls] if operator == '<' else [nulls, Q(**{f'{fields[0].name}__isnull': False})]
+        values = RawSQL(
+            '({}) {} ({})'.format(', '.join(columns), operator, ', '.join(['%s'] * len(params))),
+            params, output_field=BooleanField(),
+        )
+        if fields[0].null and operator == '<':
+            return [values, Q(**{f'{fields[0].name}__isnull': True})]
+        return [values]
+
+    def position(self, row):
+        values = []
+        for name in self.ordering:
+            name = name.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            if value is None:
+                values.append('')
+            else:
+                values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return '|'.join(values)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.position(self.page[-1]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.position(self.page[0]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+
+class CommentCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = "limit"
+    max_page_size = 100
+    ordering = ['-id']
+
+    # cursor for the page after `last_id`, used to link the comments embedded
+    # in issue retrieve to GET /issues/<pk>/comments; a `limit` other than the
+    # default is kept so the next pages are the same size
+    def next_link_after(self, base_url, last_id, page_size=None):
+        if page_size and page_size != self.page_size:
+            base_url = replace_query_param(base_url, self.page_size_query_param, page_size)
+        self.base_url = base_url
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=str(last_id)))
+
+
+# Thread-safe in-process LRU map with hit/miss/eviction counters.
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            return self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+PROCESS_LOCAL_CACHES = {'LocMemCache', 'DummyCache'}
+
+
+# Named counters in the default cache backend. Caches derived from data that
+# can change in another process include the generation in their keys and bump
+# it on writes; with a shared CACHES backend this invalidates every process.
+# A counter starts from the clock rather than 1, so a flushed cache does not
+# bring back a value a process already holds caches for.
+def get_generation(name):
+    return cache.get_or_set(f'generation:{name}', time.time_ns, None)
+
+
+def bump_generation(name):
+    try:
+        return cache.incr(f'generation:{name}')
+    except ValueError:
+        generation = time.time_ns()
+        cache.set(f'generation:{name}', generation, None)
+        return generation
+
+
+# Deploy check (manage.py check --deploy): with a per-process default cache a
+# bump only reaches the process that made it.
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1]
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Warning(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint=(
+            "Other processes keep revoked tokens until their entries expire, see label changes only after "
+            "LABEL_REGISTRY_MAX_AGE and do not see user renames. Set CACHE_BACKEND and CACHE_LOCATION to a "
+            "shared cache such as Redis."
+        ),
+        id='core_app.W001',
+    )]
+
+
+# Bumped right away so this transaction sees its own writes, and again on
+# commit so a process that reloaded in between does not keep the old rows.
+def invalidate_generation(name):
+    bump_generation(name)
+    transaction.on_commit(lambda: bump_generation(name))
+
+
+# Applies per-row changes ({pk: {field: value}}) to `queryset` with one
+# UPDATE per `batch_size` rows, each changed field set through
+# CASE pk WHEN ... THEN ... ELSE field END. `common` is applied to every row.
+# The CASE is raw SQL, resolving one When() per row costs far more than the
+# UPDATE itself.
+def case_update(queryset, changes, batch_size=500, **common):
+    model = queryset.model
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk_column = f'{table}.{qn(model._meta.pk.column)}'
+    pks = list(changes)
+    updated = 0
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        fields = sorted({field for pk in batch for field in changes[pk]})
+        updates = {}
+        for field_name in fields:
+            field = model._meta.get_field(field_name)
+            rows = [pk for pk in batch if field_name in changes[pk]]
+            params = []
+            for pk in rows:
+                params.append(pk)
+                params.append(field.get_db_prep_save(changes[pk][field_name], connection))
+            sql = 'CASE {} {} ELSE {}.{} END'.format(
+                pk_column, ' '.join(['WHEN %s THEN %s'] * len(rows)), table, qn(field.column),
+            )
+            updates[field.attname] = RawSQL(sql, params, output_field=field)
+        updated += queryset.filter(pk__in=batch).update(**updates, **common)
+    return updated
+
+
+# query parameter -> lookup of the issue list date filters, values are ISO
+# dates or datetimes (UTC unless they carry an offset), ranges include their
+# start and exclude their end
+ISSUE_RANGE_FILTERS = {
+    'created_after': 'created_at__gte',
+    'created_before': 'created_at__lt',
+    'updated_after': 'updated_at__gte',
+    'updated_before': 'updated_at__lt',
+}
+
+
+def parse_timestamp(value):
+    parsed = datetime.fromisoformat(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+# Strong ETag over the parts that determine a response.
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+# If-None-Match uses the weak comparison (RFC 9110 13.1.2).
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
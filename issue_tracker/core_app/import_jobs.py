@@ -0,0 +1,157 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .importer import ImportFileError, IssueImporter, iter_file_rows
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+MAX_STORED_ERRORS = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class LostLease(Exception):
+    pass
+
+
+def lease_timeout():
+    return timedelta(seconds=getattr(settings, 'IMPORT_JOB_LEASE_SECONDS', 120))
+
+
+# One pool per process, created on first use. Creating it also picks up jobs
+# left queued or running by a worker that died.
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_JOB_WORKERS', 2),
+                thread_name_prefix='issue-import',
+            )
+            _executor.submit(resume_stalled_jobs)
+    return _executor
+
+
+def submit_import_job(job_id):
+    transaction.on_commit(lambda: get_executor().submit(run_import_job, job_id))
+
+
+def recoverable_jobs():
+    stale_before = timezone.now() - lease_timeout()
+    return ImportJob.objects.filter(
+        Q(status='queued') | Q(status='running', heartbeat_at__lt=stale_before)
+    )
+
+
+def is_stalled(job):
+    stale_before = timezone.now() - lease_timeout()
+    if job.status == 'running':
+        return job.heartbeat_at is None or job.heartbeat_at < stale_before
+    # queued by a process whose pool never ran it
+    return job.status == 'queued' and job.created_at < stale_before
+
+
+# Hands a stalled job to this process's pool. The lease decides which worker
+# runs it, so a job that is resumed twice still runs once.
+def resume_job(job_id):
+    get_executor().submit(run_import_job, job_id)
+
+
+def resume_stalled_jobs():
+    try:
+        for job_id in recoverable_jobs().values_list('id', flat=True):
+            get_executor().submit(run_import_job, job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    token = uuid.uuid4().hex
+    claimed = recoverable_jobs().filter(id=job_id).update(
+        status='running',
+        worker_token=token,
+        heartbeat_at=timezone.now(),
+    )
+    return token if claimed else None
+
+
+def run_import_job(job_id):
+    try:
+        token = claim_job(job_id)
+        if token is None:
+            return
+        job = ImportJob.objects.select_related('created_by').get(id=job_id)
+        try:
+            process_job(job, token)
+        except LostLease:
+            logger.warning("Import job %s was taken over by another worker", job_id)
+        except ImportFileError as e:
+            finish_job(job, token, 'failed', str(e))
+        except Exception as e:
+            logger.exception("Import job %s failed", job_id)
+            finish_job(job, token, 'failed', f"Error while importing issues: {str(e)}")
+    finally:
+        connection.close()
+
+
+def process_job(job, token):
+    importer = IssueImporter(job.created_by, all_or_nothing=False)
+    with job.file.open('rb') as job_file:
+        rows = iter_file_rows(job_file, job.file_type)
+        # skip what earlier runs already committed
+        for _ in range(job.rows_processed):
+            next(rows, None)
+        importer.rows_seen = job.rows_processed
+
+        saw_rows = job.rows_processed > 0
+        for start_index, batch in importer.iter_batches(rows):
+            saw_rows = True
+            with transaction.atomic():
+                created = importer.import_batch(start_index, batch)
+                record_batch(job, token, len(batch), len(created), importer.error_details)
+            importer.error_details = []
+
+    if not saw_rows:
+        raise ImportFileError("Please provide data in the file")
+    finish_job(job, token, 'completed', f"Successfully imported {job.imported_count} issues and error while importing {job.error_count} issues")
+
+
+# Progress is written in the same transaction as the batch it describes.
+def record_batch(job, token, row_count, imported, errors):
+    job.rows_processed += row_count
+    job.imported_count += imported
+    job.error_count += len(errors)
+    room = MAX_STORED_ERRORS - len(job.error_details)
+    if room > 0:
+        job.error_details = job.error_details + errors[:room]
+    updated = ImportJob.objects.filter(id=job.id, worker_token=token, status='running').update(
+        rows_processed=job.rows_processed,
+        imported_count=job.imported_count,
+        error_count=job.error_count,
+        error_details=job.error_details,
+        heartbeat_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        raise LostLease()
+
+
+def finish_job(job, token, final_status, message):
+    updated = ImportJob.objects.filter(id=job.id, worker_token=token).update(
+        status=final_status,
+        message=message,
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    if updated:
+        job.file.delete(save=False)
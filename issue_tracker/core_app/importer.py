@@ -0,0 +1,264 @@
+import codecs
+import csv
+from itertools import islice
+
+from django.db import connection
+from django.db.models.functions import Lower
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .changes import ChangeLog
+from .label_registry import label_registry
+from .models import Issue, User
+from .rollups import AssigneeRollup
+
+IMPORT_BATCH_SIZE = 2000
+REQUIRED_COLUMNS = ['title', 'description', 'status', 'labels']
+FILE_TYPES = ['csv', 'xlsx']
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def clean_cell(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+# Streams the upload as dicts keyed by header, without loading it in memory:
+# csv is decoded line by line, xlsx is read with openpyxl read-only mode.
+def iter_file_rows(uploaded_file, file_type):
+    workbook = None
+    if file_type == 'csv':
+        reader = csv.reader(codecs.iterdecode(uploaded_file, 'utf-8-sig'))
+    else:
+        workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+        reader = workbook.active.iter_rows(values_only=True)
+    try:
+        header = next(reader, None) or []
+        columns = [clean_cell(column) or '' for column in header]
+        if not all(col in columns for col in REQUIRED_COLUMNS):
+            raise ImportFileError(f"Please provide all required columns {REQUIRED_COLUMNS}")
+        for values in reader:
+            values = [clean_cell(value) for value in values]
+            if not any(values):
+                continue
+            yield dict(zip(columns, values))
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+
+class IssueImporter:
+    # With all_or_nothing=False (background jobs) each batch writes its valid
+    # rows and bad rows are only reported.
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE, all_or_nothing=True):
+        self.user = user
+        self.batch_size = batch_size
+        self.all_or_nothing = all_or_nothing
+        self.status_choices = [choice[0] for choice in Issue.STATUS_CHOICES]
+        # names missing from the registry are looked up once per import
+        self.label_map = dict(label_registry.name_map())
+        self.error_details = []
+        self.rows_seen = 0
+        self.imported = 0
+        # events of the batch being written, written with the batch so an
+        # import holds one batch of them at a time
+        self.changes = ChangeLog(user)
+
+    # Imports `rows` in batches of `batch_size`. Once a row fails validation
+    # nothing more is written, the remaining rows are only validated so every
+    # error is reported; the caller is expected to roll back.
+    def run(self, rows):
+        for start_index, batch in self.iter_batches(rows):
+            self.import_batch(start_index, batch)
+        return self
+
+    def iter_batches(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            start_index = self.rows_seen
+            self.rows_seen += len(batch)
+            yield start_index, batch
+
+    def import_batch(self, start_index, batch):
+        assignee_map = self.load_assignees(batch)
+        objects_to_create = []
+        for offset, row in enumerate(batch):
+            item = self.clean_row(start_index + offset, row, assignee_map)
+            if item is not None:
+                objects_to_create.append(item)
+        if (self.all_or_nothing and self.error_details) or not objects_to_create:
+            return []
+        return self.write_batch(objects_to_create)
+
+    def load_assignees(self, batch):
+        names = {row['assignee'].lower() for row in batch if row.get('assignee')}
+        if not names:
+            return {}
+        user_qs = User.objects.filter(is_active=True).annotate(lower_username=Lower('username')).filter(
+            lower_username__in=names
+        ).values_list('lower_username', 'id')
+        return dict(user_qs)
+
+    def clean_row(self, index, row, assignee_map):
+        title = row.get('title')
+        if not title:
+            self.error_details.append({"error": f"Please provide title for row {index}"})
+            return None
+
+        description = row.get('description')
+        if not description:
+            self.error_details.append({"error": f"Please provide description for row {index}"})
+            return None
+
+        new_status = row.get('status')
+        if not new_status or new_status not in self.status_choices:
+            self.error_details.append({"error": f"Please provide valid status for row {index}"})
+            return None
+
+        labels = row.get('labels')
+        if not labels:
+            if self.all_or_nothing:
+                raise ImportFileError(f"Please provide labels for row {index}")
+            self.error_details.append({"error": f"Please provide labels for row {index}"})
+            return None
+        label_ids = []
+        label_error = False
+        for label_name in labels.split(','):
+            label_name = label_name.strip().lower()
+            if label_name not in self.label_map:
+                self.label_map[label_name] = label_registry.id_for_name(label_name)
+            if self.label_map[label_name] is None:
+                self.error_details.append({"error": f"Please provide valid label name {label_name} for row {index}"})
+                label_error = True
+                continue
+            label_ids.append(self.label_map[label_name])
+        if label_error and not self.all_or_nothing:
+            return None
+
+        assignee = row.get('assignee')
+        if not assignee:
+            assignee_id = None
+        else:
+            assignee = assignee.lower()
+            if assignee not in assignee_map:
+                self.error_details.append({"error": f"Please provide valid assignee name {assignee} for row {index}"})
+                return None
+            assignee_id = assignee_map[assignee]
+
+        issue_values = {
+            'title': title,
+            'description': description,
+            'status': new_status,
+            'assignee_id': assignee_id,
+            'created_by_id': self.user.id,
+            'updated_by_id': self.user.id,
+        }
+        return issue_values, list(dict.fromkeys(label_ids))
+
+    # Takes the change_events sequence lock until the caller's transaction
+    # commits: per batch for background jobs, at the end of a synchronous
+    # import.
+    def write_batch(self, objects_to_create):
+        issue_ids = create_issues(objects_to_create, self.changes)
+        self.changes.write()
+        self.imported += len(issue_ids)
+        return issue_ids
+
+
+# Creates issues from (issue values, label ids) pairs with one INSERT for the
+# issues and one for all of their label links, updates the assignee rollup
+# and adds an issue.created event per issue to `changes`. Returns the new ids
+# in order.
+def create_issues(objects_to_create, changes):
+    issue_ids = insert_issues([item[0] for item in objects_to_create])
+    insert_issue_labels([
+        (issue_id, label_id)
+        for issue_id, (_, label_ids) in zip(issue_ids, objects_to_create)
+        for label_id in label_ids
+    ])
+    rollup = AssigneeRollup()
+    for issue_id, (issue_values, label_ids) in zip(issue_ids, objects_to_create):
+        rollup.add(issue_values.get('assignee_id'), issue_values.get('status', 'open'))
+        changes.add(
+            'issue.created', issue_id, title=issue_values['title'], status=issue_values.get('status', 'open'),
+            assignee_id=issue_values.get('assignee_id'), labels=label_ids, version=1,
+        )
+    rollup.apply()
+    return issue_ids
+
+
+# bulk_create without a model instance per row: fields missing from a row get
+# their model default (prepared once per call) and auto_now(_add) fields get
+# the current time. Returns the new ids in row order.
+def insert_rows(model, rows):
+    if not connection.features.can_return_rows_from_bulk_insert:
+        created = model.objects.bulk_create([model(**row) for row in rows])
+        return [obj.pk for obj in created]
+
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    now = timezone.now()
+    defaults = {}
+    for field in fields:
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            default = now
+        else:
+            default = field.get_default()
+        defaults[field.attname] = field.get_db_prep_save(default, connection)
+
+    # other values go to the driver as they are, dates need the backend's format
+    prepared = {field.attname for field in fields if field.get_internal_type() in ('DateField', 'DateTimeField')}
+
+    ops = connection.ops
+    table = ops.quote_name(model._meta.db_table)
+    columns = ', '.join(ops.quote_name(field.column) for field in fields)
+    pk_column = ops.quote_name(model._meta.pk.column)
+    batch_size = ops.bulk_batch_size(fields, rows)
+    placeholders = ['%s'] * len(fields)
+    ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            values = ops.bulk_insert_sql(fields, [placeholders] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) {values} RETURNING {pk_column}",
+                [
+                    field.get_db_prep_save(row[field.attname], connection) if field.attname in prepared and field.attname in row
+                    else row.get(field.attname, defaults[field.attname])
+                    for row in chunk for field in fields
+                ],
+            )
+            ids.extend(row[0] for row in cursor.fetchall())
+    return ids
+
+
+def insert_issues(rows):
+    return insert_rows(Issue, rows)
+
+
+# Writes (issue_id, label_id) pairs straight into the Issue.labels through
+# table as multi-row INSERTs, skipping a model instance per link.
+def insert_issue_labels(pairs):
+    if not pairs:
+        return
+    IssueLabel = Issue.labels.through
+    fields = [IssueLabel._meta.get_field('issue'), IssueLabel._meta.get_field('label')]
+    ops = connection.ops
+    batch_size = ops.bulk_batch_size(fields, pairs)
+    table = ops.quote_name(IssueLabel._meta.db_table)
+    columns = ', '.join(ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), batch_size):
+            chunk = pairs[start:start + batch_size]
+            values = ops.bulk_insert_sql(fields, [['%s', '%s']] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) {values}",
+                [value for pair in chunk for value in pair],
+            )
@@ -1,33 +1,221 @@
 from rest_framework import viewsets ,status
-from .models import Issue, Comment, Label ,User
+from .models import Issue, Comment, Label ,User, ImportJob, AssigneeStats
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.response import Response
 
-from .helpers import CustomCursorPagination
+from user_app.authentication import CachedTokenAuthentication, token_cache_stats
+from .helpers import ISSUE_RANGE_FILTERS, CommentCursorPagination, CustomCursorPagination, KeysetCursorPagination, SearchCursorPagination, case_update, etag_matches, make_etag, not_modified, parse_timestamp
+from .search import search_issues
+from .facets import cached_facets, issue_facets
+from .changes import ChangeLog
+from .comment_counters import record_comment
+from .exporter import EXPORT_FILE_TYPES, XLSX_MAX_ROWS, stream_export
+from .importer import FILE_TYPES, ImportFileError, IssueImporter, create_issues, insert_issue_labels, iter_file_rows
+from .import_jobs import is_stalled, resume_job, submit_import_job
+from .archival import last_archive_run
+from .rollups import AssigneeRollup
+from .cache import bump_issue_generation, issue_detail_cache, issue_detail_etag, issue_list_etag
+from .label_registry import label_registry
+from .latency import LatencyChanges, latency_summary, to_minutes
+from .middleware import route_metrics
+from .routers import replica_monitor, replica_read
+from datetime import date
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django.db import transaction
-from django.db.models import Count, F
-import pandas as pd
+from django.db.models import Case, F, Value, When, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
+BULK_MAX_ITEMS = 1000
+BATCH_MAX_IDS = 200
+BULK_ISSUE_FIELDS = {'title', 'description', 'status', 'assignee_id', 'labels'}
+BULK_PATCH_FIELDS = BULK_ISSUE_FIELDS | {'id', 'version'}
+
+
+ISSUE_SORTS = [
+    '-id', 'id', '-updated_at', 'updated_at', '-created_at', 'created_at',
+    '-comment_count', 'comment_count', '-last_comment_at', 'last_comment_at',
+]
+# Filters shared by the issue list and the export. status and label take
+# comma separated values, assignee an id or `none` for unassigned issues.
+# Raises ValueError for invalid values.
+def filter_issues(params):
+    id=params.get('id')
+    keyword=params.get('keyword')
+    status_filter=params.get('status')
+    assignee_id=params.get('assignee')
+    label_ids=params.get('label')
+    queryset = Issue.objects.filter(is_deleted=False)
+    if id:
+        queryset = queryset.filter(id=int(id))
+    if status_filter:
+        statuses = status_filter.split(',')
+        unknown = set(statuses) - {choice for choice, _ in Issue.STATUS_CHOICES}
+        if unknown:
+            raise ValueError(f"unknown status {', '.join(sorted(unknown))}")
+        queryset = queryset.filter(status__in=statuses)
+    if assignee_id == 'none':
+        queryset = queryset.filter(assignee__isnull=True)
+    elif assignee_id:
+        queryset = queryset.filter(assignee_id=int(assignee_id))
+    if label_ids:
+        # a semi-join, an issue with several of the labels is listed once
+        queryset = queryset.filter(id__in=Issue.labels.through.objects.filter(
+            label_id__in=[int(label_id) for label_id in label_ids.split(',')]
+        ).values('issue_id'))
+    for param, lookup in ISSUE_RANGE_FILTERS.items():
+        if params.get(param):
+            queryset = queryset.filter(**{lookup: parse_timestamp(params[param])})
+    if keyword:
+        queryset = search_issues(queryset, keyword)
+    return queryset
+
+
+# Rows and paginator of the issue list. Search results are ordered by rank
+# unless a `sort` is given. Raises ValueError for invalid parameters.
+def issue_list_query(params):
+    keyword=params.get('keyword')
+    sort=params.get('sort')
+    if sort and sort not in ISSUE_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(ISSUE_SORTS)}")
+    queryset = filter_issues(params)
+    fields = ['id', 'title','description','assignee__username', 'comment_count', 'last_comment_at']
+    paginator = KeysetCursorPagination(sort or '-id')
+    if keyword:
+        fields.append('rank')
+        if not sort:
+            paginator = SearchCursorPagination()
+    if sort and sort.lstrip('-') not in fields:
+        fields.append(sort.lstrip('-'))
+    return queryset.values(*fields), paginator
+
+
+def comment_queryset(issue_id):
+    return Comment.objects.filter(issue_id=issue_id, is_deleted=False).order_by('-id').values(
+        'id','comment','created_at','updated_at','author__username'
+    )
+
+
+def detail_issue_queryset():
+    return Issue.objects.select_related('assignee').filter(is_deleted=False)
+
+
+# The issue detail payload is read with three independent queries (issue,
+# labels, first comment page), the async retrieve runs them concurrently.
+def detail_issue(pk):
+    return detail_issue_queryset().filter(id=pk).first()
+
+
+def detail_labels(issue_id):
+    return list(Label.objects.filter(issues=issue_id).values('id','name').order_by('-id'))
+
+
+# only the first page of comments (and one more row to know if there is a
+# next page), the rest via GET /issues/<pk>/comments
+def detail_comments(issue_id, page_size):
+    return list(comment_queryset(issue_id)[:page_size + 1])
+
+
+# Ids of an `ids=3,1,2` parameter in request order without repeats. Raises
+# ValueError when there are none, too many or invalid ones.
+def parse_batch_ids(value):
+    issue_ids = list(dict.fromkeys(int(issue_id) for issue_id in value.split(',') if issue_id.strip()))
+    if not issue_ids:
+        raise ValueError('no ids given')
+    if len(issue_ids) > BATCH_MAX_IDS:
+        raise ValueError(f'{len(issue_ids)} ids given')
+    return issue_ids
+
+
+# The three detail queries for many issues at once: issues by id, labels by
+# issue id and the first page of comments by issue id.
+def batch_issues(issue_ids):
+    return {issue.id: issue for issue in detail_issue_queryset().filter(id__in=issue_ids)}
+
+
+def batch_labels(issue_ids):
+    labels = {issue_id: [] for issue_id in issue_ids}
+    for row in Label.objects.filter(issues__in=issue_ids).values('issues', 'id', 'name').order_by('-id'):
+        labels[row.pop('issues')].append(row)
+    return labels
+
+
+# comments are numbered per issue, newest first, with ROW_NUMBER() so the
+# database returns only the page_size + 1 newest of each issue
+def batch_comments(issue_ids, page_size):
+    comments = {issue_id: [] for issue_id in issue_ids}
+    rows = (
+        Comment.objects.filter(issue_id__in=issue_ids, is_deleted=False)
+        .annotate(position=Window(RowNumber(), partition_by=F('issue_id'), order_by=F('id').desc()))
+        .filter(position__lte=page_size + 1)
+        .order_by('issue_id', '-id')
+        .values('issue_id', 'id', 'comment', 'created_at', 'updated_at', 'author__username')
+    )
+    for row in rows:
+        comments[row.pop('issue_id')].append(row)
+    return comments
+
+
+def build_issue_detail(issue, labels, comments, page_size):
+    comments_next = None
+    if len(comments) > page_size:
+        comments = comments[:page_size]
+        comments_next = CommentCursorPagination().next_link_after(
+            reverse('issue-comment', args=[issue.id]),
+            comments[-1]['id'],
+            page_size,
+        )
+
+    # Clean data structure without duplicates
+    return {
+        "id": issue.id,
+        "title": issue.title,
+        "description": issue.description,
+        "status": issue.status,
+        "assignee":{
+            "id": issue.assignee.id,
+            "username": issue.assignee.username,
+        } if issue.assignee else None,
+        "labels": labels if labels else None,
+        'comments': comments,
+        'comment_count': issue.comment_count,
+        'last_comment_at': issue.last_comment_at,
+        'comments_next': comments_next,
+        'version': issue.version,
+        'generation': issue.generation,
+    }
+
+
 class IssueViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     pagination_class = CustomCursorPagination
 
+    @replica_read
     def list(self, request):
-        id=request.query_params.get('id')
-        keyword=request.query_params.get('keyword')
-        queryset = Issue.objects.filter(is_deleted=False)
-        if id:
-            queryset = queryset.filter(id=id)
-        if keyword:
-            queryset = queryset.filter(title__icontains=keyword) | queryset.filter(description__icontains=keyword)
-
-        paginator = self.pagination_class()
-        queryset = queryset.values('id', 'title','description','assignee__username')
+        try:
+            queryset, paginator = issue_list_query(request.query_params)
+            cached = cached_facets(request.query_params)
+        except ValueError as e:
+            return Response(
+                {"error": f"Invalid filters: {str(e)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        list_etag = issue_list_etag(request)
+        # cached counts can lag behind the list, their stamp changes the ETag
+        # when they are counted again
+        etag = list_etag if cached is None else make_etag(list_etag, cached.get('stamp'))
+        if etag_matches(request, etag):
+            return not_modified(etag)
         paginated_issues = paginator.paginate_queryset(queryset, request)
-        return paginator.get_paginated_response(paginated_issues)
+        response = paginator.get_paginated_response(paginated_issues)
+        if cached is not None:
+            facets = issue_facets(request.query_params, filter_issues(request.query_params), cached)
+            response.data['facets'] = facets['counts']
+            etag = make_etag(list_etag, facets['stamp'])
+        response['ETag'] = etag
+        return response
 
     def create(self, request):
         title = request.data.pop('title')
@@ -49,64 +237,139 @@ class IssueViewSet(viewsets.ViewSet):
                 )
 
         if label_ids:
-            exsitng_label_ids=Label.objects.filter(is_deleted=False).values_list('id',flat=True)
-            not_existing_label_ids=[]
-            for label_id in label_ids:
-                if label_id not in exsitng_label_ids:
-                    not_existing_label_ids.append(label_id)
+            not_existing_label_ids=label_registry.missing_ids(label_ids)
             if not_existing_label_ids:
                 return Response(
                     {"error": f"lable with ids {not_existing_label_ids} does not exist"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
        
-        issue = Issue.objects.create(
-            title=title,
-            description=description,
-            assignee_id=assignee_id,
-            **request.data,
-            created_by=request.user,
-            updated_by=request.user,
-        )
-        if label_ids:
-            issue.labels.set(label_ids)
+        with transaction.atomic():
+            issue = Issue.objects.create(
+                title=title,
+                description=description,
+                assignee_id=assignee_id,
+                **request.data,
+                created_by=request.user,
+                updated_by=request.user,
+            )
+            if label_ids:
+                issue.labels.set(label_ids)
+            AssigneeRollup().add(issue.assignee_id, issue.status).apply()
+            if issue.status == 'resolved':
+                LatencyChanges().add((issue.id, issue.assignee_id, issue.created_at, issue.resolved_at)).apply()
+            ChangeLog(request.user).add(
+                'issue.created', issue.id, title=issue.title, status=issue.status,
+                assignee_id=issue.assignee_id, labels=label_ids, version=issue.version,
+            ).write()
         return Response(
             {"message": "Issue created successfully", "issue_id": issue.id}, 
             status=status.HTTP_201_CREATED
         )
 
+    @replica_read
     def retrieve(self, request, pk=None):
         try:
-            issue = Issue.objects.filter(id=pk, is_deleted=False)
-
-            if not issue.exists():
+            current = Issue.objects.filter(id=pk, is_deleted=False).values_list('version', 'generation').first()
+            if not current:
                 return Response(
                     {"error": "Issue not found"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            comments = list(Comment.objects.filter(issue_id=pk,is_deleted=False).order_by('-id').values('id','comment','created_at','updated_at','author__username'))
-
-            issue = Issue.objects.select_related('assignee').prefetch_related('labels').get(id=pk)
-            
-            # Clean data structure without duplicates
-            data = {
-                "id": issue.id,
-                "title": issue.title,
-                "description": issue.description,
-                "status": issue.status,
-                "assignee":{
-                    "id": issue.assignee.id,
-                    "username": issue.assignee.username,
-                } if issue.assignee else None,
-                "labels": list(issue.labels.values('id','name').order_by('-id')) if issue.labels.exists() else None,
-                'comments': comments,
-                'version': issue.version,
-            }
-            return Response({"issue": data})
+            page_size = CommentCursorPagination().get_page_size(request)
+            etag = issue_detail_etag(request, pk, *current, page_size)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            data = issue_detail_cache.get(pk, *current, page_size)
+            if data is None:
+                data = self.issue_detail(pk, page_size)
+                if data is None:
+                    return Response(
+                        {"error": "Issue not found"}, 
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                generation = data.pop('generation')
+                issue_detail_cache.set(pk, data['version'], generation, page_size, data)
+                if (data['version'], generation) != current:
+                    # changed since the ETag was computed
+                    etag = issue_detail_etag(request, pk, data['version'], generation, page_size)
+
+            if data['comments_next']:
+                data = {**data, 'comments_next': request.build_absolute_uri(data['comments_next'])}
+            response = Response({"issue": data})
+            response['ETag'] = etag
+            return response
         except Exception as e:
             return Response({"error": str(e)}, status=404)
 
+    # Details of up to BATCH_MAX_IDS issues, each as retrieve returns it, in
+    # the order of `ids`. As in retrieve, the versions are read first and
+    # only the issues missing from the detail cache are loaded, with the
+    # three detail queries for all of them together. Missing or deleted ids
+    # are listed in `missing`.
+    @replica_read
+    def batch(self, request):
+        try:
+            issue_ids = parse_batch_ids(request.query_params.get('ids', ''))
+        except ValueError as e:
+            return Response(
+                {"error": f"Please provide ids as up to {BATCH_MAX_IDS} comma-separated issue ids: {str(e)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        page_size = CommentCursorPagination().get_page_size(request)
+        current = {
+            issue_id: (version, generation)
+            for issue_id, version, generation in Issue.objects.filter(id__in=issue_ids, is_deleted=False).values_list('id', 'version', 'generation')
+        }
+        etag = make_etag('issues', *[
+            issue_detail_cache.make_key(issue_id, *current[issue_id], page_size) for issue_id in issue_ids if issue_id in current
+        ], request.build_absolute_uri())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        details = {}
+        for issue_id, (version, generation) in current.items():
+            data = issue_detail_cache.get(issue_id, version, generation, page_size)
+            if data is not None:
+                details[issue_id] = data
+        uncached = [issue_id for issue_id in current if issue_id not in details]
+        if uncached:
+            issues = batch_issues(uncached)
+            labels = batch_labels(uncached)
+            comments = batch_comments(uncached, page_size)
+            for issue_id, issue in issues.items():
+                data = build_issue_detail(issue, labels[issue_id], comments[issue_id], page_size)
+                issue_detail_cache.set(issue_id, data['version'], data.pop('generation'), page_size, data)
+                details[issue_id] = data
+
+        results = []
+        for issue_id in issue_ids:
+            data = details.get(issue_id)
+            if data is not None:
+                if data['comments_next']:
+                    data = {**data, 'comments_next': request.build_absolute_uri(data['comments_next'])}
+                results.append(data)
+        response = Response({"issues": results, "missing": [issue_id for issue_id in issue_ids if issue_id not in details]})
+        response['ETag'] = etag
+        return response
+
+    def issue_detail(self, pk, page_size):
+        issue = detail_issue(pk)
+        if not issue:
+            return None
+        return build_issue_detail(issue, detail_labels(issue.id), detail_comments(issue.id, page_size), page_size)
+
+    def list_comments(self, request, pk=None):
+        if not Issue.objects.filter(id=pk, is_deleted=False).exists():
+            return Response(
+                {"error": "Issue not found"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        paginator = CommentCursorPagination()
+        paginated_comments = paginator.paginate_queryset(comment_queryset(pk), request)
+        return paginator.get_paginated_response(paginated_comments)
+
 
     def update(self, request, pk=None):
         data=request.data.copy()
@@ -118,6 +381,7 @@ class IssueViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         label_update=False
+        label_ids=[]
         if 'labels' in data:
             label_ids = data.pop('labels', [])
             label_update=True
@@ -133,17 +397,28 @@ class IssueViewSet(viewsets.ViewSet):
         
 
         if label_ids:
-            exsitng_label_ids=Label.objects.filter(is_deleted=False).values_list('id',flat=True)
-            not_existing_label_ids=[]
-            for label_id in label_ids:
-                if label_id not in exsitng_label_ids:
-                    not_existing_label_ids.append(label_id)
+            not_existing_label_ids=label_registry.missing_ids(label_ids)
             if not_existing_label_ids:
                 return Response(
                     {"error": f"lable with ids {not_existing_label_ids} does not exist"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
         with transaction.atomic():
+            old = (
+                Issue.objects
+                .select_for_update()
+                .filter(id=pk, is_deleted=False, version=user_version)
+                .values_list('assignee_id', 'status', 'created_at', 'resolved_at')
+                .first()
+            )
+            if old and data.get('status')=='resolved' and old[1]!='resolved':
+                data['resolved_at']=timezone.now()
+            latency = LatencyChanges()
+            resample = old and old[1] == 'resolved' and (
+                data.get('status', 'resolved') != 'resolved' or 'assignee_id' in data or label_update
+            )
+            if resample:
+                latency.remove((int(pk), old[0], *old[2:]))
             updated_rows = (
                 Issue.objects
                 .filter(id=pk, is_deleted=False, version=user_version)
@@ -151,6 +426,7 @@ class IssueViewSet(viewsets.ViewSet):
                     **data,
                     version=    F("version") + 1,
                     updated_by=request.user,
+                    updated_at=timezone.now(),
                 )
             )
             # print(updated_rows,"updated_rows")
@@ -162,6 +438,15 @@ class IssueViewSet(viewsets.ViewSet):
             issue = Issue.objects.get(id=pk)
             if label_update:
                 issue.labels.set(label_ids)
+            issue_detail_cache.invalidate(pk)
+            AssigneeRollup().move(old[:2], (issue.assignee_id, issue.status)).apply()
+            if issue.status=='resolved' and (old[1]!='resolved' or resample):
+                latency.add((issue.id, issue.assignee_id, issue.created_at, issue.resolved_at))
+            latency.apply()
+            changed = {field: data[field] for field in data}
+            if label_update:
+                changed['labels'] = label_ids
+            ChangeLog(request.user).add('issue.updated', issue.id, **changed, version=issue.version).write()
 
         return Response(
             {"message": "Issue updated successfully", "issue_id": issue.id},
@@ -169,9 +454,11 @@ class IssueViewSet(viewsets.ViewSet):
         )
 
 
+    @transaction.atomic()
     def destroy(self, request, pk=None):
         issue=Issue.objects.filter(id=pk, is_deleted=False)
-        if not issue.exists():
+        old=issue.select_for_update().values_list('assignee_id', 'status', 'created_at', 'resolved_at').first()
+        if not old:
             return Response(
                 {"error": "Issue not found"}, 
                 status=status.HTTP_404_NOT_FOUND
@@ -179,7 +466,13 @@ class IssueViewSet(viewsets.ViewSet):
         issue.update(
             is_deleted=True,
             updated_by=request.user,
+            updated_at=timezone.now(),
         )
+        AssigneeRollup().remove(*old[:2]).apply()
+        if old[1] == 'resolved':
+            LatencyChanges().remove((int(pk), old[0], *old[2:])).apply()
+        issue_detail_cache.invalidate(pk)
+        ChangeLog(request.user).add('issue.deleted', int(pk)).write()
         return Response(
             {"message": f"Issue with id {pk} deleted successfully"}, 
             status=status.HTTP_200_OK
@@ -200,11 +493,14 @@ class IssueViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        comment_obj=Comment.objects.create(
-            issue_id=pk,
-            comment=comment,
-            author=request.user,
-        )
+        with transaction.atomic():
+            comment_obj=Comment.objects.create(
+                issue_id=pk,
+                comment=comment,
+                author=request.user,
+            )
+            record_comment(pk, comment_obj.created_at)
+            ChangeLog(request.user).add('comment.created', int(pk), comment_id=comment_obj.id).write()
         return Response(
             {"message": "Comment added successfully",
             "data":{
@@ -224,11 +520,7 @@ class IssueViewSet(viewsets.ViewSet):
                 {"error": "Please provide labels"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        exsitng_label_ids=Label.objects.filter(is_deleted=False).values_list('id',flat=True)
-        not_existing_label_ids=[]
-        for label_id in label_ids:
-            if label_id not in exsitng_label_ids:
-                not_existing_label_ids.append(label_id)
+        not_existing_label_ids=label_registry.missing_ids(label_ids)
         if not_existing_label_ids:
             return Response(
                 {"error": f"lable with ids {not_existing_label_ids} does not exist"}, 
@@ -241,12 +533,273 @@ class IssueViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         issue=issue.first()
-        issue.labels.set(label_ids)
+        with transaction.atomic():
+            latency = LatencyChanges()
+            if issue.status == 'resolved':
+                sample = (issue.id, issue.assignee_id, issue.created_at, issue.resolved_at)
+                latency.remove(sample).add(sample)
+            issue.labels.set(label_ids)
+            latency.apply()
+            # updated_at moves the list ETag watermark, label filtered pages change
+            bump_issue_generation(issue.id, updated_at=timezone.now(), updated_by=request.user)
+            ChangeLog(request.user).add('issue.labels', issue.id, labels=label_ids).write()
         return Response(
             {"message": "Labels replaced successfully", "issue_id": issue.id}, 
             status=status.HTTP_200_OK
         )
 
+    # The error response for a bulk request body that is not a list of
+    # 1..BULK_MAX_ITEMS items, else None.
+    def check_bulk_items(self, items):
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Please provide a list of issues"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > BULK_MAX_ITEMS:
+            return Response(
+                {"error": f"Please provide at most {BULK_MAX_ITEMS} issues per request"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return None
+
+    # Returns (existing assignee ids, missing label ids) of the ids referenced
+    # by bulk items, one query for all assignees, labels come from the registry.
+    def bulk_references(self, items):
+        assignee_ids = set()
+        label_ids = set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            if isinstance(item.get('assignee_id'), int):
+                assignee_ids.add(item['assignee_id'])
+            if isinstance(item.get('labels'), list):
+                label_ids.update(label_id for label_id in item['labels'] if isinstance(label_id, int))
+        existing_assignee_ids = set(User.objects.filter(id__in=assignee_ids).values_list('id', flat=True)) if assignee_ids else set()
+        return existing_assignee_ids, set(label_registry.missing_ids(list(label_ids)))
+
+    def create_bulk(self, request):
+        items = request.data
+        error = self.check_bulk_items(items)
+        if error:
+            return error
+
+        existing_assignee_ids, missing_label_ids = self.bulk_references(items)
+
+        results = []
+        objects_to_create = []
+        for index, item in enumerate(items):
+            cleaned = self.clean_bulk_item(request.user, item, existing_assignee_ids, missing_label_ids)
+            if isinstance(cleaned, str):
+                results.append({"index": index, "error": cleaned})
+            else:
+                results.append({"index": index})
+                objects_to_create.append(cleaned)
+
+        if objects_to_create:
+            with transaction.atomic():
+                changes = ChangeLog(request.user)
+                issue_ids = iter(create_issues(objects_to_create, changes))
+                changes.write()
+            for result in results:
+                if 'error' not in result:
+                    result['issue_id'] = next(issue_ids)
+
+        created_count = len(objects_to_create)
+        return Response(
+            {
+                "message": f"Successfully created {created_count} issues and error while creating {len(items) - created_count} issues",
+                "results": results,
+            },
+            status=status.HTTP_201_CREATED if created_count else status.HTTP_400_BAD_REQUEST
+        )
+
+    # Returns (issue values, label ids) for a valid bulk item, else the error.
+    def clean_bulk_item(self, user, item, existing_assignee_ids, missing_label_ids):
+        if not isinstance(item, dict):
+            return "Please provide the issue as an object"
+        unknown = sorted(set(item) - BULK_ISSUE_FIELDS)
+        if unknown:
+            return f"Unknown fields {unknown}"
+        title = item.get('title')
+        description = item.get('description')
+        if not title or not description or not isinstance(title, str) or not isinstance(description, str):
+            return "Please provide title, description"
+        if len(title) > Issue._meta.get_field('title').max_length:
+            return "Title is too long"
+        issue_status = item.get('status', 'open')
+        if issue_status not in [choice[0] for choice in Issue.STATUS_CHOICES]:
+            return "Invalid status value choose from "+",".join(choice[0] for choice in Issue.STATUS_CHOICES)
+        assignee_id = item.get('assignee_id')
+        if assignee_id and assignee_id not in existing_assignee_ids:
+            return f"Assignee with id {assignee_id} does not exist"
+        label_ids = item.get('labels') or []
+        if not isinstance(label_ids, list):
+            return "Please provide labels as a list of ids"
+        not_existing_label_ids = [
+            label_id for label_id in label_ids
+            if not isinstance(label_id, int) or label_id in missing_label_ids
+        ]
+        if not_existing_label_ids:
+            return f"lable with ids {not_existing_label_ids} does not exist"
+        issue_values = {
+            'title': title,
+            'description': description,
+            'status': issue_status,
+            'assignee_id': assignee_id or None,
+            'created_by_id': user.id,
+            'updated_by_id': user.id,
+        }
+        return issue_values, list(dict.fromkeys(label_ids))
+
+    def update_bulk(self, request):
+        items = request.data
+        error = self.check_bulk_items(items)
+        if error:
+            return error
+
+        existing_assignee_ids, missing_label_ids = self.bulk_references(items)
+
+        results = []
+        patches = {}
+        for index, item in enumerate(items):
+            cleaned = self.clean_bulk_patch(item, existing_assignee_ids, missing_label_ids)
+            if isinstance(cleaned, str):
+                results.append({"index": index, "error": cleaned, "status": status.HTTP_400_BAD_REQUEST})
+            elif cleaned[0] in patches:
+                results.append({"index": index, "error": f"Issue {cleaned[0]} is listed more than once", "status": status.HTTP_400_BAD_REQUEST})
+            else:
+                results.append({"index": index, "issue_id": cleaned[0]})
+                patches[cleaned[0]] = cleaned[1:]
+
+        with transaction.atomic():
+            # lock in id order so concurrent bulk updates cannot deadlock
+            old_rows = {
+                row[0]: row[1:]
+                for row in Issue.objects.select_for_update().filter(id__in=list(patches), is_deleted=False)
+                .order_by('id').values_list('id', 'version', 'assignee_id', 'status', 'created_at', 'resolved_at')
+            }
+            now = timezone.now()
+            changes = {}
+            label_changes = {}
+            for result in results:
+                issue_id = result.get('issue_id')
+                if issue_id is None or 'error' in result:
+                    continue
+                version, fields, issue_label_ids = patches[issue_id]
+                if issue_id not in old_rows:
+                    result.update({"error": "Issue not found", "status": status.HTTP_404_NOT_FOUND})
+                elif old_rows[issue_id][0] != version:
+                    result.update({"error": "Conflict: issue already updated by another user", "status": status.HTTP_409_CONFLICT})
+                else:
+                    if fields.get('status') == 'resolved' and old_rows[issue_id][2] != 'resolved':
+                        fields['resolved_at'] = now
+                    changes[issue_id] = fields
+                    if issue_label_ids is not None:
+                        label_changes[issue_id] = issue_label_ids
+                    result['version'] = version + 1
+
+            if changes:
+                # samples of resolved issues that change, before their labels do
+                latency = LatencyChanges()
+                resampled = set()
+                for issue_id, fields in changes.items():
+                    _, old_assignee_id, old_status, created_at, resolved_at = old_rows[issue_id]
+                    if old_status == 'resolved' and (
+                        fields.get('status', 'resolved') != 'resolved' or 'assignee_id' in fields or issue_id in label_changes
+                    ):
+                        latency.remove((issue_id, old_assignee_id, created_at, resolved_at))
+                        resampled.add(issue_id)
+                case_update(
+                    Issue.objects.filter(is_deleted=False),
+                    changes,
+                    version=F('version') + 1,
+                    updated_by=request.user,
+                    updated_at=now,
+                )
+                if label_changes:
+                    Issue.labels.through.objects.filter(issue_id__in=list(label_changes)).delete()
+                    insert_issue_labels([
+                        (issue_id, label_id)
+                        for issue_id, issue_label_ids in label_changes.items()
+                        for label_id in issue_label_ids
+                    ])
+                rollup = AssigneeRollup()
+                for issue_id, fields in changes.items():
+                    _, old_assignee_id, old_status, created_at, resolved_at = old_rows[issue_id]
+                    new_assignee_id = fields.get('assignee_id', old_assignee_id)
+                    new_status = fields.get('status', old_status)
+                    rollup.move((old_assignee_id, old_status), (new_assignee_id, new_status))
+                    if new_status == 'resolved' and (old_status != 'resolved' or issue_id in resampled):
+                        latency.add((issue_id, new_assignee_id, created_at, fields.get('resolved_at', resolved_at)))
+                rollup.apply()
+                latency.apply()
+                issue_detail_cache.invalidate(*changes)
+                change_log = ChangeLog(request.user)
+                for issue_id, fields in changes.items():
+                    if issue_id in label_changes:
+                        fields = {**fields, 'labels': label_changes[issue_id]}
+                    change_log.add('issue.updated', issue_id, **fields, version=old_rows[issue_id][0] + 1)
+                change_log.write()
+
+        failed = [result for result in results if 'error' in result]
+        response_status = status.HTTP_200_OK
+        if not changes:
+            failed_statuses = {result['status'] for result in failed}
+            response_status = failed_statuses.pop() if len(failed_statuses) == 1 else status.HTTP_400_BAD_REQUEST
+        return Response(
+            {
+                "message": f"Successfully updated {len(changes)} issues and error while updating {len(failed)} issues",
+                "results": results,
+            },
+            status=response_status,
+        )
+
+    # Returns (id, version, field values, label ids or None) for a valid bulk
+    # patch item, else the error.
+    def clean_bulk_patch(self, item, existing_assignee_ids, missing_label_ids):
+        if not isinstance(item, dict):
+            return "Please provide the issue as an object"
+        unknown = sorted(set(item) - BULK_PATCH_FIELDS)
+        if unknown:
+            return f"Unknown fields {unknown}"
+        issue_id = item.get('id')
+        if not isinstance(issue_id, int):
+            return "Please provide id"
+        version = item.get('version')
+        if not version or not isinstance(version, int):
+            return "Please provide version"
+        fields = {}
+        for field_name in ('title', 'description'):
+            if field_name in item:
+                if not item[field_name] or not isinstance(item[field_name], str):
+                    return "Please provide title, description"
+                fields[field_name] = item[field_name]
+        if len(fields.get('title', '')) > Issue._meta.get_field('title').max_length:
+            return "Title is too long"
+        if 'status' in item:
+            if item['status'] not in [choice[0] for choice in Issue.STATUS_CHOICES]:
+                return "Invalid status value choose from "+",".join(choice[0] for choice in Issue.STATUS_CHOICES)
+            fields['status'] = item['status']
+        if 'assignee_id' in item:
+            assignee_id = item['assignee_id']
+            if assignee_id is not None and assignee_id not in existing_assignee_ids:
+                return f"Assignee with id {assignee_id} does not exist"
+            fields['assignee_id'] = assignee_id
+        label_ids = None
+        if 'labels' in item:
+            label_ids = item['labels']
+            if not isinstance(label_ids, list):
+                return "Please provide labels as a list of ids"
+            not_existing_label_ids = [
+                label_id for label_id in label_ids
+                if not isinstance(label_id, int) or label_id in missing_label_ids
+            ]
+            if not_existing_label_ids:
+                return f"lable with ids {not_existing_label_ids} does not exist"
+            label_ids = list(dict.fromkeys(label_ids))
+        return issue_id, version, fields, label_ids
+
     def bulk_status(self, request):
             ids = request.data.get('ids', [])
             new_status = request.data.get('status')
@@ -259,7 +812,7 @@ class IssueViewSet(viewsets.ViewSet):
                 return Response({"error": "Invalid status value choose from "+",".join(valid_statuses)}, status=status.HTTP_400_BAD_REQUEST)
 
             existing_qs=Issue.objects.filter(is_deleted=False)
-            existing_ids = existing_qs.values_list('id',flat=True)
+            existing_ids = set(existing_qs.filter(id__in=[id for id in ids if isinstance(id, int)]).values_list('id',flat=True))
             not_existing_ids=[]
             for id in ids:
                 if id not in existing_ids:
@@ -272,11 +825,39 @@ class IssueViewSet(viewsets.ViewSet):
 
             with transaction.atomic():
                 to_update_qs = existing_qs.filter(id__in=ids)
-                updated_count=to_update_qs.count()
+                old_rows = list(to_update_qs.select_for_update().values_list('id', 'assignee_id', 'status', 'created_at', 'resolved_at'))
+                updated_count=len(old_rows)
+                latency = LatencyChanges()
                 if new_status=="resolved":
-                    to_update_qs.update(status=new_status,resolved_at=timezone.now())
+                    resolved_at=timezone.now()
+                    # issues that were already resolved keep their resolved_at
+                    to_update_qs.update(
+                        status=new_status,
+                        resolved_at=Case(When(status='resolved', then=F('resolved_at')), default=Value(resolved_at)),
+                        updated_at=resolved_at,
+                    )
+                    latency.add(*[
+                        (issue_id, assignee_id, created_at, resolved_at)
+                        for issue_id, assignee_id, old_status, created_at, _ in old_rows
+                        if old_status!='resolved'
+                    ])
                 else:
-                    to_update_qs.update(status=new_status)
+                    to_update_qs.update(status=new_status,updated_at=timezone.now())
+                    latency.remove(*[
+                        (issue_id, assignee_id, created_at, old_resolved_at)
+                        for issue_id, assignee_id, old_status, created_at, old_resolved_at in old_rows
+                        if old_status=='resolved'
+                    ])
+                latency.apply()
+                rollup = AssigneeRollup()
+                for issue_id, assignee_id, old_status, created_at, _ in old_rows:
+                    rollup.move((assignee_id, old_status), (assignee_id, new_status))
+                rollup.apply()
+                bump_issue_generation(*[row[0] for row in old_rows])
+                change_log = ChangeLog(request.user)
+                for issue_id, assignee_id, old_status, created_at, _ in old_rows:
+                    change_log.add('issue.updated', issue_id, status=new_status)
+                change_log.write()
                 
                 return Response({
                     "message": f"Successfully updated {updated_count} issues to {new_status}"
@@ -284,8 +865,52 @@ class IssueViewSet(viewsets.ViewSet):
 
 
 
+def top_assignees():
+    top_assignee_qs=AssigneeStats.objects.filter(total__gt=0).order_by('-total', 'assignee').values(
+        'assignee__username', 'total', 'open', 'in_progress', 'resolved'
+    )[:10]
+    return [{
+        'assignee':item['assignee__username'],
+        'count':item['total'],
+        'open':item['open'],
+        'in_progress':item['in_progress'],
+        'resolved':item['resolved'],
+    } for item in top_assignee_qs]
+
+
+# (dimension, key, start, end) for latency_summary from the report query
+# parameters, ValueError for invalid ones.
+def latency_filters(params):
+    start=params.get('start')
+    end=params.get('end')
+    label_id=params.get('label')
+    assignee_id=params.get('assignee')
+    start=date.fromisoformat(start) if start else None
+    end=date.fromisoformat(end) if end else None
+    if label_id and assignee_id:
+        raise ValueError("filter by either label or assignee")
+    if label_id:
+        return 'label', int(label_id), start, end
+    if assignee_id:
+        return 'assignee', int(assignee_id), start, end
+    return 'all', 0, start, end
+
+
+def latency_report(histogram):
+    average_time=to_minutes(histogram.mean)
+    return {
+        "message": "Successfully fetched average time",
+        "average_time": f"{average_time} minutes" if average_time is not None else None,
+        "resolved_count": histogram.count,
+        "mean_minutes": average_time,
+        "p50_minutes": to_minutes(histogram.quantile(0.5)),
+        "p90_minutes": to_minutes(histogram.quantile(0.9)),
+        "p99_minutes": to_minutes(histogram.quantile(0.99)),
+    }
+
+
 class IssueImportandReportView(viewsets.ViewSet):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     @transaction.atomic()
@@ -299,125 +924,139 @@ class IssueImportandReportView(viewsets.ViewSet):
                 )
 
             file_type=csv_file.name.split('.')[-1]
-            if file_type not in ['csv','xlsx']:
+            if file_type not in FILE_TYPES:
                 return Response(
                     {"error": "Please provide a CSV or Excel file"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if file_type=='csv':
-                df = pd.read_csv(csv_file)
-            else:
-                df = pd.read_excel(csv_file)
-            required_columns=['title','description','status','labels']
-            if not all(col in df.columns for col in required_columns):
-                return Response(
-                    {"error": f"Please provide all required columns {required_columns}"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            status_choices=[choice[0] for choice in Issue.STATUS_CHOICES]
+            run_async = str(request.query_params.get('async', request.data.get('async', ''))).lower() in ['1', 'true']
+            if run_async:
+                job = ImportJob.objects.create(file=csv_file, file_type=file_type, created_by=request.user)
+                submit_import_job(job.id)
+                return Response({
+                    "message": "Import job queued",
+                    "job_id": job.id,
+                    "status": job.status,
+                    "status_url": reverse('issue-import-status', args=[job.id]),
+                }, status=status.HTTP_202_ACCEPTED)
 
-            label_qs=Label.objects.filter(is_deleted=False).values('id','name')
-            label_dict_map={item['name'].lower():item['id'] for item in label_qs}
+            try:
+                importer = IssueImporter(request.user).run(iter_file_rows(csv_file, file_type))
+            except ImportFileError as e:
+                transaction.set_rollback(True)
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            user_qs=User.objects.filter(is_active=True).values('id','username')
-            user_dict_map={item['username'].lower():item['id'] for item in user_qs} 
-            error_Details=[]
-            objects_to_create=[]
-            if len(df)==0:
+            if importer.rows_seen==0:
                 return Response(
                     {"error": "Please provide data in the file"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            for index, row in df.iterrows():
-                title = row.get('title')
-                if not title or pd.isna(title):
-                    error_Details.append({"error": f"Please provide title for row {index}"})
-                    continue
-                
-                description = row.get('description')
-                
-                if not description or pd.isna(description):
-                    error_Details.append({"error": f"Please provide description for row {index}"})
-                    continue
-            
-                new_status = row.get('status')  
-                if not new_status or pd.isna(new_status) or new_status not in status_choices:
-                    error_Details.append({"error": f"Please provide valid status for row {index}"})
-                    continue
-                labels = row.get('labels')
-                if not labels or pd.isna(labels):
-                    return Response(
-                        {"error": f"Please provide labels for row {index}"}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                else:
-                    label_names=labels.split(',')
-                    label_ids=[]    
-                    for label_name in label_names:
-                        label_name=label_name.strip().lower()
-                        if label_name not in label_dict_map:
-                            error_Details.append({"error": f"Please provide valid label name {label_name} for row {index}"})
-                            continue
-                        label_ids.append(label_dict_map[label_name])
-                assignee = row.get('assignee')
-                if not assignee or pd.isna(assignee):
-                    assignee_id=None
-                else:
-                    assignee=str(assignee)
-                    assignee=assignee.strip().lower()
-                    if assignee not in user_dict_map:
-                        error_Details.append({"error": f"Please provide valid assignee name {assignee} for row {index}"})
-                        continue
-                    assignee_id=user_dict_map[assignee] 
-
-                issue_obj = Issue(
-                    title=title,
-                    description=description,
-                    status=new_status,
-                    assignee_id=assignee_id,
-                    created_by=request.user,
-                    updated_by=request.user
-                )
-                objects_to_create.append((issue_obj, label_ids))
 
+            error_Details=importer.error_details
             if error_Details:
+                # batches written before the first bad row are discarded too
+                transaction.set_rollback(True)
                 return Response(
                     {"message":"Please check the error_details to fix the errors in file before importing",    
                     "error_details": error_Details}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if objects_to_create:
-                issues_only = [item[0] for item in objects_to_create]
-                created_issues = Issue.objects.bulk_create(issues_only)
-                
-                for i, issue in enumerate(created_issues):
-                    original_labels = objects_to_create[i][1]
-                    if original_labels:
-                        issue.labels.set(original_labels)
-
             return Response({
-                "message": f"Successfully imported {len(objects_to_create)} issues and error while importing {len(error_Details)} issues",
+                "message": f"Successfully imported {importer.imported} issues and error while importing {len(error_Details)} issues",
                 "error_details": error_Details
             }, status=201)
         
         except Exception as e:
+            transaction.set_rollback(True)
             return Response(
                 {"error": f"Error while importing issues: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    # Streams every issue matching the list filters (id, keyword) as csv,
+    # ndjson or xlsx, in the import column layout plus id, timestamps and
+    # version.
+    def export(self, request):
+        file_type = request.query_params.get('file_type', 'csv')
+        if file_type not in EXPORT_FILE_TYPES:
+            return Response(
+                {"error": "Please provide file_type as one of "+",".join(EXPORT_FILE_TYPES)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            queryset = filter_issues(request.query_params)
+        except ValueError as e:
+            return Response(
+                {"error": f"Invalid filters: {str(e)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if file_type == 'xlsx' and queryset.count() > XLSX_MAX_ROWS:
+            return Response(
+                {"error": f"Excel files hold at most {XLSX_MAX_ROWS} issues, please export as csv or ndjson"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        response = StreamingHttpResponse(stream_export(queryset, file_type), content_type=EXPORT_FILE_TYPES[file_type])
+        response['Content-Disposition'] = f'attachment; filename="issues.{file_type}"'
+        return response
+
+    def import_status(self, request, job_id=None):
+        job_qs = ImportJob.objects.filter(id=job_id)
+        if not request.user.is_staff:
+            job_qs = job_qs.filter(created_by=request.user)
+        job = job_qs.first()
+        if not job:
+            return Response(
+                {"error": "Import job not found"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        # a client polling a job whose worker died resumes it
+        if is_stalled(job):
+            resume_job(job.id)
+        return Response({
+            "job_id": job.id,
+            "status": job.status,
+            "rows_processed": job.rows_processed,
+            "imported": job.imported_count,
+            "error_count": job.error_count,
+            "error_details": job.error_details,
+            "message": job.message,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        }, status=200)
+
+    def cache_stats(self, request):
+        if not request.user.is_staff:
+            return Response(
+                {"error": "Only staff users can view cache statistics"}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response({
+            "message": "Successfully fetched cache statistics",
+            "issue_detail": issue_detail_cache.stats(),
+            "auth_tokens": token_cache_stats(),
+        }, status=200)
+
+    def request_metrics(self, request):
+        if not request.user.is_staff:
+            return Response(
+                {"error": "Only staff users can view request metrics"}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response({
+            "message": "Successfully fetched request metrics",
+            "routes": route_metrics.summary(),
+            "databases": replica_monitor.stats(),
+            "archival": last_archive_run(),
+        }, status=200)
+
+    @replica_read
     def top_assignee(self,request):
         try:
-            top_assignee_qs=Issue.objects.filter(assignee__isnull=False).values('assignee__username').annotate(
-                count=Count('assignee__username')
-            ).order_by('-count')[:10]
-            top_assignee_list=[{'assignee':item['assignee__username'],'count':item['count']} for item in top_assignee_qs]   
             return Response({
                 "message": "Successfully fetched top 10 assignees",
-                "top_assignees": top_assignee_list
+                "top_assignees": top_assignees()
             }, status=200)
         except Exception as e:
             return Response(
@@ -425,22 +1064,19 @@ class IssueImportandReportView(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @replica_read
     def get_average_time(self,request):
         try:
-            average_time_qs=Issue.objects.filter(status__in=['closed','resolved'],resolved_at__isnull=False).values('created_at','resolved_at')
-            # print(average_time_qs.count())
-            df=pd.DataFrame(list(average_time_qs))
-            df['created_at']=pd.to_datetime(df['created_at'])
-            df['resolved_at']=pd.to_datetime(df['resolved_at'])
-            df['time_taken']=(df['resolved_at']-df['created_at']).dt.total_seconds()/60 #minutes
-            average_time=df['time_taken'].mean()
-            return Response({
-                "message": "Successfully fetched average time",
-                "average_time": f"{round(average_time,2)} minutes"
-            }, status=200)
+            try:
+                filters=latency_filters(request.query_params)
+            except ValueError as e:
+                return Response(
+                    {"error": f"Invalid filters, use start/end as YYYY-MM-DD and one of label or assignee id: {str(e)}"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(latency_report(latency_summary(*filters)), status=200)
         except Exception as e:
             return Response(
                 {"error": f"Error while fetching average time: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-
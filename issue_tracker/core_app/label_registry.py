@@ -0,0 +1,84 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import LABELS_GENERATION
+from .helpers import get_generation, invalidate_generation
+from .models import Label
+
+
+# Id and name index of the non-deleted labels, loaded once per process and
+# reloaded when the labels generation moves. Every label write goes through
+# invalidate_labels() (connected to Label's post_save / post_delete), which
+# bumps the shared counter so other processes reload on their next lookup.
+# A miss is checked against the table before it
+# is reported, so a label written without a bump is never rejected. A hit is
+# not: a label deleted or renamed by another process is only seen once the
+# counter reaches this one, which needs a shared default cache (see CACHES).
+# Without one, the index is also reloaded when it is older than
+# LABEL_REGISTRY_MAX_AGE seconds, which bounds how long a deleted label is
+# still accepted.
+class LabelRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.loaded_at = None
+        self.ids = frozenset()
+        self.names = {}
+        self.loads = 0
+
+    def expired(self):
+        max_age = getattr(settings, 'LABEL_REGISTRY_MAX_AGE', 30)
+        return bool(max_age) and (self.loaded_at is None or time.monotonic() - self.loaded_at > max_age)
+
+    def load(self, force=False):
+        generation = get_generation(LABELS_GENERATION)
+        if generation == self.generation and not force and not self.expired():
+            return self
+        with self.lock:
+            if generation != self.generation or force or self.expired():
+                # read the generation before the rows, a write that lands in
+                # between bumps it again and forces another reload
+                names = {
+                    name.lower(): label_id
+                    for label_id, name in Label.objects.filter(is_deleted=False).values_list('id', 'name')
+                }
+                self.ids = frozenset(names.values())
+                self.names = names
+                self.generation = generation
+                self.loaded_at = time.monotonic()
+                self.loads += 1
+        return self
+
+    def missing_ids(self, label_ids):
+        missing = self.find_missing(label_ids)
+        ids = [label_id for label_id in missing if isinstance(label_id, int)]
+        if ids and Label.objects.filter(id__in=ids, is_deleted=False).exists():
+            self.load(force=True)
+            missing = self.find_missing(label_ids)
+        return missing
+
+    def find_missing(self, label_ids):
+        ids = self.load().ids
+        return [
+            label_id for label_id in label_ids
+            if not isinstance(label_id, int) or label_id not in ids
+        ]
+
+    def name_map(self):
+        return self.load().names
+
+    def id_for_name(self, name):
+        name = name.strip().lower()
+        label_id = self.name_map().get(name)
+        if label_id is None and Label.objects.filter(name__iexact=name, is_deleted=False).exists():
+            label_id = self.load(force=True).names.get(name)
+        return label_id
+
+
+label_registry = LabelRegistry()
+
+
+def invalidate_labels(**kwargs):
+    invalidate_generation(LABELS_GENERATION)
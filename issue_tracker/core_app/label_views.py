@@ -1,17 +1,26 @@
 from rest_framework import viewsets ,status
 from .models import Issue, Comment, Label
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.response import Response
+from django.db import transaction
 
-from .helpers import CustomCursorPagination
+from user_app.authentication import CachedTokenAuthentication
+from .cache import LABELS_GENERATION
+from .changes import ChangeLog
+from .helpers import CustomCursorPagination, etag_matches, get_generation, make_etag, not_modified
+from .routers import replica_read
 # Create your views here.
 class LabelViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     pagination_class = CustomCursorPagination
     
+    @replica_read
     def list(self, request):
+        # every label write bumps the labels generation (label_registry)
+        etag = make_etag('labels', get_generation(LABELS_GENERATION), request.build_absolute_uri())
+        if etag_matches(request, etag):
+            return not_modified(etag)
         id=request.query_params.get('id')
         keyword=request.query_params.get('keyword')
         labels = Label.objects.filter(is_deleted=False)
@@ -22,7 +31,9 @@ class LabelViewSet(viewsets.ViewSet):
         paginator = self.pagination_class()
         labels = labels.values('id', 'name')
         paginated_labels = paginator.paginate_queryset(labels, request)
-        return paginator.get_paginated_response(paginated_labels)
+        response = paginator.get_paginated_response(paginated_labels)
+        response['ETag'] = etag
+        return response
 
     def create(self, request):
         name = request.data.get('name')
@@ -37,7 +48,9 @@ class LabelViewSet(viewsets.ViewSet):
                 'success': False,
                 'message': 'Label already exists'
             }, status=status.HTTP_400_BAD_REQUEST)
-        label = Label.objects.create(name=name)
+        with transaction.atomic():
+            label = Label.objects.create(name=name)
+            ChangeLog(request.user).add('label.created', label_id=label.id, name=label.name).write()
         return Response({
             'success': True,
             'message': 'Label created successfully',
@@ -56,7 +69,9 @@ class LabelViewSet(viewsets.ViewSet):
                 'message': 'Label not found'
             }, status=status.HTTP_404_NOT_FOUND)
         label.is_deleted = True
-        label.save()
+        with transaction.atomic():
+            label.save()
+            ChangeLog(request.user).add('label.deleted', label_id=label.id).write()
         return Response({
             'success': True,
             'message': 'Label deleted successfully'
@@ -82,7 +97,9 @@ class LabelViewSet(viewsets.ViewSet):
                 'message': 'Label already exists'
             }, status=status.HTTP_400_BAD_REQUEST)
         label.name = name
-        label.save()
+        with transaction.atomic():
+            label.save()
+            ChangeLog(request.user).add('label.updated', label_id=label.id, name=label.name).write()
         return Response({
             'success': True,
             'message': 'Label updated successfully',
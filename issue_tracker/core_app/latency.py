@@ -0,0 +1,136 @@
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Issue, LatencySketch
+from .sketches import LatencyHistogram
+
+
+def sketch_keys(assignee_id, label_ids):
+    keys = [('all', 0)]
+    if assignee_id is not None:
+        keys.append(('assignee', assignee_id))
+    keys.extend(('label', label_id) for label_id in label_ids)
+    return keys
+
+
+def issue_label_map(issue_ids):
+    IssueLabel = Issue.labels.through
+    label_map = {}
+    for issue_id, label_id in IssueLabel.objects.filter(issue_id__in=issue_ids).values_list('issue_id', 'label_id'):
+        label_map.setdefault(issue_id, []).append(label_id)
+    return label_map
+
+
+# rows are (issue_id, assignee_id, created_at, resolved_at) of resolved
+# issues, counted with their current labels; `sign` -1 removes the samples.
+# Returns {(dimension, key, day): LatencyHistogram}
+def build_histograms(rows, histograms=None, sign=1):
+    histograms = {} if histograms is None else histograms
+    label_map = issue_label_map([row[0] for row in rows])
+    for issue_id, assignee_id, created_at, resolved_at in rows:
+        if not created_at or not resolved_at:
+            continue
+        seconds = (resolved_at - created_at).total_seconds()
+        day = resolved_at.astimezone(dt_timezone.utc).date() if timezone.is_aware(resolved_at) else resolved_at.date()
+        for dimension, key in sketch_keys(assignee_id, label_map.get(issue_id, [])):
+            histograms.setdefault((dimension, key, day), LatencyHistogram()).add(seconds, sign)
+    return histograms
+
+
+# Merges histograms into the stored daily sketches: insert missing rows, lock
+# the touched rows, merge in Python and write them back with one bulk_update.
+# Sketches left without samples are deleted, as a rebuild would not have them.
+def merge_into_sketches(histograms):
+    if not histograms:
+        return
+    with transaction.atomic():
+        LatencySketch.objects.bulk_create(
+            [LatencySketch(dimension=dimension, key=key, day=day) for dimension, key, day in sorted(histograms)],
+            ignore_conflicts=True,
+        )
+        lookup = Q()
+        for dimension, key, day in histograms:
+            lookup |= Q(dimension=dimension, key=key, day=day)
+        sketches = list(LatencySketch.objects.select_for_update().filter(lookup).order_by('id'))
+        empty = []
+        for sketch in sketches:
+            merged = LatencyHistogram.from_json(sketch.sketch).merge(histograms[(sketch.dimension, sketch.key, sketch.day)])
+            sketch.sketch = merged.to_json()
+            sketch.count = merged.count
+            if merged.count <= 0:
+                empty.append(sketch.id)
+        LatencySketch.objects.bulk_update([sketch for sketch in sketches if sketch.id not in empty], ['sketch', 'count'])
+        if empty:
+            LatencySketch.objects.filter(id__in=empty).delete()
+
+
+def record_resolutions(rows):
+    merge_into_sketches(build_histograms(rows))
+
+
+# Collects the resolution samples a write adds and removes, like
+# rollups.AssigneeRollup does for the assignee counts. An issue has a sample
+# while it is resolved and not deleted, filed under its assignee and labels,
+# so a write that reopens, deletes, reassigns or relabels a resolved issue
+# removes its sample, and adds the new one if it stays resolved. remove()
+# reads the labels right away, call it before the labels change; add() reads
+# them in apply().
+class LatencyChanges:
+    def __init__(self):
+        self.histograms = {}
+        self.added = []
+
+    # rows are (issue_id, assignee_id, created_at, resolved_at)
+    def add(self, *rows):
+        self.added.extend(rows)
+        return self
+
+    def remove(self, *rows):
+        build_histograms(rows, self.histograms, sign=-1)
+        return self
+
+    def apply(self):
+        histograms, self.histograms = build_histograms(self.added, self.histograms), {}
+        self.added = []
+        merge_into_sketches(histograms)
+
+
+def rebuild_latency_sketches(chunk_size=2000):
+    histograms = {}
+    resolved_qs = Issue.objects.filter(status='resolved', resolved_at__isnull=False, is_deleted=False).values_list(
+        'id', 'assignee_id', 'created_at', 'resolved_at'
+    )
+    chunk = []
+    for row in resolved_qs.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            build_histograms(chunk, histograms)
+            chunk = []
+    build_histograms(chunk, histograms)
+
+    with transaction.atomic():
+        LatencySketch.objects.all().delete()
+        LatencySketch.objects.bulk_create([
+            LatencySketch(dimension=dimension, key=key, day=day, count=histogram.count, sketch=histogram.to_json())
+            for (dimension, key, day), histogram in histograms.items()
+        ], batch_size=1000)
+    return len(histograms)
+
+
+def latency_summary(dimension='all', key=0, start=None, end=None):
+    sketch_qs = LatencySketch.objects.filter(dimension=dimension, key=key)
+    if start:
+        sketch_qs = sketch_qs.filter(day__gte=start)
+    if end:
+        sketch_qs = sketch_qs.filter(day__lte=end)
+    histogram = LatencyHistogram()
+    for data in sketch_qs.values_list('sketch', flat=True):
+        histogram.merge(LatencyHistogram.from_json(data))
+    return histogram
+
+
+def to_minutes(seconds):
+    return round(seconds / 60, 2) if seconds is not None else None
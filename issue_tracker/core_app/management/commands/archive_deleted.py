@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core_app.archival import archive_candidates, archive_deleted
+
+
+class Command(BaseCommand):
+    help = "Move soft deleted issues, comments and labels past the retention window into the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help="Archive rows deleted more than this many days ago (default ARCHIVE_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, help="Rows per transaction (default ARCHIVE_BATCH_SIZE)")
+        parser.add_argument('--pause', type=float, help="Seconds to sleep between batches (default ARCHIVE_PAUSE_SECONDS)")
+        parser.add_argument('--max-seconds', type=float, help="Stop after this long, the next run carries on")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows a run would archive")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            counts = archive_candidates(options['retention_days'])
+            self.stdout.write(', '.join(f"{count} {table}" for table, count in counts.items()) + " to archive")
+            return
+
+        summary = archive_deleted(
+            retention_days=options['retention_days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_seconds=options['max_seconds'],
+        )
+        rows = summary['rows']
+        self.stdout.write(
+            f"Archived {rows['issues']} issues, {rows['comments']} comments, {rows['labels']} labels "
+            f"and {rows['issue_labels']} label links in {summary['batches']} batches, "
+            f"{summary['seconds']}s, {summary['rows_per_second']} rows/s"
+        )
+        if not summary['complete']:
+            self.stdout.write("Stopped at --max-seconds, rows are left to archive")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core_app.benchmarks import ENDPOINTS, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Time every API endpoint against the current database and check its SQL query budget; writes are rolled back"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--only', action='append', choices=[endpoint.name for endpoint in ENDPOINTS],
+                            help="Endpoint to run, can be repeated")
+        parser.add_argument('--fail-on-budget', action='store_true', help="Exit with an error when an endpoint is over its query budget")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+        with transaction.atomic():
+            results = run_benchmarks(options['iterations'], options['only'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'endpoint':32} {'method':6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'budget':>7}")
+        for result in results:
+            line = (
+                f"{result['name']:32} {result['method']:6} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} "
+                f"{result['p99_ms']:9.2f} {result['max_queries']:8} {result['budget']:7}"
+            )
+            self.stdout.write(self.style.ERROR(line) if result['over_budget'] else line)
+
+        over = [result['name'] for result in results if result['over_budget']]
+        if over and options['fail_on_budget']:
+            raise CommandError(f"Over query budget: {', '.join(over)}")
@@ -0,0 +1,51 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.urls import reverse
+
+from core_app.benchmarks import run_asgi_throughput, run_wsgi_throughput, temporary_benchmark_token
+from core_app.models import Comment
+
+
+class Command(BaseCommand):
+    help = "Compare read endpoint throughput under WSGI (sync DRF views on a thread pool) and ASGI (async views on an event loop)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64, help="Requests in flight at once")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per mode")
+        parser.add_argument('--path', action='append', dest='paths', help="Path to request, can be repeated (default: the read endpoints)")
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], action='append', dest='modes')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be at least 1")
+        from issue_tracker.asgi import application as asgi_application
+        from issue_tracker.wsgi import application as wsgi_application
+
+        # under load every query is "slow", keep the instrumentation warnings out of the report
+        logging.getLogger('core_app.middleware').setLevel(logging.ERROR)
+        paths = options['paths'] or self.default_paths()
+        self.stdout.write(f"{options['requests']} requests per mode, {options['concurrency']} concurrent, over {', '.join(paths)}")
+        self.stdout.write(f"{'mode':6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        with temporary_benchmark_token() as token:
+            headers = {'Authorization': f'Token {token.key}'}
+            for mode in options['modes'] or ['wsgi', 'asgi']:
+                if mode == 'wsgi':
+                    result = run_wsgi_throughput(wsgi_application, paths, headers, options['concurrency'], options['requests'])
+                else:
+                    result = run_asgi_throughput(asgi_application, paths, headers, options['concurrency'], options['requests'])
+                self.stdout.write(
+                    f"{result['mode']:6} {result['requests_per_second']:9.1f} {result['p50_ms']:9.2f} "
+                    f"{result['p95_ms']:9.2f} {result['p99_ms']:9.2f} {result['errors']:7}"
+                )
+
+    def default_paths(self):
+        busiest = (
+            Comment.objects.filter(is_deleted=False, issue__is_deleted=False)
+            .values('issue').annotate(count=Count('id')).order_by('-count').first()
+        )
+        paths = [reverse('issue-list'), reverse('label-list'), reverse('issue-top-assignees')]
+        if busiest:
+            paths.append(reverse('issue-detail', args=[busiest['issue']]))
+        return paths
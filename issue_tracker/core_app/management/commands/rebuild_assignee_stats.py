@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core_app.rollups import find_assignee_stats_drift, rebuild_assignee_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the assignee_stats rollup from the issues table, or verify it with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only compare the rollup with a fresh count, exit non-zero on drift")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_assignee_stats_drift()
+            for assignee_id, counters in sorted(drift.items()):
+                self.stdout.write(f"assignee {assignee_id}: expected {counters['expected']} found {counters['actual']}")
+            if drift:
+                raise CommandError(f"assignee_stats is out of date for {len(drift)} assignees, run rebuild_assignee_stats")
+            self.stdout.write("assignee_stats is consistent")
+            return
+
+        count = rebuild_assignee_stats()
+        self.stdout.write(f"Rebuilt assignee_stats for {count} assignees")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core_app.comment_counters import REBUILD_BATCH_SIZE, find_comment_counter_drift, rebuild_comment_counters
+
+
+class Command(BaseCommand):
+    help = "Recount Issue.comment_count and last_comment_at from the comments table, or verify them with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only compare the counters with a fresh count, exit non-zero on drift")
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE, help="Issues per UPDATE")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_comment_counter_drift()
+            for issue_id in drift[:20]:
+                self.stdout.write(f"issue {issue_id}")
+            if drift:
+                raise CommandError(f"comment counters are out of date for {len(drift)} issues, run rebuild_comment_counters")
+            self.stdout.write("comment counters are consistent")
+            return
+
+        count = rebuild_comment_counters(options['batch_size'])
+        self.stdout.write(f"Repaired comment counters of {count} issues")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core_app.latency import rebuild_latency_sketches
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily resolution latency sketches from the currently resolved issues"
+
+    def handle(self, *args, **options):
+        count = rebuild_latency_sketches()
+        self.stdout.write(f"Rebuilt {count} latency sketches")
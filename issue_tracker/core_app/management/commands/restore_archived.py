@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core_app.archival import restore_comments, restore_issues, restore_labels
+
+
+def ids(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+class Command(BaseCommand):
+    help = "Move archived issues (with their comments), comments or labels back into the live tables, still soft deleted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issues', type=ids, default=[], help="Comma-separated issue ids")
+        parser.add_argument('--comments', type=ids, default=[], help="Comma-separated ids of comments archived on their own")
+        parser.add_argument('--labels', type=ids, default=[], help="Comma-separated label ids")
+
+    def handle(self, *args, **options):
+        if not (options['issues'] or options['comments'] or options['labels']):
+            raise CommandError("Pass --issues, --comments or --labels")
+        # labels first, so restored issues get their links to them back
+        for restore, restore_ids in (
+            (restore_labels, options['labels']),
+            (restore_issues, options['issues']),
+            (restore_comments, options['comments']),
+        ):
+            if not restore_ids:
+                continue
+            try:
+                restored = restore(*restore_ids)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write("Restored " + ", ".join(f"{count} {table}" for table, count in restored.items()))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core_app.import_jobs import recoverable_jobs, run_import_job
+from core_app.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Run queued import jobs and resume stalled ones from their last committed batch, in this process"
+
+    def handle(self, *args, **options):
+        job_ids = list(recoverable_jobs().order_by('id').values_list('id', flat=True))
+        if not job_ids:
+            self.stdout.write("No import jobs to resume")
+            return
+        for job_id in job_ids:
+            run_import_job(job_id)
+            job = ImportJob.objects.get(id=job_id)
+            self.stdout.write(f"Job {job.id}: {job.status}, {job.rows_processed} rows processed, {job.imported_count} imported, {job.error_count} errors")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core_app.seeding import SEED_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    help = "Seed users, labels, issues and comments with realistic distributions, for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--labels', type=int, default=30)
+        parser.add_argument('--issues', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=150000)
+        parser.add_argument('--seed', type=int, default=None, help="Random seed, for a reproducible dataset")
+
+    def handle(self, *args, **options):
+        seed_dataset(
+            options['users'], options['labels'], options['issues'], options['comments'],
+            seed=options['seed'], stdout=self.stdout,
+        )
+        self.stdout.write(f"Seeded users can sign in with the password '{SEED_PASSWORD}'")
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .routers import pin_to_primary
+from .sketches import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+# Counts the queries of one request and their time in the database.
+# Statements are keyed by their SQL with placeholders, so the same query run
+# for every row of a list shows up as one repeated statement. Queries of an
+# async view may run on several threads at once, hence the lock.
+class QueryRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slow = []
+
+    def add(self, sql, elapsed):
+        with self.lock:
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            if elapsed * 1000 >= getattr(settings, 'SLOW_QUERY_MS', 100):
+                self.slow.append((elapsed, sql))
+
+    @contextmanager
+    def record(self):
+        token = current_recorder.set(self)
+        try:
+            yield self
+        finally:
+            current_recorder.reset(token)
+
+
+# Execute wrapper installed on every database connection when it is opened
+# (connected to connection_created in CoreAppConfig.ready). It reports to the
+# recorder of the current request, found through a context variable, so it
+# also sees the queries an async view runs in executor threads.
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+# Request durations, database time and query counts per route, kept in
+# process. Durations go into log-bucketed histograms in microseconds.
+class RouteMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def add(self, route, status_code, duration, db_duration, queries):
+        with self.lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = {
+                    'requests': 0, 'errors': 0, 'queries': 0, 'max_queries': 0,
+                    'duration': LatencyHistogram(), 'db_duration': LatencyHistogram(),
+                }
+            metrics['requests'] += 1
+            metrics['errors'] += status_code >= 500
+            metrics['queries'] += queries
+            metrics['max_queries'] = max(metrics['max_queries'], queries)
+            metrics['duration'].add(duration * 1000000)
+            metrics['db_duration'].add(db_duration * 1000000)
+
+    def summary(self):
+        with self.lock:
+            return {
+                route: {
+                    'requests': metrics['requests'],
+                    'errors': metrics['errors'],
+                    'mean_queries': round(metrics['queries'] / metrics['requests'], 2),
+                    'max_queries': metrics['max_queries'],
+                    'duration_ms': histogram_summary(metrics['duration']),
+                    'db_duration_ms': histogram_summary(metrics['db_duration']),
+                }
+                for route, metrics in sorted(self.routes.items())
+            }
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+
+def histogram_summary(histogram):
+    return {
+        name: round(value / 1000, 3)
+        for name, value in [
+            ('mean', histogram.mean), ('p50', histogram.quantile(0.5)),
+            ('p95', histogram.quantile(0.95)), ('p99', histogram.quantile(0.99)),
+        ]
+    }
+
+
+route_metrics = RouteMetrics()
+
+
+# Counts the SQL queries of every request and the time spent running them,
+# on all database aliases, and reports them in a Server-Timing header:
+#   Server-Timing: db;dur=3.1;desc="4 queries", app;dur=12.5
+# Slow requests (SLOW_REQUEST_MS), slow queries (SLOW_QUERY_MS) and statements
+# repeated REPEATED_QUERY_THRESHOLD times or more in one request (N+1 lookups)
+# are logged with the view that ran them, and every request is added to the
+# per-route metrics served by GET /reports/metrics. A streamed body is
+# measured until it has been sent; its header only covers the time before.
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        return self.respond(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.record():
+            response = await self.get_response(request)
+        return self.respond(request, response, recorder, start)
+
+    def respond(self, request, response, recorder, start):
+        elapsed = time.perf_counter() - start
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", app;dur={elapsed * 1000:.1f}'
+        )
+        if not response.streaming:
+            self.finish(request, response, recorder, elapsed)
+        elif response.is_async:
+            response.streaming_content = self.astream(request, response, aiter(response.streaming_content), recorder, start)
+        else:
+            response.streaming_content = self.stream(request, response, iter(response.streaming_content), recorder, start)
+        return response
+
+    # the body is generated (and queried) when the server asks for it
+    def stream(self, request, response, content, recorder, start):
+        try:
+            while True:
+                with recorder.record():
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.finish(request, response, recorder, time.perf_counter() - start)
+
+    async def astream(self, request, response, content, recorder, start):
+        try:
+            while True:
+                with recorder.record():
+                    chunk = await anext(content, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.finish(request, response, recorder, time.perf_counter() - start)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.instrumented_view = view_name(request, view_func)
+
+    def finish(self, request, response, recorder, duration):
+        match = request.resolver_match
+        route = f'{request.method} /{match.route}' if match else f'{request.method} <unmatched>'
+        route_metrics.add(route, response.status_code, duration, recorder.duration, recorder.count)
+
+        view = getattr(request, 'instrumented_view', route)
+        # an event stream is open for as long as the client listens
+        live = response.get('Content-Type', '').startswith('text/event-stream')
+        if not live and duration * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 500):
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in the database',
+                request.method, request.get_full_path(), view, duration * 1000, recorder.count, recorder.duration * 1000,
+            )
+        for elapsed, sql in recorder.slow:
+            logger.warning('Slow query in %s: %.1f ms: %s', view, elapsed * 1000, sql)
+        threshold = getattr(settings, 'REPEATED_QUERY_THRESHOLD', 5)
+        for sql, count in recorder.statements.items():
+            if count >= threshold:
+                logger.warning('Repeated query in %s, %d times (possible N+1): %s', view, count, sql)
+
+
+# Pins a client to the primary database after a successful write, so its
+# next reads see it even when they would otherwise go to a lagging replica
+# (see core_app.routers).
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.wrote(request, response):
+            pin_to_primary(request.user.id)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.wrote(request, response):
+            await sync_to_async(pin_to_primary)(request.user.id)
+        return response
+
+    def wrote(self, request, response):
+        if not getattr(settings, 'DATABASE_REPLICAS', []) or request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return False
+        user = getattr(request, 'user', None)
+        return response.status_code < 400 and user is not None and user.is_authenticated
+
+
+# ViewSet.action for DRF viewsets (e.g. IssueViewSet.retrieve), the
+# function's qualified name otherwise.
+def view_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    if view_class is not None:
+        action = actions.get(request.method.lower())
+        return f'{view_class.__name__}.{action}' if action else view_class.__name__
+    return f'{view_func.__module__}.{view_func.__qualname__}'
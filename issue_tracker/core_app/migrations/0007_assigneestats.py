@@ -0,0 +1,51 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_assignee_stats(apps, schema_editor):
+    Issue = apps.get_model('core_app', 'Issue')
+    AssigneeStats = apps.get_model('core_app', 'AssigneeStats')
+    stats = {}
+    rows = (
+        Issue.objects.filter(is_deleted=False, assignee__isnull=False)
+        .values('assignee_id', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        if row['status'] not in ('open', 'in_progress', 'resolved'):
+            continue
+        item = stats.setdefault(row['assignee_id'], AssigneeStats(assignee_id=row['assignee_id']))
+        item.total += row['count']
+        setattr(item, row['status'], getattr(item, row['status']) + row['count'])
+    AssigneeStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core_app', '0006_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssigneeStats',
+            fields=[
+                ('assignee', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='issue_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.IntegerField(default=0)),
+                ('open', models.IntegerField(default=0)),
+                ('in_progress', models.IntegerField(default=0)),
+                ('resolved', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'assignee_stats',
+                'indexes': [models.Index(fields=['-total', 'assignee'], name='assignee_stats_total_idx')],
+            },
+        ),
+        migrations.RunPython(populate_assignee_stats, migrations.RunPython.noop),
+    ]
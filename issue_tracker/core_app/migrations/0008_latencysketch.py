@@ -0,0 +1,58 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:55
+
+from datetime import timezone as dt_timezone
+
+from django.db import migrations, models
+
+from core_app.sketches import LatencyHistogram
+
+
+def populate_latency_sketches(apps, schema_editor):
+    Issue = apps.get_model('core_app', 'Issue')
+    LatencySketch = apps.get_model('core_app', 'LatencySketch')
+    IssueLabel = Issue.labels.through
+    label_map = {}
+    for issue_id, label_id in IssueLabel.objects.values_list('issue_id', 'label_id').iterator():
+        label_map.setdefault(issue_id, []).append(label_id)
+    histograms = {}
+    resolved_qs = Issue.objects.filter(status='resolved', resolved_at__isnull=False, is_deleted=False).values_list(
+        'id', 'assignee_id', 'created_at', 'resolved_at'
+    )
+    for issue_id, assignee_id, created_at, resolved_at in resolved_qs.iterator():
+        seconds = (resolved_at - created_at).total_seconds()
+        day = resolved_at.astimezone(dt_timezone.utc).date()
+        keys = [('all', 0)] + [('label', label_id) for label_id in label_map.get(issue_id, [])]
+        if assignee_id is not None:
+            keys.append(('assignee', assignee_id))
+        for dimension, key in keys:
+            histograms.setdefault((dimension, key, day), LatencyHistogram()).add(seconds)
+    LatencySketch.objects.bulk_create([
+        LatencySketch(dimension=dimension, key=key, day=day, count=histogram.count, sketch=histogram.to_json())
+        for (dimension, key, day), histogram in histograms.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0007_assigneestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('all', 'All'), ('label', 'Label'), ('assignee', 'Assignee')], max_length=20)),
+                ('key', models.BigIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('sketch', models.JSONField(default=dict)),
+            ],
+            options={
+                'db_table': 'latency_sketches',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key', 'day'), name='latency_sketch_unique')],
+            },
+        ),
+        migrations.RunPython(populate_latency_sketches, migrations.RunPython.noop),
+    ]
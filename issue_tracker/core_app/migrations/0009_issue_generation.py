@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0008_latencysketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='generation',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.11 on 2026-10-18 11:05
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0009_issue_generation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['issue', '-id'], name='comments_live_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-id'], name='issues_live_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['status', '-id'], name='issues_live_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['assignee', 'status'], name='issues_live_assignee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='label',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-id'], name='labels_live_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='label',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='labels_name_upper_idx'),
+        ),
+    ]
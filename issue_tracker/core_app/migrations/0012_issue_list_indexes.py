@@ -0,0 +1,31 @@
+# Generated by Django 5.2.11 on 2026-10-18 11:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0011_issue_updated_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-updated_at', '-id'], name='issues_live_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at', '-id'], name='issues_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['status', '-updated_at', '-id'], name='issues_live_status_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['assignee', '-id'], name='issues_live_assignee_id_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.11 on 2026-10-18 11:41
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_sequence_row(apps, schema_editor):
+    apps.get_model('core_app', 'ChangeSequence').objects.using(schema_editor.connection.alias).create(id=1, last_id=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0012_issue_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('issue.created', 'Issue created'), ('issue.updated', 'Issue updated'), ('issue.deleted', 'Issue deleted'), ('issue.labels', 'Issue labels replaced'), ('comment.created', 'Comment added'), ('label.created', 'Label created'), ('label.updated', 'Label updated'), ('label.deleted', 'Label deleted')], max_length=20)),
+                ('issue_id', models.BigIntegerField(blank=True, null=True)),
+                ('label_id', models.BigIntegerField(blank=True, null=True)),
+                ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'change_events',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'change_sequence',
+            },
+        ),
+        migrations.RunPython(create_sequence_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.11 on 2026-10-18 11:57
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+LAST_COMMENT_INDEX = 'issues_live_last_comment_idx'
+
+
+def backfill(apps, schema_editor):
+    Issue = apps.get_model('core_app', 'Issue')
+    Comment = apps.get_model('core_app', 'Comment')
+    live = Comment.objects.filter(issue=OuterRef('pk'), is_deleted=False).order_by().values('issue')
+    Issue.objects.update(
+        comment_count=Coalesce(Subquery(live.annotate(count=Count('id')).values('count')), 0),
+        last_comment_at=Subquery(live.annotate(last=Max('created_at')).values('last')),
+    )
+
+
+# Issues without comments sort as the oldest: NULLs last when descending.
+# PostgreSQL puts NULLs first in a descending index unless told otherwise,
+# SQLite sorts them lowest and has no NULLS LAST in indexes.
+def last_comment_index(connection):
+    if connection.vendor == 'postgresql':
+        return models.Index(F('last_comment_at').desc(nulls_last=True), F('id').desc(), condition=Q(is_deleted=False), name=LAST_COMMENT_INDEX)
+    return models.Index(fields=['-last_comment_at', '-id'], condition=Q(is_deleted=False), name=LAST_COMMENT_INDEX)
+
+
+def add_last_comment_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model('core_app', 'Issue'), last_comment_index(schema_editor.connection))
+
+
+def remove_last_comment_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('core_app', 'Issue'), last_comment_index(schema_editor.connection))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0013_change_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-comment_count', '-id'], name='issues_live_comments_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(add_last_comment_index, remove_last_comment_index),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.11 on 2026-10-18 12:03
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0014_comment_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('issue_id', models.BigIntegerField(db_index=True)),
+                ('data', models.JSONField()),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'comments_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedIssue',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+                ('deleted_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'issues_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedIssueLabel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issue_id', models.BigIntegerField()),
+                ('label_id', models.BigIntegerField(db_index=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'issues_labels_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedLabel',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+                ('deleted_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'labels_archive',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['updated_at'], name='comments_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['updated_at'], name='issues_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='label',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['updated_at'], name='labels_deleted_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivedissuelabel',
+            constraint=models.UniqueConstraint(fields=('issue_id', 'label_id'), name='issues_labels_archive_unique'),
+        ),
+    ]
@@ -1,5 +1,9 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Label(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -10,6 +14,13 @@ class Label(models.Model):
 
     class Meta:
         db_table = 'labels'
+        indexes = [
+            models.Index(fields=['-id'], condition=Q(is_deleted=False), name='labels_live_id_idx'),
+            # name__iexact duplicate checks
+            models.Index(Upper('name'), name='labels_name_upper_idx'),
+            # soft deleted rows by deletion time, for archival
+            models.Index(fields=['updated_at'], condition=Q(is_deleted=True), name='labels_deleted_idx'),
+        ]
 
     def __str__(self):
         return f"{self.id} {self.name}"
@@ -36,12 +47,38 @@ class Issue(models.Model):
     resolved_at = models.DateTimeField(null=True, blank=True)
     is_deleted = models.BooleanField(default=False)
     version = models.IntegerField(default=1)
+    # bumped by changes that do not go through version (comments, labels,
+    # bulk status, admin), together with version it keys cached issue details
+    generation = models.IntegerField(default=0)
+    # live comments, kept up to date by the comment write paths (see
+    # core_app.comment_counters)
+    comment_count = models.PositiveIntegerField(default=0)
+    last_comment_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.id} {self.title} {self.status}"
 
     class Meta:
         db_table = 'issues'
+        # partial indexes, every read path skips soft deleted rows
+        indexes = [
+            models.Index(fields=['-id'], condition=Q(is_deleted=False), name='issues_live_id_idx'),
+            models.Index(fields=['status', '-id'], condition=Q(is_deleted=False), name='issues_live_status_idx'),
+            models.Index(fields=['assignee', 'status'], condition=Q(is_deleted=False), name='issues_live_assignee_idx'),
+            # keyset pages of the issue list, per sort and per equality filter,
+            # read backwards for the ascending sorts
+            models.Index(fields=['-updated_at', '-id'], condition=Q(is_deleted=False), name='issues_live_updated_idx'),
+            models.Index(fields=['-created_at', '-id'], condition=Q(is_deleted=False), name='issues_live_created_idx'),
+            models.Index(fields=['status', '-updated_at', '-id'], condition=Q(is_deleted=False), name='issues_live_status_upd_idx'),
+            models.Index(fields=['assignee', '-id'], condition=Q(is_deleted=False), name='issues_live_assignee_id_idx'),
+            models.Index(fields=['-comment_count', '-id'], condition=Q(is_deleted=False), name='issues_live_comments_idx'),
+            # the last_comment_at sorts use issues_live_last_comment_idx, created
+            # by migration 0014 with NULLs last where the database supports it
+            # MAX(updated_at) watermark of the list ETag, deleted rows included
+            models.Index(fields=['updated_at'], name='issues_updated_at_idx'),
+            # soft deleted rows by deletion time, for archival
+            models.Index(fields=['updated_at'], condition=Q(is_deleted=True), name='issues_deleted_idx'),
+        ]
 
 class Comment(models.Model):
     issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='comments')
@@ -55,4 +92,187 @@ class Comment(models.Model):
         return f"{self.id} {self.issue.title} {self.author.username}"
 
     class Meta:
-        db_table = 'comments'
\ No newline at end of file
+        db_table = 'comments'
+        indexes = [
+            models.Index(fields=['issue', '-id'], condition=Q(is_deleted=False), name='comments_live_issue_idx'),
+            models.Index(fields=['updated_at'], condition=Q(is_deleted=True), name='comments_deleted_idx'),
+        ]
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    file = models.FileField(upload_to='imports/')
+    file_type = models.CharField(max_length=10)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+
+    # rows_processed only moves when a batch commits, resumed jobs skip that many rows
+    rows_processed = models.IntegerField(default=0)
+    imported_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    error_details = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True, default='')
+
+    worker_token = models.CharField(max_length=32, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.id} {self.file_type} {self.status}"
+
+    class Meta:
+        db_table = 'import_jobs'
+
+
+# Per-assignee issue counts (non-deleted issues only) maintained by the issue
+# write paths, see rollups.AssigneeRollup.
+class AssigneeStats(models.Model):
+    assignee = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='issue_stats')
+    total = models.IntegerField(default=0)
+    open = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    resolved = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.assignee_id} {self.total}"
+
+    class Meta:
+        db_table = 'assignee_stats'
+        indexes = [
+            models.Index(fields=['-total', 'assignee'], name='assignee_stats_total_idx'),
+        ]
+
+
+# Resolution latency histogram (see sketches.LatencyHistogram) of the issues
+# resolved on `day`, overall (dimension 'all', key 0) or per label / assignee id.
+class LatencySketch(models.Model):
+    DIMENSION_CHOICES = [
+        ('all', 'All'),
+        ('label', 'Label'),
+        ('assignee', 'Assignee'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.BigIntegerField(default=0)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+    sketch = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.dimension} {self.key} {self.day} {self.count}"
+
+    class Meta:
+        db_table = 'latency_sketches'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key', 'day'], name='latency_sketch_unique'),
+        ]
+
+
+# Append-only log of changes to issues, comments and labels, written in the
+# transaction of the change (see changes.ChangeLog) and read by GET /changes.
+# ids come from ChangeSequence, so they are gap-free and committed in order.
+class ChangeEvent(models.Model):
+    KIND_CHOICES = [
+        ('issue.created', 'Issue created'),
+        ('issue.updated', 'Issue updated'),
+        ('issue.deleted', 'Issue deleted'),
+        ('issue.labels', 'Issue labels replaced'),
+        ('comment.created', 'Comment added'),
+        ('label.created', 'Label created'),
+        ('label.updated', 'Label updated'),
+        ('label.deleted', 'Label deleted'),
+    ]
+
+    id = models.BigIntegerField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    issue_id = models.BigIntegerField(null=True, blank=True)
+    label_id = models.BigIntegerField(null=True, blank=True)
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    # the written values (e.g. status, assignee_id, labels, version)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.id} {self.kind}"
+
+    class Meta:
+        db_table = 'change_events'
+
+
+# Single row holding the last ChangeEvent id handed out. Taking ids locks the
+# row until the transaction ends, so events become visible in id order.
+class ChangeSequence(models.Model):
+    last_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'change_sequence'
+
+
+# Archive tables of core_app.archival: soft deleted issues, comments and
+# labels past the retention window, and the issue / label links of those, are
+# moved here out of the live tables. `data` holds the row's column values by
+# attname, so the live tables can change shape without migrating the archive
+# and a restore fills new columns with their defaults.
+class ArchivedIssue(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    data = models.JSONField()
+    # updated_at of the soft deleted row
+    deleted_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.id} {self.archived_at}"
+
+    class Meta:
+        db_table = 'issues_archive'
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    issue_id = models.BigIntegerField(db_index=True)
+    data = models.JSONField()
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.id} {self.issue_id} {self.archived_at}"
+
+    class Meta:
+        db_table = 'comments_archive'
+
+
+class ArchivedLabel(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    data = models.JSONField()
+    deleted_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.id} {self.archived_at}"
+
+    class Meta:
+        db_table = 'labels_archive'
+
+
+# A row of issues_labels whose issue or label was archived.
+class ArchivedIssueLabel(models.Model):
+    issue_id = models.BigIntegerField()
+    label_id = models.BigIntegerField(db_index=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.issue_id} {self.label_id}"
+
+    class Meta:
+        db_table = 'issues_labels_archive'
+        constraints = [
+            models.UniqueConstraint(fields=['issue_id', 'label_id'], name='issues_labels_archive_unique'),
+        ]
@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+
+from .models import AssigneeStats, Issue
+
+STATUSES = [choice[0] for choice in Issue.STATUS_CHOICES]
+COUNTER_FIELDS = ['total'] + STATUSES
+
+
+# Collects count changes for a write and applies them to assignee_stats in two
+# statements: an insert for missing rows and one UPDATE with a CASE per counter.
+class AssigneeRollup:
+    def __init__(self):
+        self.deltas = {}
+
+    def add(self, assignee_id, status, count=1):
+        if assignee_id is None or status not in STATUSES or not count:
+            return self
+        counters = self.deltas.setdefault(assignee_id, dict.fromkeys(COUNTER_FIELDS, 0))
+        counters['total'] += count
+        counters[status] += count
+        return self
+
+    def remove(self, assignee_id, status, count=1):
+        return self.add(assignee_id, status, -count)
+
+    # old/new are (assignee_id, status) pairs, None when the issue is not counted
+    def move(self, old, new):
+        if old == new:
+            return self
+        if old:
+            self.remove(*old)
+        if new:
+            self.add(*new)
+        return self
+
+    def apply(self):
+        deltas = {
+            assignee_id: counters
+            for assignee_id, counters in self.deltas.items()
+            if any(counters.values())
+        }
+        self.deltas = {}
+        if not deltas:
+            return
+        AssigneeStats.objects.bulk_create(
+            [AssigneeStats(assignee_id=assignee_id) for assignee_id in sorted(deltas)],
+            ignore_conflicts=True,
+        )
+        updates = {}
+        for field in COUNTER_FIELDS:
+            whens = [
+                When(assignee_id=assignee_id, then=Value(counters[field]))
+                for assignee_id, counters in deltas.items() if counters[field]
+            ]
+            if whens:
+                updates[field] = F(field) + Case(*whens, default=Value(0))
+        AssigneeStats.objects.filter(assignee_id__in=list(deltas)).update(**updates)
+
+
+def compute_assignee_counts():
+    counts = {}
+    rows = (
+        Issue.objects.filter(is_deleted=False, assignee__isnull=False)
+        .values('assignee_id', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        if row['status'] not in STATUSES:
+            continue
+        counters = counts.setdefault(row['assignee_id'], dict.fromkeys(COUNTER_FIELDS, 0))
+        counters['total'] += row['count']
+        counters[row['status']] += row['count']
+    return counts
+
+
+def rebuild_assignee_stats():
+    counts = compute_assignee_counts()
+    with transaction.atomic():
+        AssigneeStats.objects.all().delete()
+        AssigneeStats.objects.bulk_create([
+            AssigneeStats(assignee_id=assignee_id, **counters)
+            for assignee_id, counters in counts.items()
+        ], batch_size=1000)
+    return len(counts)
+
+
+# Returns {assignee_id: {'expected': {...}, 'actual': {...}}} for every row
+# that does not match a fresh GROUP BY over issues.
+def find_assignee_stats_drift():
+    expected = compute_assignee_counts()
+    actual = {
+        row['assignee_id']: {field: row[field] for field in COUNTER_FIELDS}
+        for row in AssigneeStats.objects.values('assignee_id', *COUNTER_FIELDS)
+    }
+    empty = dict.fromkeys(COUNTER_FIELDS, 0)
+    drift = {}
+    for assignee_id in set(expected) | set(actual):
+        expected_counters = expected.get(assignee_id, empty)
+        actual_counters = actual.get(assignee_id, empty)
+        if expected_counters != actual_counters:
+            drift[assignee_id] = {'expected': expected_counters, 'actual': actual_counters}
+    return drift
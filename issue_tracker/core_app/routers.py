@@ -0,0 +1,138 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# alias the current request reads from, None reads from the primary
+read_database = ContextVar('read_database', default=None)
+
+PIN_KEY = 'replica-pin:{}'
+# replay lag of a PostgreSQL standby in seconds, 0 when it has replayed
+# everything it received (or is not a standby at all)
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+# Sends reads to the replica picked for the current request (see
+# replica_read) and everything else to the primary. Replicas get their schema
+# through replication, migrations only run on the primary.
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+# Replicas in use and their last measured lag, rechecked at most every
+# REPLICA_CHECK_SECONDS per process. A replica that is unreachable or lags by
+# more than REPLICA_MAX_LAG_SECONDS is skipped until the next check.
+class ReplicaMonitor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_at = None
+        self.lags = {}
+        self.healthy = []
+
+    def healthy_replicas(self):
+        aliases = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not aliases:
+            return []
+        interval = getattr(settings, 'REPLICA_CHECK_SECONDS', 5)
+        if self.checked_at is None or time.monotonic() - self.checked_at >= interval:
+            with self.lock:
+                if self.checked_at is None or time.monotonic() - self.checked_at >= interval:
+                    self.check(aliases)
+        return self.healthy
+
+    def check(self, aliases):
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+        self.lags = {alias: replica_lag(alias) for alias in aliases}
+        self.healthy = [alias for alias, lag in self.lags.items() if lag is not None and lag <= max_lag]
+        self.checked_at = time.monotonic()
+
+    def stats(self):
+        return {
+            'replicas': {alias: {'lag_seconds': lag, 'healthy': alias in self.healthy} for alias, lag in self.lags.items()},
+            'pin_seconds': getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+        }
+
+
+def replica_lag(alias):
+    connection = connections[alias]
+    try:
+        if connection.vendor != 'postgresql':
+            connection.ensure_connection()
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError as e:
+        logger.warning('Replica %s is unavailable: %s', alias, e)
+        return None
+
+
+replica_monitor = ReplicaMonitor()
+
+
+# Read-your-writes: after a client writes, its reads go to the primary for
+# REPLICA_PIN_SECONDS, long enough for the replicas in use to catch up.
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+# Replica for a read by `user`, None for the primary.
+def choose_read_database(user):
+    if not getattr(settings, 'DATABASE_REPLICAS', []):
+        return None
+    if user is not None and user.is_authenticated and is_pinned(user.id):
+        return None
+    replicas = replica_monitor.healthy_replicas()
+    return random.choice(replicas) if replicas else None
+
+
+# Runs a read-only view (a ViewSet method or an async view, the request
+# being its last positional argument) against one replica for the whole
+# request.
+def replica_read(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            token = read_database.set(await sync_to_async(choose_read_database)(args[-1].user))
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                read_database.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = read_database.set(choose_read_database(args[-1].user))
+        try:
+            return view(*args, **kwargs)
+        finally:
+            read_database.reset(token)
+    return wrapper
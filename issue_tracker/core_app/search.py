@@ -0,0 +1,142 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, IntegerField
+from django.db.models.expressions import RawSQL
+
+# Full-text index over issues.title / issues.description.
+#
+# PostgreSQL: a stored generated tsvector column with a GIN index, so every
+# insert/update (create, update, bulk_create in import_csv) keeps it current.
+# SQLite: an external-content FTS5 table kept in sync by triggers.
+# Soft deletes keep the row, list still filters is_deleted=False.
+
+RANK_SCALE = 1000000
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+POSTGRES_INSTALL_SQL = [
+    """
+    ALTER TABLE issues ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS issues_search_vector_gin ON issues USING GIN (search_vector)",
+]
+
+POSTGRES_UNINSTALL_SQL = [
+    "DROP INDEX IF EXISTS issues_search_vector_gin",
+    "ALTER TABLE issues DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5(
+        title, description, content='issues', content_rowid='id', tokenize='porter unicode61'
+    )
+"""
+
+SQLITE_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS issues_fts_ai AFTER INSERT ON issues BEGIN
+        INSERT INTO issues_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS issues_fts_ad AFTER DELETE ON issues BEGIN
+        INSERT INTO issues_fts(issues_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS issues_fts_au AFTER UPDATE OF title, description ON issues BEGIN
+        INSERT INTO issues_fts(issues_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO issues_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+SQLITE_UNINSTALL_SQL = [
+    "DROP TRIGGER IF EXISTS issues_fts_ai",
+    "DROP TRIGGER IF EXISTS issues_fts_ad",
+    "DROP TRIGGER IF EXISTS issues_fts_au",
+    "DROP TABLE IF EXISTS issues_fts",
+]
+
+
+def install_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL_SQL:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+                ['issues_fts_ai', 'issues_fts_ad', 'issues_fts_au'],
+            )
+            had_triggers = cursor.fetchone()[0] == len(SQLITE_TRIGGERS_SQL)
+            cursor.execute(SQLITE_TABLE_SQL)
+            for sql in SQLITE_TRIGGERS_SQL:
+                cursor.execute(sql)
+            if not had_triggers:
+                # SQLite drops triggers when a migration rebuilds the issues
+                # table, so re-index whatever changed while they were missing.
+                cursor.execute("INSERT INTO issues_fts(issues_fts) VALUES ('rebuild')")
+
+
+def uninstall_search_index(conn):
+    statements = {
+        'postgresql': POSTGRES_UNINSTALL_SQL,
+        'sqlite': SQLITE_UNINSTALL_SQL,
+    }.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def ensure_search_index(sender, using='default', **kwargs):
+    # post_migrate hook, see CoreAppConfig.ready
+    from django.db import connections
+    conn = connections[using]
+    if 'issues' in conn.introspection.table_names():
+        install_search_index(conn)
+
+
+def search_terms(keyword):
+    return TOKEN_RE.findall(keyword or '')[:16]
+
+
+# Filters to issues matching every keyword term (word prefix match) and
+# annotates an integer `rank`, higher is more relevant, usable as a cursor position.
+def search_issues(queryset, keyword):
+    terms = search_terms(keyword)
+    if not terms:
+        # still annotated, the list selects `rank`
+        return queryset.none().annotate(rank=RawSQL('0', [], output_field=IntegerField()))
+
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        match = RawSQL(
+            "issues.search_vector @@ to_tsquery('english', %s)",
+            [tsquery], output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f"CAST(ts_rank(issues.search_vector, to_tsquery('english', %s)) * {RANK_SCALE} AS bigint)",
+            [tsquery], output_field=IntegerField(),
+        )
+    elif connection.vendor == 'sqlite':
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        match = RawSQL(
+            "issues.id IN (SELECT rowid FROM issues_fts WHERE issues_fts MATCH %s)",
+            [fts_query], output_field=BooleanField(),
+        )
+        # bm25() is lower-is-better; title weighted over description.
+        rank = RawSQL(
+            f"(SELECT CAST(-bm25(issues_fts, 2.0, 1.0) * {RANK_SCALE} AS INTEGER) "
+            "FROM issues_fts WHERE issues_fts MATCH %s AND rowid = issues.id)",
+            [fts_query], output_field=IntegerField(),
+        )
+    else:
+        qs = queryset.filter(title__icontains=keyword) | queryset.filter(description__icontains=keyword)
+        return qs.annotate(rank=RawSQL('0', [], output_field=IntegerField()))
+
+    return queryset.filter(match).annotate(rank=rank)
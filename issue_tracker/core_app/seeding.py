@@ -0,0 +1,158 @@
+import math
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_issue_list
+from .comment_counters import rebuild_comment_counters
+from .importer import IMPORT_BATCH_SIZE, insert_issue_labels, insert_issues, insert_rows
+from .label_registry import invalidate_labels
+from .latency import rebuild_latency_sketches
+from .models import Comment, Issue, Label
+from .rollups import rebuild_assignee_stats
+
+SEED_PASSWORD = 'password'
+LABEL_NAMES = [
+    'Bug', 'Feature', 'Enhancement', 'Documentation', 'Question', 'Performance', 'Security', 'Ui',
+    'Backend', 'Frontend', 'Api', 'Database', 'Regression', 'Urgent', 'Wontfix', 'Duplicate',
+]
+STATUS_WEIGHTS = {'open': 0.45, 'in_progress': 0.2, 'resolved': 0.35}
+LABELS_PER_ISSUE_WEIGHTS = [0.15, 0.5, 0.25, 0.1]
+UNASSIGNED_SHARE = 0.15
+HISTORY_DAYS = 365
+# resolution time is log-normal around a median of two days
+RESOLUTION_MEDIAN_SECONDS = 2 * 24 * 3600
+RESOLUTION_SIGMA = 1.2
+
+VERBS = ['Fix', 'Improve', 'Add', 'Remove', 'Refactor', 'Investigate', 'Update', 'Document']
+NOUNS = ['login flow', 'search results', 'export', 'import', 'dashboard', 'notifications', 'comment editor',
+         'label picker', 'permissions', 'report page', 'API pagination', 'session handling']
+PLACES = ['on mobile', 'for admins', 'in Firefox', 'after upgrade', 'under load', 'for new users', 'in the API', '']
+SENTENCES = [
+    'Steps to reproduce are attached below.', 'This started after the last deploy.',
+    'Several customers reported it this week.', 'Happens intermittently, roughly one request in ten.',
+    'Expected the page to load in under a second.', 'Logs show a timeout from the database.',
+    'Workaround is to refresh the page.', 'Needs a decision from the product team.',
+]
+
+
+# Zipf-like weights, a few users / labels / issues get most of the activity.
+def zipf_weights(count, exponent):
+    return [1 / math.pow(rank, exponent) for rank in range(1, count + 1)]
+
+
+# Seeds `users` users (password SEED_PASSWORD), up to `labels` labels and
+# `issues` issues with `comments` comments spread over them, then rebuilds
+# the report rollups. Assignees, labels and comments follow Zipf-like
+# popularity, statuses and label counts fixed weights, and created / resolved
+# times the last HISTORY_DAYS days with log-normal resolution times. Rows are
+# written in IMPORT_BATCH_SIZE batches, one transaction each.
+def seed_dataset(users, labels, issues, comments, seed=None, stdout=None):
+    rng = random.Random(seed)
+    now = timezone.now()
+    prefix = f'seed{rng.randrange(10 ** 6)}'
+
+    password = make_password(SEED_PASSWORD)
+    user_ids = []
+    for start in range(0, users, IMPORT_BATCH_SIZE):
+        created = User.objects.bulk_create([
+            User(username=f'{prefix}_user{index}', password=password)
+            for index in range(start, min(start + IMPORT_BATCH_SIZE, users))
+        ])
+        user_ids.extend(user.id for user in created)
+    rng.shuffle(user_ids)
+    log(stdout, f'Created {len(user_ids)} users')
+
+    existing = set(Label.objects.values_list('name', flat=True))
+    names = [name for name in LABEL_NAMES if name not in existing]
+    names += [f'{prefix} label {index}' for index in range(max(labels - len(names), 0))]
+    Label.objects.bulk_create([Label(name=name) for name in names[:labels]])
+    label_ids = list(Label.objects.filter(is_deleted=False).values_list('id', flat=True))
+    rng.shuffle(label_ids)
+    invalidate_labels()
+    log(stdout, f'Created {min(len(names), labels)} labels')
+
+    assignee_weights = zipf_weights(len(user_ids), 1.1)
+    label_weights = zipf_weights(len(label_ids), 1.0)
+    statuses = list(STATUS_WEIGHTS)
+    issue_ids = []
+    for start in range(0, issues, IMPORT_BATCH_SIZE):
+        rows = []
+        label_choices = []
+        for _ in range(start, min(start + IMPORT_BATCH_SIZE, issues)):
+            created_at = now - timedelta(seconds=rng.uniform(0, HISTORY_DAYS * 24 * 3600))
+            issue_status = rng.choices(statuses, weights=STATUS_WEIGHTS.values())[0]
+            resolved_at = None
+            if issue_status == 'resolved':
+                latency = rng.lognormvariate(math.log(RESOLUTION_MEDIAN_SECONDS), RESOLUTION_SIGMA)
+                resolved_at = min(created_at + timedelta(seconds=latency), now)
+            assignee_id = None
+            if user_ids and rng.random() >= UNASSIGNED_SHARE:
+                assignee_id = rng.choices(user_ids, weights=assignee_weights)[0]
+            creator_id = rng.choice(user_ids) if user_ids else None
+            rows.append({
+                'title': f'{rng.choice(VERBS)} {rng.choice(NOUNS)} {rng.choice(PLACES)}'.strip(),
+                'description': ' '.join(rng.sample(SENTENCES, rng.randint(1, 4))),
+                'status': issue_status,
+                'assignee_id': assignee_id,
+                'created_by_id': creator_id,
+                'updated_by_id': creator_id,
+                'created_at': created_at,
+                'updated_at': resolved_at or created_at,
+                'resolved_at': resolved_at,
+            })
+            label_count = min(rng.choices(range(len(LABELS_PER_ISSUE_WEIGHTS)), weights=LABELS_PER_ISSUE_WEIGHTS)[0], len(label_ids))
+            chosen = set()
+            while len(chosen) < label_count:
+                chosen.add(rng.choices(label_ids, weights=label_weights)[0])
+            label_choices.append(chosen)
+        with transaction.atomic():
+            batch_ids = insert_issues(rows)
+            insert_issue_labels([
+                (issue_id, label_id)
+                for issue_id, chosen in zip(batch_ids, label_choices)
+                for label_id in chosen
+            ])
+        issue_ids.extend(batch_ids)
+    log(stdout, f'Created {len(issue_ids)} issues')
+
+    if issue_ids and comments:
+        created_at = dict(Issue.objects.filter(id__in=issue_ids).values_list('id', 'created_at')) if len(issue_ids) <= 50000 else None
+        order = issue_ids[:]
+        rng.shuffle(order)
+        cum_weights = []
+        total = 0.0
+        for weight in zipf_weights(len(order), 0.8):
+            total += weight
+            cum_weights.append(total)
+        for start in range(0, comments, IMPORT_BATCH_SIZE):
+            rows = []
+            for issue_id in rng.choices(order, cum_weights=cum_weights, k=min(IMPORT_BATCH_SIZE, comments - start)):
+                opened = created_at[issue_id] if created_at else now - timedelta(days=HISTORY_DAYS)
+                commented_at = opened + (now - opened) * rng.random()
+                rows.append({
+                    'issue_id': issue_id,
+                    'author_id': rng.choice(user_ids) if user_ids else None,
+                    'comment': ' '.join(rng.sample(SENTENCES, rng.randint(1, 3))),
+                    'created_at': commented_at,
+                    'updated_at': commented_at,
+                })
+            with transaction.atomic():
+                insert_rows(Comment, rows)
+        log(stdout, f'Created {comments} comments')
+
+    rebuild_assignee_stats()
+    rebuild_latency_sketches()
+    rebuild_comment_counters()
+    invalidate_issue_list()
+    log(stdout, 'Rebuilt assignee_stats, latency sketches and comment counters')
+    return {'users': user_ids, 'labels': label_ids, 'issues': issue_ids}
+
+
+def log(stdout, message):
+    if stdout is not None:
+        stdout.write(message)
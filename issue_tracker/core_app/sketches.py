@@ -0,0 +1,80 @@
+import math
+
+# Log-bucketed latency histogram (HDR / DDSketch style). A value lands in bucket
+# ceil(log_gamma(value)), so every quantile is within RELATIVE_ACCURACY of the
+# true value, and two histograms merge by adding bucket counts. Values below
+# MIN_VALUE seconds are kept in a separate zero bucket.
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1.0
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=None, zero_count=0, count=0, total=0.0):
+        self.buckets = buckets or {}
+        self.zero_count = zero_count
+        self.count = count
+        self.total = total
+
+    def add(self, value, count=1):
+        value = max(value, 0.0)
+        if value < MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / LOG_GAMMA)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        return self
+
+    # `other` may hold negative counts (removed samples, see
+    # latency.LatencyChanges), buckets left empty are dropped
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            count += self.buckets.get(index, 0)
+            if count > 0:
+                self.buckets[index] = count
+            else:
+                self.buckets.pop(index, None)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # midpoint of (gamma^(i-1), gamma^i] in relative terms
+                return 2 * GAMMA ** index / (GAMMA + 1)
+        return 2 * GAMMA ** max(self.buckets) / (GAMMA + 1)
+
+    def to_json(self):
+        return {
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        data = data or {}
+        return cls(
+            buckets={int(index): count for index, count in data.get('buckets', {}).items()},
+            zero_count=data.get('zero_count', 0),
+            count=data.get('count', 0),
+            total=data.get('total', 0.0),
+        )
@@ -0,0 +1,206 @@
+import asyncio
+import contextvars
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from rest_framework.utils.encoders import JSONEncoder
+
+from .changes import change_bus, changes_since, latest_change_id
+from .models import Issue
+
+logger = logging.getLogger(__name__)
+
+# events read from change_events per query
+STREAM_BATCH_SIZE = 500
+# how long a disconnected browser waits before reconnecting
+STREAM_RETRY_MS = 3000
+
+
+# Filters of GET /changes/stream: `issue` and `label` take comma-separated
+# ids, `assignee` a user id. Raises ValueError for invalid values.
+def parse_stream_filters(params):
+    def ids(param):
+        return {int(value) for value in params[param].split(',')} if params.get(param) else None
+
+    return {
+        'issue': ids('issue'),
+        'assignee': int(params['assignee']) if params.get('assignee') else None,
+        'label': ids('label'),
+    }
+
+
+# Whether a subscriber with `filters` gets `event`. Issue events match on the
+# issue's current assignee and labels (`issues`, see read_changes) as well as
+# the ones the event set, so a stream also sees an issue being moved away.
+def event_matches(event, filters, issues):
+    if filters['issue'] is not None and event['issue_id'] not in filters['issue']:
+        return False
+    assignee_id, label_ids = issues.get(event['issue_id'], (None, set()))
+    data = event['data']
+    if filters['assignee'] is not None and filters['assignee'] not in (assignee_id, data.get('assignee_id')):
+        return False
+    if filters['label'] is not None:
+        label_ids = label_ids | {int(label_id) for label_id in data.get('labels') or []} | {event['label_id']}
+        if not filters['label'] & label_ids:
+            return False
+    return True
+
+
+# Up to STREAM_BATCH_SIZE events after `since` with the current assignee and
+# label ids of the issues they touch, in three queries.
+def read_changes(since, until=None):
+    events, has_more = changes_since(since, STREAM_BATCH_SIZE, until)
+    issue_ids = {event['issue_id'] for event in events if event['issue_id'] is not None}
+    issues = {}
+    if issue_ids:
+        issues = {
+            issue_id: (assignee_id, set())
+            for issue_id, assignee_id in Issue.objects.filter(id__in=issue_ids).values_list('id', 'assignee_id')
+        }
+        for issue_id, label_id in Issue.labels.through.objects.filter(issue_id__in=issue_ids).values_list('issue_id', 'label_id'):
+            issues[issue_id][1].add(label_id)
+    return events, issues, has_more
+
+
+def format_event(event):
+    data = json.dumps(event, cls=JSONEncoder, separators=(',', ':'), ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {data}\n\n"
+
+
+class Subscriber:
+    def __init__(self, filters, start):
+        self.filters = filters
+        # the hub delivers the events after this id, earlier ones are read
+        # from the database by the stream itself
+        self.start = start
+        self.queue = asyncio.Queue(maxsize=getattr(settings, 'STREAM_QUEUE_SIZE', 1000))
+        self.closed = False
+
+    def put(self, event):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a client this far behind is disconnected, it reconnects with
+            # Last-Event-ID and catches up from the database
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            self.closed = True
+
+
+# Fans the change feed out to the event streams of this process. A single
+# task on the event loop reads new events from change_events, for all
+# subscribers at once, when change_bus reports a commit or otherwise every
+# STREAM_POLL_SECONDS, and queues each subscriber the events it asked for.
+# An idle stream is a queue and a suspended coroutine, not a thread. The task
+# runs while there are subscribers.
+class ChangeHub:
+    def __init__(self):
+        self.subscribers = set()
+        self.cursor = 0
+        self.task = None
+        self.loop = None
+        self.wakeup = None
+
+    def running(self):
+        return self.task is not None and not self.task.done() and self.loop is asyncio.get_running_loop()
+
+    async def subscribe(self, filters):
+        if not self.running():
+            cursor = await sync_to_async(latest_change_id)()
+            if not self.running():
+                self.start(cursor)
+        subscriber = Subscriber(filters, self.cursor)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber not in self.subscribers:
+            return
+        self.subscribers.discard(subscriber)
+        if not self.subscribers:
+            self.stop()
+
+    def start(self, cursor):
+        self.subscribers.clear()
+        self.cursor = cursor
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        change_bus.subscribe(self.notify)
+        # an empty context, the task outlives the request that started it
+        self.task = self.loop.create_task(self.poll(), context=contextvars.Context())
+
+    def stop(self):
+        change_bus.unsubscribe(self.notify)
+        self.task.cancel()
+        self.task = None
+
+    # called by change_bus from the thread that committed
+    def notify(self, last_id):
+        if last_id > self.cursor:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def poll(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), getattr(settings, 'STREAM_POLL_SECONDS', 1))
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                has_more = True
+                while has_more:
+                    events, issues, has_more = await sync_to_async(read_changes)(self.cursor)
+                    if events:
+                        self.publish(events, issues)
+            except DatabaseError as e:
+                logger.warning('Could not read the change feed: %s', e)
+
+    def publish(self, events, issues):
+        self.cursor = events[-1]['id']
+        for subscriber in list(self.subscribers):
+            for event in events:
+                if event['id'] > subscriber.start and event_matches(event, subscriber.filters, issues):
+                    subscriber.put(event)
+
+
+change_hub = ChangeHub()
+
+
+# Body of GET /changes/stream: the events after `since` read from the
+# database, then the ones the hub delivers, as server-sent events. A comment
+# line is sent every STREAM_KEEPALIVE_SECONDS without events so proxies keep
+# the connection open.
+async def stream_changes(filters, since):
+    subscriber = await change_hub.subscribe(filters)
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        cursor = subscriber.start if since is None else since
+        while cursor < subscriber.start:
+            events, issues, _ = await sync_to_async(read_changes)(cursor, subscriber.start)
+            if not events:
+                break
+            cursor = events[-1]['id']
+            for event in events:
+                if event_matches(event, filters, issues):
+                    yield format_event(event)
+
+        keepalive = getattr(settings, 'STREAM_KEEPALIVE_SECONDS', 15)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                return
+            if event['id'] > cursor:
+                cursor = event['id']
+                yield format_event(event)
+    finally:
+        change_hub.unsubscribe(subscriber)
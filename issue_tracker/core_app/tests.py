@@ -1,3 +1,1690 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import re
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern
+from openpyxl import Workbook, load_workbook
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core_app.urls import urlpatterns as core_urlpatterns
+from user_app.urls import urlpatterns as user_urlpatterns
+
+from .archival import archive_deleted
+from .benchmarks import ENDPOINTS, BenchmarkContext, run_endpoint, temporary_benchmark_token
+from .cache import issue_detail_cache
+from .comment_counters import find_comment_counter_drift, refresh_comment_counters
+from .changes import ChangeLog
+from .exporter import EXPORT_COLUMNS, EXPORT_FILE_TYPES, iter_export_rows
+from .middleware import QueryInstrumentationMiddleware, route_metrics
+from .import_jobs import LostLease, claim_job, is_stalled, process_job, recoverable_jobs
+from .importer import IssueImporter
+from .label_registry import label_registry
+from .latency import latency_summary, rebuild_latency_sketches
+from .models import (
+    ArchivedComment, ArchivedIssue, ArchivedIssueLabel, ArchivedLabel, AssigneeStats, ChangeEvent, Comment, ImportJob, Issue, Label,
+    LatencySketch,
+)
+from .rollups import find_assignee_stats_drift
+from .streams import change_hub
+from .search import search_issues
+from .routers import ReplicaRouter, choose_read_database, is_pinned, read_database, replica_monitor
+from .seeding import seed_dataset
+
+
+# Runs the hot read paths of issue_views and label_views and checks with
+# EXPLAIN that every SELECT they issue is answered from an index. The test
+# tables are tiny, so on PostgreSQL sequential scans are disabled first; a
+# plan that still has one means no index can serve the query.
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # older rows, mostly deleted and none of them open or assigned, so
+        # each list clearly reads its page from its partial index rather than
+        # filtering a full one; ANALYZE keeps the plans from depending on what
+        # autovacuum last saw of the table
+        Issue.objects.bulk_create([
+            Issue(title=f'filler {i}', description='d', status=['in_progress', 'resolved'][i % 2], is_deleted=i % 10 != 0)
+            for i in range(2000)
+        ])
+        cls.user = User.objects.create_user('planner', is_staff=True)
+        cls.label = Label.objects.create(name='Bug')
+        cls.issues = [
+            Issue.objects.create(title=f'issue {i}', description='d', assignee=cls.user, status='open')
+            for i in range(5)
+        ]
+        cls.issues[0].labels.add(cls.label)
+        Comment.objects.create(issue=cls.issues[0], author=cls.user, comment='first')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE issues')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def uses_full_scan(self, plan):
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan' in plan
+        return any(line.startswith('SCAN ') and ' USING ' not in line for line in plan.splitlines())
+
+    def capture_plans(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 400, response.data)
+        plans = {}
+        for query in context.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT'):
+                plans[sql] = self.explain(sql)
+        return plans
+
+    def assert_index_scans(self, method, path, data=None, expected_indexes=()):
+        plans = self.capture_plans(method, path, data)
+        self.assertTrue(plans)
+        for sql, plan in plans.items():
+            self.assertFalse(self.uses_full_scan(plan), f'{sql}\n{plan}')
+        all_plans = '\n'.join(plans.values())
+        for index_name in expected_indexes:
+            self.assertIn(index_name, all_plans)
+
+    def test_issue_list(self):
+        self.assert_index_scans('get', '/issues', expected_indexes=['issues_live_id_idx'])
+
+    def test_issue_list_keyset_pages(self):
+        response = self.client.get('/issues?sort=-updated_at&limit=2')
+        self.assert_index_scans('get', response.data['next'], expected_indexes=['issues_live_updated_idx'])
+        response = self.client.get('/issues?status=open&sort=-updated_at&limit=2')
+        self.assert_index_scans('get', response.data['next'], expected_indexes=['issues_live_status_upd_idx'])
+        response = self.client.get(f'/issues?assignee={self.user.id}&limit=2')
+        self.assert_index_scans('get', response.data['next'], expected_indexes=['issues_live_assignee_id_idx'])
+
+    def test_issue_retrieve(self):
+        self.assert_index_scans('get', f'/issues/{self.issues[0].id}', expected_indexes=['comments_live_issue_idx'])
+
+    def test_issue_comments(self):
+        self.assert_index_scans('get', f'/issues/{self.issues[0].id}/comments', expected_indexes=['comments_live_issue_idx'])
+
+    def test_bulk_status(self):
+        ids = [issue.id for issue in self.issues[:3]]
+        self.assert_index_scans('post', '/issues/bulk-status', {'ids': ids, 'status': 'in_progress'})
+
+    def test_label_list(self):
+        self.assert_index_scans('get', '/labels/', expected_indexes=['labels_live_id_idx'])
+
+    def test_label_update(self):
+        expected = ['labels_name_upper_idx'] if connection.vendor == 'postgresql' else []
+        self.assert_index_scans('put', f'/labels/{self.label.id}/', {'name': 'defect'}, expected_indexes=expected)
+
+
+class IssueListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lister')
+        cls.label = Label.objects.create(name='Bug')
+        cls.issues = [
+            Issue.objects.create(title=f'issue {i}', description='d', status='open' if i % 2 else 'resolved', assignee=cls.user if i < 3 else None)
+            for i in range(7)
+        ]
+        cls.issues[1].labels.add(cls.label)
+        cls.issues[4].labels.add(cls.label)
+        # ties on updated_at are broken by id
+        Issue.objects.filter(id__in=[issue.id for issue in cls.issues[2:5]]).update(updated_at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['id'] for row in response.data['results']]
+
+    def walk(self, path):
+        ids, pages, url = [], [], path
+        while url:
+            response = self.client.get(url)
+            pages.append(response.data)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids, pages
+
+    def test_sorted_pages(self):
+        for sort in ['-updated_at', 'updated_at', '-created_at', 'created_at', 'id']:
+            expected = list(Issue.objects.order_by(sort, sort.replace('updated_at', 'id').replace('created_at', 'id')).values_list('id', flat=True))
+            ids, pages = self.walk(f'/issues?sort={sort}&limit=2')
+            self.assertEqual(ids, expected, sort)
+            previous = self.client.get(pages[-1]['previous'])
+            self.assertEqual(previous.data['results'], pages[-2]['results'], sort)
+            self.assertIsNone(pages[0]['previous'])
+
+    def test_filters(self):
+        ids = lambda issues: sorted((issue.id for issue in issues), reverse=True)
+        self.assertEqual(self.ids('/issues?status=open'), ids(self.issues[1::2]))
+        self.assertEqual(self.ids('/issues?status=open,resolved'), ids(self.issues))
+        self.assertEqual(self.ids(f'/issues?assignee={self.user.id}'), ids(self.issues[:3]))
+        self.assertEqual(self.ids('/issues?assignee=none'), ids(self.issues[3:]))
+        self.assertEqual(self.ids(f'/issues?label={self.label.id}'), ids([self.issues[1], self.issues[4]]))
+        self.assertEqual(self.ids('/issues?updated_before=2026-01-02'), ids(self.issues[2:5]))
+        self.assertEqual(self.ids('/issues?updated_after=2026-01-01T00:00:01Z&status=open'), ids([self.issues[1], self.issues[5]]))
+
+    def test_facets(self):
+        response = self.client.get('/issues?facets=status,label,assignee&updated_after=2020-01-01')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['facets'], {
+            'status': {'open': 3, 'in_progress': 0, 'resolved': 4},
+            'label': [{'id': self.label.id, 'name': 'Bug', 'count': 2}],
+            'assignee': [{'id': None, 'username': None, 'count': 4}, {'id': self.user.id, 'username': 'lister', 'count': 3}],
+        })
+        response = self.client.get(f'/issues?facets=status&label={self.label.id}')
+        self.assertEqual(response.data['facets'], {'status': {'open': 1, 'in_progress': 0, 'resolved': 1}})
+        self.assertNotIn('facets', self.client.get('/issues').data)
+
+    def test_facets_are_cached_per_filter(self):
+        self.client.get('/issues?facets=status&status=open,resolved')
+        Issue.objects.filter(id=self.issues[0].id).update(status='open')
+        # the same filter written differently, with another page
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/issues?status=resolved,open&facets=status&limit=2')
+        self.assertEqual(response.data['facets']['status'], {'open': 3, 'in_progress': 0, 'resolved': 4})
+        self.assertEqual(len(context.captured_queries), 2)
+        with self.settings(FACETS_CACHE_SECONDS=0):
+            response = self.client.get('/issues?facets=status')
+        self.assertEqual(response.data['facets']['status'], {'open': 4, 'in_progress': 0, 'resolved': 3})
+
+    def test_facets_etag(self):
+        response = self.client.get('/issues?facets=status')
+        self.assertEqual(self.client.get('/issues?facets=status', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        cache.clear()
+        Issue.objects.filter(id=self.issues[0].id).update(status='open')
+        self.assertEqual(self.client.get('/issues?facets=status', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_facets_not_modified_counts_nothing(self):
+        etag = self.client.get('/issues?facets=status,label')['ETag']
+        with mock.patch('core_app.issue_views.issue_facets') as issue_facets:
+            response = self.client.get('/issues?facets=status,label', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        issue_facets.assert_not_called()
+        # counted again without a write, the ETag changes with the counts' stamp
+        cache.clear()
+        response = self.client.get('/issues?facets=status,label', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        with self.settings(FACETS_CACHE_SECONDS=0):
+            etag = self.client.get('/issues?facets=status')['ETag']
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/issues?facets=status', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in context.captured_queries))
+
+    def test_comment_counters(self):
+        etag = self.client.get('/issues')['ETag']
+        for issue, count in [(self.issues[5], 2), (self.issues[2], 1)]:
+            for _ in range(count):
+                self.assertEqual(self.client.post(f'/issues/{issue.id}/comments', {'comment': 'c'}, format='json').status_code, 201)
+        self.assertNotEqual(self.client.get('/issues', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        rows = {row['id']: row for row in self.client.get('/issues').data['results']}
+        last_comment = Comment.objects.filter(issue=self.issues[5]).latest('id')
+        self.assertEqual(rows[self.issues[5].id]['comment_count'], 2)
+        self.assertEqual(rows[self.issues[5].id]['last_comment_at'], last_comment.created_at)
+        self.assertEqual((rows[self.issues[0].id]['comment_count'], rows[self.issues[0].id]['last_comment_at']), (0, None))
+        detail = self.client.get(f'/issues/{self.issues[5].id}').data['issue']
+        self.assertEqual((detail['comment_count'], detail['last_comment_at']), (2, rows[self.issues[5].id]['last_comment_at']))
+
+        # issues without comments sort as the oldest, the pages walk both
+        # ways across them
+        commented = [self.issues[5].id, self.issues[2].id]
+        others = sorted(issue.id for issue in self.issues if issue.id not in commented)
+        expected = {
+            '-last_comment_at': commented[::-1] + others[::-1],
+            'last_comment_at': others + commented,
+            '-comment_count': commented + others[::-1],
+        }
+        for sort, ids in expected.items():
+            walked, pages = self.walk(f'/issues?sort={sort}&limit=2')
+            self.assertEqual(walked, ids, sort)
+            back, url = [], pages[-1]['previous']
+            while url:
+                page = self.client.get(url).data
+                back = [row['id'] for row in page['results']] + back
+                url = page['previous']
+            self.assertEqual(back, ids[:len(back)], sort)
+            self.assertEqual(len(back), len(ids) - len(pages[-1]['results']), sort)
+
+    def test_rebuild_comment_counters(self):
+        Comment.objects.bulk_create([Comment(issue=self.issues[1], comment='imported') for _ in range(3)])
+        self.assertEqual(find_comment_counter_drift(), [self.issues[1].id])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_comment_counters', '--check', stdout=StringIO())
+        call_command('rebuild_comment_counters', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(find_comment_counter_drift(), [])
+        self.assertEqual(Issue.objects.get(id=self.issues[1].id).comment_count, 3)
+
+    def test_invalid_filters(self):
+        for query in ['status=closed', 'assignee=me', 'label=x', 'created_after=yesterday', 'sort=title', 'facets=priority']:
+            response = self.client.get(f'/issues?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('Invalid filters', response.data['error'])
+
+
+class IssueSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('searcher')
+        cls.in_description = Issue.objects.create(title='Crash on start', description='happens after login', status='open')
+        cls.in_title = Issue.objects.create(title='Login page broken', description='the form does not load', status='open')
+        cls.unrelated = Issue.objects.create(title='Typo', description='footer text', status='open')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, keyword, **params):
+        response = self.client.get('/issues', {'keyword': keyword, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results']
+
+    def ids(self, keyword):
+        return [row['id'] for row in self.search(keyword)]
+
+    def test_matches_are_ranked(self):
+        results = self.search('login')
+        self.assertEqual([row['id'] for row in results], [self.in_title.id, self.in_description.id])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        # every term has to match, the last one as a prefix
+        self.assertEqual(self.ids('page brok'), [self.in_title.id])
+        self.assertEqual(self.ids('login nothing'), [])
+        self.assertEqual(self.ids('!!'), [])
+
+    def test_index_follows_writes(self):
+        created = self.client.post('/issues', {'title': 'Export timeout', 'description': 'large files', 'status': 'open'}, format='json').data['issue_id']
+        self.assertEqual(self.ids('timeout'), [created])
+
+        self.client.patch(f'/issues/{created}', {'title': 'Export slow', 'version': 1}, format='json')
+        self.assertEqual(self.ids('timeout'), [])
+        self.assertEqual(self.ids('slow'), [created])
+        self.client.patch(f'/issues/{created}', {'description': 'only with spreadsheets', 'version': 2}, format='json')
+        self.assertEqual(self.ids('spreadsheets'), [created])
+        self.assertEqual(self.ids('large'), [])
+
+        self.client.delete(f'/issues/{created}')
+        self.assertEqual(self.ids('slow'), [])
+
+        Issue.objects.filter(id=created).delete()
+        self.assertEqual(Issue.objects.filter(id__in=search_issues(Issue.objects.all(), 'slow')).count(), 0)
+
+    def test_equal_ranks_page_without_gaps(self):
+        same = [Issue.objects.create(title='Duplicate report', description='same text', status='open') for _ in range(7)]
+        expected = sorted((issue.id for issue in same), reverse=True)
+        ids, url = [], '/issues?keyword=duplicate&limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(len({row['rank'] for row in response.data['results']}), 1)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, expected)
+
+    def test_icontains_fallback(self):
+        # databases without a full-text index match substrings, unranked
+        with mock.patch.object(connection, 'vendor', 'other'):
+            matches = search_issues(Issue.objects.all(), 'LOGIN')
+            self.assertEqual(sorted(matches.values_list('id', flat=True)), [self.in_description.id, self.in_title.id])
+            self.assertEqual(set(matches.values_list('rank', flat=True)), {0})
+
+
+class IssueImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer')
+        cls.assignee = User.objects.create_user('John_Doe')
+        cls.labels = [Label.objects.create(name=name) for name in ['Bug', 'Urgent']]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def csv_file(self, *rows, header='title,description,status,labels,assignee'):
+        return SimpleUploadedFile('issues.csv', '\n'.join([header, *rows]).encode('utf-8'))
+
+    def xlsx_file(self, *rows):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['title', 'description', 'status', 'labels', 'assignee'])
+        for row in rows:
+            sheet.append(list(row))
+        content = BytesIO()
+        workbook.save(content)
+        return SimpleUploadedFile('issues.xlsx', content.getvalue())
+
+    def upload(self, upload):
+        return self.client.post('/issues/import', {'file': upload}, format='multipart')
+
+    def imported(self):
+        return {
+            issue.title: (issue.description, issue.status, issue.assignee_id, sorted(issue.labels.values_list('name', flat=True)))
+            for issue in Issue.objects.order_by('id')
+        }
+
+    def test_csv(self):
+        response = self.upload(self.csv_file(
+            '"Login bug","Cannot login, with email",open,"bug, urgent",john_doe',
+            'Footer,Typo in footer,resolved,Bug,',
+        ))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.imported(), {
+            'Login bug': ('Cannot login, with email', 'open', self.assignee.id, ['Bug', 'Urgent']),
+            'Footer': ('Typo in footer', 'resolved', None, ['Bug']),
+        })
+        self.assertEqual(find_assignee_stats_drift(), {})
+        self.assertEqual(AssigneeStats.objects.get(assignee=self.assignee).open, 1)
+        self.assertEqual(ChangeEvent.objects.filter(kind='issue.created').count(), 2)
+
+    def test_xlsx(self):
+        response = self.upload(self.xlsx_file(
+            ('Login bug', 'Cannot login', 'in_progress', 'urgent', 'JOHN_DOE'),
+            (None, None, None, None, None),
+            ('Footer', 'Typo', 'open', 'bug,urgent', None),
+        ))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.imported(), {
+            'Login bug': ('Cannot login', 'in_progress', self.assignee.id, ['Urgent']),
+            'Footer': ('Typo', 'open', None, ['Bug', 'Urgent']),
+        })
+        self.assertEqual(find_assignee_stats_drift(), {})
+
+    def test_bad_rows_reject_the_whole_file(self):
+        response = self.upload(self.csv_file(
+            'Fine,d,open,bug,',
+            'Label,d,open,"bug,missing",',
+            'Assignee,d,open,bug,nobody',
+            'Status,d,closed,bug,',
+            ',d,open,bug,',
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['error'] for error in response.data['error_details']], [
+            'Please provide valid label name missing for row 1',
+            'Please provide valid assignee name nobody for row 2',
+            'Please provide valid status for row 3',
+            'Please provide title for row 4',
+        ])
+        self.assertFalse(Issue.objects.exists())
+        self.assertFalse(AssigneeStats.objects.exists())
+        self.assertFalse(ChangeEvent.objects.filter(kind='issue.created').exists())
+
+    def test_rows_before_a_bad_batch_are_written_then_rolled_back(self):
+        rows = [{'title': f'row {i}', 'description': 'd', 'status': 'open', 'labels': 'bug'} for i in range(3)]
+        rows.append({'title': 'bad', 'description': 'd', 'status': 'open', 'labels': 'bug', 'assignee': 'nobody'})
+        with transaction.atomic():
+            importer = IssueImporter(self.user, batch_size=2).run(rows)
+            self.assertEqual((importer.imported, importer.rows_seen, len(importer.error_details)), (2, 4, 1))
+            transaction.set_rollback(True)
+        self.assertFalse(Issue.objects.exists())
+
+    def test_change_events_are_written_per_batch(self):
+        rows = [{'title': f'row {i}', 'description': 'd', 'status': 'open', 'labels': 'bug'} for i in range(5)]
+        importer = IssueImporter(self.user, batch_size=2)
+        written = []
+        for start_index, batch in importer.iter_batches(rows):
+            importer.import_batch(start_index, batch)
+            self.assertEqual(importer.changes.events, [])
+            written.append(ChangeEvent.objects.filter(kind='issue.created').count())
+        self.assertEqual(written, [2, 4, 5])
+
+    def test_invalid_files(self):
+        for upload in [
+            self.csv_file('Login,d,open,bug', header='title,description,status'),
+            self.csv_file('Login,d,open,,'),
+            self.csv_file(),
+            SimpleUploadedFile('issues.txt', b'title'),
+        ]:
+            response = self.upload(upload)
+            self.assertEqual(response.status_code, 400, upload.name)
+        self.assertFalse(Issue.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='import-jobs-'), IMPORT_JOB_LEASE_SECONDS=60)
+class ImportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('uploader')
+        cls.other = User.objects.create_user('someone')
+        cls.staff = User.objects.create_user('operator', is_staff=True)
+        Label.objects.create(name='Bug')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_job(self, rows=5, bad=(), **fields):
+        lines = ['title,description,status,labels'] + [
+            f'row {i},d,open,{"missing" if i in bad else "bug"}' for i in range(rows)
+        ]
+        upload = SimpleUploadedFile('issues.csv', '\n'.join(lines).encode('utf-8'))
+        return ImportJob.objects.create(file=upload, file_type='csv', created_by=self.user, **fields)
+
+    def age(self, job, seconds=120):
+        past = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+        ImportJob.objects.filter(id=job.id).update(created_at=past, heartbeat_at=past if job.heartbeat_at else None)
+
+    def test_lease(self):
+        job = self.create_job()
+        token = claim_job(job.id)
+        self.assertIsNotNone(token)
+        # the worker holds the lease while its heartbeat is fresh
+        self.assertIsNone(claim_job(job.id))
+        job.refresh_from_db()
+        self.assertFalse(is_stalled(job))
+
+        self.age(job)
+        job.refresh_from_db()
+        self.assertTrue(is_stalled(job))
+        takeover = claim_job(job.id)
+        self.assertNotIn(takeover, [None, token])
+
+        # the first worker notices at its next batch, which is rolled back
+        with self.assertRaises(LostLease):
+            process_job(job, token)
+        self.assertFalse(Issue.objects.exists())
+
+        process_job(ImportJob.objects.get(id=job.id), takeover)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed, job.imported_count), ('completed', 5, 5))
+        self.assertFalse(job.file.storage.exists(job.file.name))
+
+    def test_errors_are_reported_per_row(self):
+        job = self.create_job(rows=4, bad={1, 3})
+        process_job(job, claim_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.imported_count, job.error_count), ('completed', 2, 2))
+        self.assertEqual(sorted(Issue.objects.values_list('title', flat=True)), ['row 0', 'row 2'])
+        self.assertEqual(len(job.error_details), 2)
+
+    def test_resumes_after_the_last_committed_batch(self):
+        # a worker died after committing the first two rows
+        job = self.create_job(
+            rows=5, status='running', rows_processed=2, imported_count=2,
+            heartbeat_at=datetime.now(timezone.utc),
+        )
+        Issue.objects.bulk_create([Issue(title=f'row {i}', description='d', status='open') for i in range(2)])
+        self.age(job)
+        self.assertEqual(list(recoverable_jobs().values_list('id', flat=True)), [job.id])
+
+        process_job(job, claim_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed, job.imported_count), ('completed', 5, 5))
+        self.assertEqual(sorted(Issue.objects.values_list('title', flat=True)), [f'row {i}' for i in range(5)])
+
+    def test_status(self):
+        job = self.create_job()
+        response = self.client.get(f'/issues/import/{job.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['job_id'], response.data['status']), (job.id, 'queued'))
+
+        # only the owner and staff see a job
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(f'/issues/import/{job.id}').status_code, 404)
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(f'/issues/import/{job.id}').status_code, 200)
+        self.assertEqual(self.client.get('/issues/import/999999').status_code, 404)
+
+    def test_polling_a_stalled_job_resumes_it(self):
+        job = self.create_job()
+        with mock.patch('core_app.issue_views.resume_job') as resume:
+            self.client.get(f'/issues/import/{job.id}')
+            resume.assert_not_called()
+            self.age(job)
+            self.client.get(f'/issues/import/{job.id}')
+            resume.assert_called_once_with(job.id)
+
+
+class AssigneeStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lead')
+        cls.other = User.objects.create_user('helper')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_no_drift(self):
+        self.assertEqual(find_assignee_stats_drift(), {})
+
+    def version(self, issue_id):
+        return Issue.objects.get(id=issue_id).version
+
+    def test_every_write_path_keeps_the_rollup_exact(self):
+        ids = [
+            self.client.post('/issues', {'title': f'issue {i}', 'description': 'd', 'assignee_id': self.user.id, 'status': status}, format='json').data['issue_id']
+            for i, status in enumerate(['open', 'resolved', 'open'])
+        ]
+        self.assert_no_drift()
+        self.assertEqual(AssigneeStats.objects.get(assignee=self.user).total, 3)
+
+        # reassign, change status, both at once
+        self.client.patch(f'/issues/{ids[0]}', {'version': self.version(ids[0]), 'assignee_id': self.other.id}, format='json')
+        self.assert_no_drift()
+        self.client.patch(f'/issues/{ids[1]}', {'version': self.version(ids[1]), 'status': 'in_progress'}, format='json')
+        self.assert_no_drift()
+        self.client.patch(f'/issues/{ids[2]}', {'version': self.version(ids[2]), 'assignee_id': self.other.id, 'status': 'in_progress'}, format='json')
+        self.assert_no_drift()
+
+        response = self.client.post('/issues/bulk', [
+            {'title': 'bulk a', 'description': 'd', 'assignee_id': self.other.id, 'status': 'resolved'},
+            {'title': 'bulk b', 'description': 'd', 'assignee_id': 404},
+            {'title': 'bulk c', 'description': 'd', 'assignee_id': self.user.id},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        ids += [result['issue_id'] for result in response.data['results'] if 'issue_id' in result]
+        self.assert_no_drift()
+
+        response = self.client.patch('/issues/bulk', [
+            {'id': ids[0], 'version': self.version(ids[0]), 'assignee_id': None},
+            {'id': ids[3], 'version': self.version(ids[3]), 'assignee_id': self.user.id, 'status': 'open'},
+            {'id': ids[4], 'version': 999, 'status': 'in_progress'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_no_drift()
+
+        self.client.post('/issues/bulk-status', {'ids': ids, 'status': 'resolved'}, format='json')
+        self.assert_no_drift()
+        self.assertEqual(AssigneeStats.objects.get(assignee=self.user).resolved, 3)
+
+        self.client.delete(f'/issues/{ids[3]}')
+        self.client.delete(f'/issues/{ids[2]}')
+        self.assert_no_drift()
+        self.assertEqual(
+            dict(AssigneeStats.objects.values_list('assignee__username', 'total')),
+            {'lead': 2, 'helper': 0},
+        )
+
+
+class IssueBulkCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('creator')
+        cls.assignee = User.objects.create_user('fixer')
+        cls.labels = [Label.objects.create(name=name) for name in ['Bug', 'UI']]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, items):
+        return self.client.post('/issues/bulk', items, format='json')
+
+    def test_valid_items_are_created_and_errors_reported_per_index(self):
+        response = self.post([
+            {'title': 'first', 'description': 'd', 'assignee_id': self.assignee.id, 'labels': [self.labels[1].id, self.labels[0].id, self.labels[1].id]},
+            {'title': 'no description'},
+            {'title': 'unknown', 'description': 'd', 'assignee_id': 999999},
+            {'title': 'second', 'description': 'd', 'status': 'resolved'},
+            {'title': 'bad labels', 'description': 'd', 'labels': [999999, 'x']},
+            {'title': 'bad status', 'description': 'd', 'status': 'closed'},
+            {'title': 'extra', 'description': 'd', 'priority': 'high'},
+            {'title': 'x' * 256, 'description': 'd'},
+            ['not', 'an', 'object'],
+        ])
+        self.assertEqual(response.status_code, 201)
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], list(range(9)))
+        self.assertEqual([result.get('error') for result in results], [
+            None,
+            'Please provide title, description',
+            'Assignee with id 999999 does not exist',
+            None,
+            "lable with ids [999999, 'x'] does not exist",
+            'Invalid status value choose from open,in_progress,resolved',
+            "Unknown fields ['priority']",
+            'Title is too long',
+            'Please provide the issue as an object',
+        ])
+        first = Issue.objects.get(id=results[0]['issue_id'])
+        second = Issue.objects.get(id=results[3]['issue_id'])
+        self.assertEqual((first.title, first.status, first.assignee_id, first.created_by_id), ('first', 'open', self.assignee.id, self.user.id))
+        self.assertEqual(sorted(first.labels.values_list('name', flat=True)), ['Bug', 'UI'])
+        self.assertEqual((second.status, second.assignee_id, second.labels.count()), ('resolved', None, 0))
+        self.assertEqual(Issue.objects.count(), 2)
+        self.assertEqual(find_assignee_stats_drift(), {})
+
+    def test_only_errors(self):
+        response = self.post([{'title': 'no description'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['results'], [{'index': 0, 'error': 'Please provide title, description'}])
+        self.assertFalse(Issue.objects.exists())
+
+    def test_limits(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post({'title': 'one', 'description': 'd'}).status_code, 400)
+        with mock.patch('core_app.issue_views.BULK_MAX_ITEMS', 2):
+            response = self.post([{'title': f'issue {i}', 'description': 'd'} for i in range(3)])
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], 'Please provide at most 2 issues per request')
+            self.assertEqual(self.post([{'title': f'issue {i}', 'description': 'd'} for i in range(2)]).status_code, 201)
+        self.assertEqual(Issue.objects.count(), 2)
+
+
+class IssueBulkUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('editor')
+        cls.assignee = User.objects.create_user('fixer')
+        cls.labels = [Label.objects.create(name=name) for name in ['Bug', 'UI', 'Docs']]
+        cls.issues = [Issue.objects.create(title=f'issue {i}', description='d', status='open') for i in range(3)]
+        cls.issues[0].labels.set(cls.labels[:2])
+        cls.deleted = Issue.objects.create(title='deleted', description='d', is_deleted=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def patch(self, items):
+        return self.client.patch('/issues/bulk', items, format='json')
+
+    def test_mixed_results(self):
+        first, second, third = self.issues
+        response = self.patch([
+            {'id': first.id, 'version': first.version, 'title': 'renamed', 'assignee_id': self.assignee.id},
+            {'id': second.id, 'version': second.version + 1, 'status': 'in_progress'},
+            {'id': third.id, 'version': third.version, 'priority': 'high'},
+            {'id': self.deleted.id, 'version': 1, 'status': 'in_progress'},
+            {'id': first.id, 'version': first.version, 'status': 'in_progress'},
+            {'id': third.id, 'version': third.version, 'status': 'in_progress'},
+            'not an object',
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'index': 0, 'issue_id': first.id, 'version': first.version + 1},
+            {'index': 1, 'issue_id': second.id, 'error': 'Conflict: issue already updated by another user', 'status': 409},
+            {'index': 2, 'error': "Unknown fields ['priority']", 'status': 400},
+            {'index': 3, 'issue_id': self.deleted.id, 'error': 'Issue not found', 'status': 404},
+            {'index': 4, 'error': f'Issue {first.id} is listed more than once', 'status': 400},
+            {'index': 5, 'issue_id': third.id, 'version': third.version + 1},
+            {'index': 6, 'error': 'Please provide the issue as an object', 'status': 400},
+        ])
+        self.assertEqual(
+            list(Issue.objects.filter(id__in=[issue.id for issue in self.issues]).order_by('id').values_list('title', 'status', 'assignee_id', 'version')),
+            [('renamed', 'open', self.assignee.id, 2), ('issue 1', 'open', None, 1), ('issue 2', 'in_progress', None, 2)],
+        )
+
+    def test_only_conflicts(self):
+        issue = self.issues[1]
+        response = self.patch([{'id': issue.id, 'version': issue.version + 1, 'status': 'in_progress'}])
+        self.assertEqual(response.status_code, 409)
+        response = self.patch([{'id': issue.id, 'version': issue.version, 'estimate': 3}, {'id': self.deleted.id, 'version': 1}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_labels_are_replaced(self):
+        first, second = self.issues[:2]
+        response = self.patch([
+            {'id': first.id, 'version': first.version, 'labels': [self.labels[2].id, self.labels[2].id]},
+            {'id': second.id, 'version': second.version, 'labels': [self.labels[0].id, self.labels[1].id]},
+            {'id': self.issues[2].id, 'version': 1, 'labels': [999999]},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][2]['error'], 'lable with ids [999999] does not exist')
+        self.assertEqual(list(first.labels.values_list('name', flat=True)), ['Docs'])
+        self.assertEqual(sorted(second.labels.values_list('name', flat=True)), ['Bug', 'UI'])
+        self.assertFalse(self.issues[2].labels.exists())
+        # an empty list clears the labels, a patch without labels keeps them
+        self.patch([
+            {'id': first.id, 'version': 2, 'labels': []},
+            {'id': second.id, 'version': 2, 'title': 'kept labels'},
+        ])
+        self.assertFalse(first.labels.exists())
+        self.assertEqual(second.labels.count(), 2)
+
+    def test_limits(self):
+        self.assertEqual(self.patch([]).status_code, 400)
+        self.assertEqual(self.patch({'id': self.issues[0].id}).status_code, 400)
+        with mock.patch('core_app.issue_views.BULK_MAX_ITEMS', 2):
+            response = self.patch([{'id': issue.id, 'version': 1} for issue in self.issues])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Issue.objects.filter(version=1, is_deleted=False).count(), 3)
+
+
+class IssueExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter')
+        cls.assignee = User.objects.create_user('fixer')
+        cls.labels = [Label.objects.create(name=name) for name in ['Bug', 'UI']]
+        cls.issues = [
+            Issue.objects.create(title=f'issue {i}', description=f'line one, "quoted"\nline {i}', status='open', assignee=cls.assignee if i % 2 else None)
+            for i in range(6)
+        ]
+        cls.issues[1].labels.set(cls.labels)
+        cls.issues[4].labels.add(cls.labels[1])
+        # labelled but deleted, inside the id range of the live issues
+        cls.issues[2].labels.add(cls.labels[0])
+        Issue.objects.filter(id=cls.issues[2].id).update(is_deleted=True)
+        cls.live = [issue for issue in cls.issues if issue is not cls.issues[2]]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, file_type, **params):
+        response = self.client.get('/issues/export', {'file_type': file_type, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], EXPORT_FILE_TYPES[file_type])
+        return b''.join(response.streaming_content)
+
+    def expected(self, issue):
+        labels = {self.issues[1].id: 'Bug,UI', self.issues[4].id: 'UI'}.get(issue.id, '')
+        return (issue.id, issue.title, issue.description, issue.status, labels, issue.assignee.username if issue.assignee else '')
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(self.export('csv').decode('utf-8'))))
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual(
+            [(int(row['id']), row['title'], row['description'], row['status'], row['labels'], row['assignee']) for row in rows],
+            [self.expected(issue) for issue in reversed(self.live)],
+        )
+        self.assertEqual(rows[0]['resolved_at'], '')
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('ndjson').decode('utf-8').splitlines()]
+        self.assertEqual(
+            [(row['id'], row['title'], row['description'], row['status'], row['labels'], row['assignee'] or '') for row in rows],
+            [self.expected(issue) for issue in reversed(self.live)],
+        )
+        self.assertEqual(rows[0]['version'], 1)
+        self.assertIsNone(rows[0]['resolved_at'])
+
+    def test_xlsx(self):
+        sheet = load_workbook(BytesIO(self.export('xlsx')), read_only=True).active
+        header, *rows = list(sheet.values)
+        self.assertEqual(list(header), EXPORT_COLUMNS)
+        self.assertEqual(
+            [(row[0], row[1], row[2], row[3], row[4] or '', row[5] or '') for row in rows],
+            [self.expected(issue) for issue in reversed(self.live)],
+        )
+
+    def test_filters_and_file_type(self):
+        rows = self.export('ndjson', keyword='issue 4').decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in rows], [self.issues[4].id])
+        self.assertEqual(self.client.get('/issues/export', {'file_type': 'pdf'}).status_code, 400)
+
+    def test_label_chunks(self):
+        queryset = Issue.objects.filter(is_deleted=False)
+        expected = [self.expected(issue) for issue in reversed(self.live)]
+        # dense chunks read their id range, sparse ones bind the ids; neither
+        # picks up the labels of the deleted issue in between
+        for ids, chunk_size in [(None, 2), (None, 100), ([self.issues[0].id, self.issues[4].id], 2)]:
+            chunk_queryset = queryset.filter(id__in=ids) if ids else queryset
+            with CaptureQueriesContext(connection) as context:
+                rows = list(iter_export_rows(chunk_queryset, chunk_size=chunk_size))
+            self.assertEqual(
+                [(row['id'], row['title'], row['description'], row['status'], row['labels'], row['assignee'] or '') for row in rows],
+                [row for row in expected if not ids or row[0] in ids],
+            )
+            label_queries = [query['sql'] for query in context.captured_queries if 'issues_labels' in query['sql']]
+            self.assertEqual(len(label_queries), -(-len(rows) // chunk_size))
+            for sql in label_queries:
+                self.assertEqual(' IN (' in sql, bool(ids), sql)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='export-round-trip-'))
+    def test_round_trip(self):
+        def snapshot(issues):
+            return sorted(
+                (issue.title, issue.description, issue.status, issue.assignee_id, tuple(sorted(label.name for label in issue.labels.all())))
+                for issue in issues
+            )
+
+        # the importer requires labels on every row
+        for issue in self.live:
+            issue.labels.add(self.labels[0])
+        before = snapshot(Issue.objects.filter(is_deleted=False))
+        for file_type in ['csv', 'xlsx']:
+            exported = self.export(file_type)
+            response = self.client.post('/issues/import', {'file': SimpleUploadedFile(f'issues.{file_type}', exported)}, format='multipart')
+            self.assertEqual(response.status_code, 201, response.data)
+            imported = Issue.objects.exclude(id__in=[issue.id for issue in self.issues])
+            self.assertEqual(snapshot(imported), before, file_type)
+            imported.delete()
+
+
+class IssueCommentPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('commenter')
+        cls.issue = Issue.objects.create(title='discussed', description='d', status='open')
+        cls.comments = Comment.objects.bulk_create([
+            Comment(issue=cls.issue, author=cls.user, comment=f'comment {i}') for i in range(7)
+        ])
+        Comment.objects.filter(id=cls.comments[3].id).update(is_deleted=True)
+        refresh_comment_counters(cls.issue.id)
+
+    def setUp(self):
+        cache.clear()
+        issue_detail_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def follow(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [comment['comment'] for comment in response.data['results']], response.data['next']
+
+    def test_comments_next_continues_after_the_embedded_page(self):
+        for limit in [None, 2, 3]:
+            issue_detail_cache.clear()
+            path = f'/issues/{self.issue.id}' + (f'?limit={limit}' if limit else '')
+            issue = self.client.get(path).data['issue']
+            seen = [comment['comment'] for comment in issue['comments']]
+            url = issue['comments_next']
+            if limit is None:
+                self.assertIsNone(url)
+            while url:
+                page, url = self.follow(url)
+                self.assertLessEqual(len(page), limit)
+                seen += page
+            self.assertEqual(seen, [f'comment {i}' for i in [6, 5, 4, 2, 1, 0]], limit)
+            # the link is the same when the detail comes from the cache
+            self.assertEqual(self.client.get(path).data['issue']['comments_next'], issue['comments_next'])
+
+    def test_comment_pages_use_a_fixed_number_of_queries(self):
+        counts = []
+        for limit in [1, 5]:
+            with CaptureQueriesContext(connection) as context:
+                self.follow(f'/issues/{self.issue.id}/comments?limit={limit}')
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts, [2, 2])
+        self.assertEqual(self.client.get('/issues/999999/comments').status_code, 404)
+
+
+class LabelRegistryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('curator')
+        cls.bug = Label.objects.create(name='Bug')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_lookups(self, names, ids, queries=0):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual({name: label_registry.id_for_name(name) for name in names}, names)
+            self.assertEqual(label_registry.missing_ids(list(ids)), [label_id for label_id, found in ids.items() if not found])
+        self.assertEqual(len(context.captured_queries), queries)
+
+    def test_api_writes_reload_the_index(self):
+        self.assert_lookups({'bug': self.bug.id}, {self.bug.id: True}, queries=1)
+        # loaded, hits need no query
+        self.assert_lookups({'BUG ': self.bug.id}, {self.bug.id: True})
+
+        label_id = self.client.post('/labels/', {'name': 'ops'}, format='json').data['data']['id']
+        self.assert_lookups({'ops': label_id, 'bug': self.bug.id}, {label_id: True}, queries=1)
+
+        self.client.put(f'/labels/{self.bug.id}/', {'name': 'defect'}, format='json')
+        loads = label_registry.loads
+        self.assertEqual(label_registry.id_for_name('defect'), self.bug.id)
+        self.assertIsNone(label_registry.id_for_name('bug'))
+        self.assertEqual(label_registry.loads, loads + 1)
+
+        self.assertEqual(self.client.delete(f'/labels/{label_id}/').status_code, 204)
+        self.assertIsNone(label_registry.id_for_name('ops'))
+        self.assertEqual(label_registry.missing_ids([label_id, self.bug.id]), [label_id])
+        response = self.client.post('/issues', {'title': 't', 'description': 'd', 'labels': [label_id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_misses_are_checked_against_the_database(self):
+        label_registry.load()
+        # written without signals, the generation does not move
+        Label.objects.bulk_create([Label(name='Silent')])
+        silent = Label.objects.get(name='Silent')
+        self.assertEqual(label_registry.id_for_name('silent'), silent.id)
+        self.assertEqual(label_registry.missing_ids([silent.id]), [])
+        # a real miss costs one query and no reload
+        loads = label_registry.loads
+        self.assert_lookups({'unknown': None}, {}, queries=1)
+        self.assert_lookups({}, {999999: False, 'x': False}, queries=1)
+        self.assertEqual(label_registry.loads, loads)
+
+    @override_settings(LABEL_REGISTRY_MAX_AGE=30)
+    def test_hits_expire_without_a_shared_counter(self):
+        self.assert_lookups({'bug': self.bug.id}, {self.bug.id: True}, queries=1)
+        # deleted by another process, whose bump this process does not see
+        Label.objects.filter(id=self.bug.id).update(is_deleted=True)
+        self.assert_lookups({'bug': self.bug.id}, {self.bug.id: True})
+        label_registry.loaded_at -= 31
+        self.assert_lookups({'bug': None}, {self.bug.id: False}, queries=3)
+
+
+class IssueBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('board')
+        cls.labels = [Label.objects.create(name=name) for name in ['Bug', 'UI']]
+        cls.issues = [Issue.objects.create(title=f'issue {i}', description='d', status='open', assignee=cls.user) for i in range(4)]
+        cls.issues[0].labels.set(cls.labels)
+        cls.issues[2].labels.add(cls.labels[1])
+        Comment.objects.bulk_create(
+            [Comment(issue=cls.issues[0], author=cls.user, comment=f'comment {i}') for i in range(4)]
+            + [Comment(issue=cls.issues[1], author=cls.user, comment='only')]
+        )
+        refresh_comment_counters(cls.issues[0].id, cls.issues[1].id)
+        cls.deleted = Issue.objects.create(title='deleted', description='d', status='open', is_deleted=True)
+
+    def setUp(self):
+        cache.clear()
+        issue_detail_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_same_details_as_retrieve_in_request_order(self):
+        ids = [self.issues[2].id, 999999, self.issues[0].id, self.deleted.id, self.issues[1].id, self.issues[0].id]
+        response = self.client.get('/issues/batch?limit=2&ids=' + ','.join(map(str, ids)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([issue['id'] for issue in response.data['issues']], [self.issues[2].id, self.issues[0].id, self.issues[1].id])
+        self.assertEqual(response.data['missing'], [999999, self.deleted.id])
+        for issue in response.data['issues']:
+            self.assertEqual(issue, self.client.get(f"/issues/{issue['id']}?limit=2").data['issue'])
+        self.assertEqual(len(response.data['issues'][1]['comments']), 2)
+        self.assertIsNotNone(response.data['issues'][1]['comments_next'])
+
+    def test_query_count_does_not_grow_with_ids(self):
+        counts = []
+        for issues in [self.issues[:1], self.issues]:
+            issue_detail_cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get('/issues/batch?ids=' + ','.join(str(issue.id) for issue in issues))
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+        # cached details, only the versions are read
+        path = '/issues/batch?ids=' + ','.join(str(issue.id) for issue in self.issues)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_invalid_ids(self):
+        for ids in ['', 'x', ','.join(str(i) for i in range(201))]:
+            self.assertEqual(self.client.get(f'/issues/batch?ids={ids}').status_code, 400, ids[:10])
+
+
+class IssueDetailCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader')
+        cls.assignee = User.objects.create_user('owner')
+        cls.author = User.objects.create_user('writer')
+        cls.issue = Issue.objects.create(title='cached', description='d', status='open', assignee=cls.assignee)
+        Comment.objects.create(issue=cls.issue, author=cls.author, comment='first')
+
+    def setUp(self):
+        cache.clear()
+        issue_detail_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def detail(self):
+        response = self.client.get(f'/issues/{self.issue.id}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['issue']
+
+    def test_renamed_users_are_not_served_from_cache(self):
+        self.detail()
+        self.assignee.username = 'renamed owner'
+        self.assignee.save()
+        self.assertEqual(self.detail()['assignee']['username'], 'renamed owner')
+        self.author.username = 'renamed writer'
+        self.author.save()
+        self.assertEqual(self.detail()['comments'][0]['author__username'], 'renamed writer')
+
+    def test_flushed_cache_does_not_serve_old_generations(self):
+        self.detail()
+        Issue.objects.filter(id=self.issue.id).update(title='renamed')
+        self.author.username = 'renamed writer'
+        self.author.save()
+        # the users generation starts over after a flush, the process's copy
+        # of the detail is keyed on the old counter
+        cache.clear()
+        self.assertEqual(self.detail()['title'], 'renamed')
+
+    def test_deleted_assignee_is_not_served_from_cache(self):
+        self.detail()
+        self.assignee.delete()
+        self.assertIsNone(self.detail()['assignee'])
+
+    def test_saves_without_rename_keep_entries(self):
+        self.detail()
+        self.assignee.last_login = datetime.now(timezone.utc)
+        self.assignee.save(update_fields=['last_login'])
+        self.assignee.first_name = 'Ow'
+        self.assignee.save()
+        with CaptureQueriesContext(connection) as context:
+            self.detail()
+        self.assertEqual(len(context.captured_queries), 1)
+
+
+# A conditional GET with an ETag taken before a write gets 200 on every
+# endpoint whose body the write changed, and 304 on the others.
+class ConditionalRequestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('etags')
+        cls.label = Label.objects.create(name='Bug')
+        cls.other = Label.objects.create(name='Ui')
+        cls.issue = Issue.objects.create(title='tagged', description='d', status='open', assignee=cls.user)
+        cls.issue.labels.add(cls.label)
+
+    def setUp(self):
+        cache.clear()
+        issue_detail_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.detail = f'/issues/{self.issue.id}'
+        self.etags = {}
+        self.by_label = f'/issues?label={self.label.id}'
+        self.by_other = f'/issues?label={self.other.id}'
+        for path in [self.detail, '/issues', '/labels/', self.by_label, self.by_other]:
+            response = self.client.get(path)
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304, path)
+            self.etags[path] = response['ETag']
+
+    def assert_revalidated(self, changed, unchanged=()):
+        for path in changed:
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=self.etags[path]).status_code, 200, path)
+        for path in unchanged:
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=self.etags[path]).status_code, 304, path)
+
+    def test_issue_update(self):
+        self.client.patch(self.detail, {'title': 'retitled', 'version': 1}, format='json')
+        self.assert_revalidated([self.detail, '/issues'], ['/labels/'])
+
+    def test_comment(self):
+        self.client.post(f'{self.detail}/comments', {'comment': 'new'}, format='json')
+        self.assert_revalidated([self.detail, '/issues'], ['/labels/'])
+
+    def test_replace_labels(self):
+        self.client.put(f'{self.detail}/labels', {'labels': [self.other.id]}, format='json')
+        self.assert_revalidated([self.detail, '/issues', self.by_label, self.by_other], ['/labels/'])
+        self.assertEqual(self.client.get(self.by_label).data['results'], [])
+        self.assertEqual([issue['id'] for issue in self.client.get(self.by_other).data['results']], [self.issue.id])
+
+    def test_bulk_status(self):
+        self.client.post('/issues/bulk-status', {'ids': [self.issue.id], 'status': 'in_progress'}, format='json')
+        self.assert_revalidated([self.detail, '/issues'], ['/labels/'])
+
+    def test_label_rename(self):
+        self.assertEqual(self.client.put(f'/labels/{self.label.id}/', {'name': 'Defect'}, format='json').status_code, 200)
+        self.assert_revalidated([self.detail, '/labels/'])
+
+    def test_label_create(self):
+        self.client.post('/labels/', {'name': 'New'}, format='json')
+        self.assert_revalidated(['/labels/'], ['/issues'])
+
+    def test_user_rename(self):
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assert_revalidated([self.detail, '/issues'], ['/labels/'])
+
+    def test_issue_create_and_delete(self):
+        self.client.post('/issues', {'title': 'another', 'description': 'd', 'status': 'open'}, format='json')
+        self.assert_revalidated(['/issues'], [self.detail, '/labels/'])
+        self.etags['/issues'] = self.client.get('/issues')['ETag']
+        self.client.delete(self.detail)
+        self.assert_revalidated(['/issues'])
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=self.etags[self.detail]).status_code, 404)
+
+
+# The daily latency sketches kept up to date by the issue write paths hold
+# the same samples as a rebuild from the issues table.
+class LatencySketchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('resolver')
+        cls.other = User.objects.create_user('helper')
+        cls.labels = [Label.objects.create(name=name) for name in ['Bug', 'Ui']]
+        cls.issues = [Issue.objects.create(title=f'issue {i}', description='d', status='open', assignee=cls.user) for i in range(3)]
+        for issue in cls.issues:
+            issue.labels.set(cls.labels[:1])
+        Issue.objects.update(created_at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sketches(self):
+        return {
+            (sketch.dimension, sketch.key, sketch.day): (
+                sketch.count, sketch.sketch['buckets'], sketch.sketch['zero_count'], round(sketch.sketch['total'], 3),
+            )
+            for sketch in LatencySketch.objects.all()
+        }
+
+    def assert_matches_rebuild(self, step):
+        maintained = self.sketches()
+        with transaction.atomic():
+            rebuild_latency_sketches()
+            rebuilt = self.sketches()
+            transaction.set_rollback(True)
+        self.assertEqual(maintained, rebuilt, step)
+
+    def patch(self, issue, **fields):
+        version = Issue.objects.get(id=issue.id).version
+        response = self.client.patch(f'/issues/{issue.id}', {**fields, 'version': version}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_sketches_match_rebuild(self):
+        a, b, c = self.issues
+        self.patch(a, status='resolved')
+        self.client.post('/issues/bulk-status', {'ids': [b.id, c.id], 'status': 'resolved'}, format='json')
+        self.assertEqual(latency_summary().count, 3)
+        self.assert_matches_rebuild('resolve')
+
+        b_resolved_at = Issue.objects.get(id=b.id).resolved_at
+        self.client.post('/issues/bulk-status', {'ids': [a.id, b.id], 'status': 'resolved'}, format='json')
+        self.assertEqual(Issue.objects.get(id=b.id).resolved_at, b_resolved_at)
+        self.assert_matches_rebuild('resolve again')
+
+        self.patch(a, status='open')
+        self.assert_matches_rebuild('reopen')
+        self.client.patch('/issues/bulk', [{'id': a.id, 'version': Issue.objects.get(id=a.id).version, 'status': 'resolved'}], format='json')
+        self.assert_matches_rebuild('re-resolve')
+
+        self.patch(b, assignee_id=self.other.id)
+        self.client.put(f'/issues/{b.id}/labels', {'labels': [self.labels[1].id]}, format='json')
+        self.client.patch('/issues/bulk', [{'id': c.id, 'version': Issue.objects.get(id=c.id).version, 'labels': [self.labels[1].id]}], format='json')
+        self.assert_matches_rebuild('reassign and relabel')
+
+        self.client.post('/issues/bulk-status', {'ids': [c.id], 'status': 'in_progress'}, format='json')
+        self.client.delete(f'/issues/{a.id}')
+        self.assert_matches_rebuild('reopen and delete')
+        self.assertEqual(latency_summary().count, 1)
+        self.assertEqual(latency_summary('label', self.labels[0].id).count, 0)
+        self.assertEqual(latency_summary('assignee', self.other.id).count, 1)
+
+
+class ChangeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('follower')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def changes(self, since):
+        response = self.client.get(f'/changes?since={since}&limit=2')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_writes_are_listed_in_order(self):
+        start = self.client.get('/changes?since=latest').data
+        self.assertEqual(start['results'], [])
+
+        issue_id = self.client.post('/issues', {'title': 'feed', 'description': 'd', 'status': 'open'}, format='json').data['issue_id']
+        self.client.patch(f'/issues/{issue_id}', {'status': 'resolved', 'version': 1}, format='json')
+        self.client.post(f'/issues/{issue_id}/comments', {'comment': 'done'}, format='json')
+        label = self.client.post('/labels/', {'name': 'feed'}, format='json').data['data']
+
+        page = self.changes(start['cursor'])
+        self.assertTrue(page['has_more'])
+        events = page['results'] + self.changes(page['cursor'])['results']
+        self.assertEqual(
+            [(event['kind'], event['issue_id'], event['label_id']) for event in events],
+            [('issue.created', issue_id, None), ('issue.updated', issue_id, None),
+             ('comment.created', issue_id, None), ('label.created', None, label['id'])],
+        )
+        self.assertEqual(events[1]['data']['status'], 'resolved')
+        self.assertEqual({event['actor_id'] for event in events}, {self.user.id})
+        self.assertEqual([event['id'] for event in events], list(range(events[0]['id'], events[0]['id'] + 4)))
+
+        last = self.changes(events[-1]['id'])
+        self.assertEqual((last['results'], last['cursor'], last['has_more']), ([], str(events[-1]['id']), False))
+
+    def test_rolled_back_writes_leave_no_events(self):
+        cursor = self.client.get('/changes?since=latest').data['cursor']
+        try:
+            with transaction.atomic():
+                ChangeLog(self.user).add('label.created', label_id=1, name='gone').write()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(self.changes(cursor)['results'], [])
+
+    def test_invalid_cursor(self):
+        for query in ['since=abc', 'since=-1', 'limit=0']:
+            self.assertEqual(self.client.get(f'/changes?{query}').status_code, 400, query)
+
+
+# GET /changes/stream through the ASGI URLs, the hub polling every 10 ms.
+@override_settings(ROOT_URLCONF='issue_tracker.asgi_urls', STREAM_POLL_SECONDS=0.01, STREAM_KEEPALIVE_SECONDS=0.05)
+class ChangeStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('watcher')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.label = Label.objects.create(name='Bug')
+        cls.assigned = Issue.objects.create(title='assigned', description='d', status='open', assignee=cls.user)
+        cls.labelled = Issue.objects.create(title='labelled', description='d', status='open')
+        cls.labelled.labels.add(cls.label)
+
+    def write(self, *changes):
+        log = ChangeLog(self.user)
+        for kind, issue_id, data in changes:
+            log.add(kind, issue_id, **data)
+        return sync_to_async(log.write)()
+
+    async def stream(self, query):
+        response = await self.async_client.get(f'/changes/stream?{query}', headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        # the stream subscribes when the body is first read
+        self.assertTrue((await anext(content)).startswith(b'retry: '))
+        return content
+
+    # the server cancels the response when the client goes away
+    async def disconnect(self, content):
+        reader = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+
+    async def read_events(self, content, count):
+        events = []
+        for _ in range(100):
+            if len(events) == count:
+                break
+            chunk = (await asyncio.wait_for(anext(content), 5)).decode()
+            if chunk.startswith('id: '):
+                fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                events.append((fields['event'], json.loads(fields['data'])['issue_id']))
+        return events
+
+    async def test_stream_catches_up_then_follows(self):
+        cursor = (await sync_to_async(self.client.get)('/changes?since=latest', HTTP_AUTHORIZATION=f'Token {self.token.key}')).data['cursor']
+        await self.write(('issue.updated', self.assigned.id, {'status': 'resolved'}), ('issue.updated', self.labelled.id, {'status': 'resolved'}))
+        content = await self.stream(f'issue={self.assigned.id}&since={cursor}')
+        self.assertEqual(await self.read_events(content, 1), [('issue.updated', self.assigned.id)])
+
+        await self.write(('comment.created', self.labelled.id, {}), ('comment.created', self.assigned.id, {}))
+        self.assertEqual(await self.read_events(content, 1), [('comment.created', self.assigned.id)])
+        await self.disconnect(content)
+        self.assertIsNone(change_hub.task)
+
+    async def test_filters_use_current_assignee_and_labels(self):
+        assignee = await self.stream(f'assignee={self.user.id}')
+        label = await self.stream(f'label={self.label.id}')
+        await self.write(
+            ('issue.updated', self.labelled.id, {'title': 'renamed'}),
+            ('issue.updated', self.assigned.id, {'title': 'renamed'}),
+            ('issue.updated', self.labelled.id, {'assignee_id': self.user.id}),
+        )
+        self.assertEqual(await self.read_events(assignee, 2), [('issue.updated', self.assigned.id), ('issue.updated', self.labelled.id)])
+        self.assertEqual(await self.read_events(label, 2), [('issue.updated', self.labelled.id), ('issue.updated', self.labelled.id)])
+        await self.disconnect(assignee)
+        await self.disconnect(label)
+
+    async def test_invalid_filters(self):
+        for query in ['issue=x', 'assignee=me', 'since=-1']:
+            response = await self.async_client.get(f'/changes/stream?{query}', headers={'Authorization': f'Token {self.token.key}'})
+            self.assertEqual(response.status_code, 400, query)
+
+
+class ArchivalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('janitor', is_staff=True)
+        cls.labels = [Label.objects.create(name=name) for name in ['Bug', 'Stale']]
+        cls.live = Issue.objects.create(title='live', description='d', status='open', assignee=cls.user)
+        cls.old = Issue.objects.create(title='old', description='d', status='open', assignee=cls.user, created_by=cls.user)
+        cls.recent = Issue.objects.create(title='recent', description='d', status='open')
+        cls.live.labels.set(cls.labels)
+        cls.old.labels.set(cls.labels)
+        cls.comments = Comment.objects.bulk_create(
+            [Comment(issue=cls.old, author=cls.user, comment=f'old {i}') for i in range(3)]
+            + [Comment(issue=cls.live, author=cls.user, comment='kept'), Comment(issue=cls.live, author=cls.user, comment='removed', is_deleted=True)]
+        )
+        refresh_comment_counters(cls.old.id, cls.live.id)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    # soft deletes through the API, all but `recent` 60 days ago
+    def delete_rows(self):
+        for issue in [self.old, self.recent]:
+            self.assertEqual(self.client.delete(f'/issues/{issue.id}').status_code, 200)
+        self.assertEqual(self.client.delete(f'/labels/{self.labels[1].id}/').status_code, 204)
+        long_ago = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        Issue.objects.filter(id=self.old.id).update(updated_at=long_ago)
+        Label.objects.filter(id=self.labels[1].id).update(updated_at=long_ago)
+        Comment.objects.filter(is_deleted=True).update(updated_at=long_ago)
+
+    def test_archive_and_restore(self):
+        self.delete_rows()
+        out = StringIO()
+        call_command('archive_deleted', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue().strip(), '1 issues, 1 comments, 1 labels to archive')
+
+        call_command('archive_deleted', '--batch-size', '1', '--pause', '0', stdout=StringIO())
+        self.assertEqual(set(Issue.objects.values_list('id', flat=True)), {self.live.id, self.recent.id})
+        self.assertEqual(list(Comment.objects.values_list('comment', flat=True)), ['kept'])
+        self.assertEqual(list(Label.objects.values_list('name', flat=True)), ['Bug'])
+        self.assertEqual(list(self.live.labels.values_list('name', flat=True)), ['Bug'])
+        self.assertEqual(ArchivedIssue.objects.get().id, self.old.id)
+        self.assertEqual(ArchivedComment.objects.count(), 4)
+        self.assertEqual(ArchivedIssueLabel.objects.count(), 3)
+
+        run = self.client.get('/reports/metrics').data['archival']
+        self.assertEqual(run['rows'], {'issues': 1, 'comments': 4, 'labels': 1, 'issue_labels': 3})
+        self.assertTrue(run['complete'])
+        self.assertGreater(run['rows_per_second'], 0)
+
+        # nothing left to archive
+        self.assertEqual(sum(archive_deleted(pause=0)['rows'].values()), 0)
+
+        call_command('restore_archived', '--labels', str(self.labels[1].id), '--issues', str(self.old.id), stdout=StringIO())
+        restored = Issue.objects.get(id=self.old.id)
+        self.assertTrue(restored.is_deleted)
+        self.assertEqual((restored.created_at, restored.created_by_id, restored.comment_count), (self.old.created_at, self.user.id, 3))
+        self.assertEqual(restored.labels.count(), 2)
+        self.assertEqual(self.live.labels.count(), 2)
+        self.assertEqual(Comment.objects.filter(issue=self.old).count(), 3)
+        self.assertTrue(Label.objects.get(id=self.labels[1].id).is_deleted)
+        # a fresh retention window
+        self.assertEqual(sum(archive_deleted(pause=0)['rows'].values()), 0)
+
+        removed = ArchivedComment.objects.get()
+        call_command('restore_archived', '--comments', str(removed.id), stdout=StringIO())
+        self.assertTrue(Comment.objects.get(id=removed.id).is_deleted)
+        self.assertFalse(ArchivedComment.objects.exists() or ArchivedIssue.objects.exists() or ArchivedIssueLabel.objects.exists())
+
+    def test_restore_errors(self):
+        self.delete_rows()
+        archive_deleted(pause=0)
+        with self.assertRaises(CommandError):
+            call_command('restore_archived', '--issues', '999999', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('restore_archived', '--comments', str(self.comments[0].id), stdout=StringIO())
+        self.client.post('/labels/', {'name': 'stale'}, format='json')
+        with self.assertRaisesMessage(CommandError, 'Label names in use: Stale'):
+            call_command('restore_archived', '--labels', str(self.labels[1].id), stdout=StringIO())
+        self.assertTrue(ArchivedLabel.objects.filter(id=self.labels[1].id).exists())
+
+    def test_archiving_sends_delete_signals(self):
+        self.delete_rows()
+        deleted = []
+        def record(sender, instance, **kwargs):
+            deleted.append((sender.__name__, instance.id))
+        post_delete.connect(record, dispatch_uid='archival-test')
+        try:
+            archive_deleted(pause=0)
+        finally:
+            post_delete.disconnect(dispatch_uid='archival-test')
+        self.assertEqual(
+            sorted((name, row_id) for name, row_id in deleted if name in ['Issue', 'Label']),
+            [('Issue', self.old.id), ('Label', self.labels[1].id)],
+        )
+
+    def test_max_seconds(self):
+        self.delete_rows()
+        run = archive_deleted(pause=0, max_seconds=0)
+        self.assertFalse(run['complete'])
+        self.assertEqual(run['batches'], 0)
+        self.assertTrue(Issue.objects.filter(id=self.old.id).exists())
+
+
+# Runs every benchmark endpoint against a small seeded dataset and checks it
+# stays within its SQL query budget (see benchmarks.py).
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=10, labels=8, issues=120, comments=300, seed=1)
+
+    def test_every_route_is_benchmarked(self):
+        routes = {pattern.name for pattern in core_urlpatterns + user_urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(routes - {endpoint.route for endpoint in ENDPOINTS}, set())
+
+    def test_query_budgets(self):
+        ctx = BenchmarkContext()
+        for endpoint in ENDPOINTS:
+            if endpoint.route.startswith('user-'):
+                continue
+            with self.subTest(endpoint=endpoint.name):
+                result = run_endpoint(ctx, endpoint, iterations=2)
+                self.assertLessEqual(result['max_queries'], result['budget'])
+
+    def test_temporary_token_leaves_no_account(self):
+        users = User.objects.count()
+        with temporary_benchmark_token() as token:
+            self.assertFalse(token.user.has_usable_password())
+            self.assertEqual(APIClient().get('/reports/cache', HTTP_AUTHORIZATION=f'Token {token.key}').status_code, 200)
+        self.assertEqual(User.objects.count(), users)
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+
+
+class QueryInstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('metrics', is_staff=True)
+        cls.issue = Issue.objects.create(title='issue', description='d', status='open')
+
+    def setUp(self):
+        route_metrics.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/issues/{self.issue.id}/comments')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="(\d+) queries", app;dur=[\d.]+$')
+        count = int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertEqual(count, len(context.captured_queries))
+
+    def test_streamed_body_is_measured(self):
+        response = self.client.get('/issues/export?file_type=csv')
+        b''.join(response.streaming_content)
+        metrics = route_metrics.summary()['GET /issues/export']
+        self.assertEqual(metrics['requests'], 1)
+        self.assertGreaterEqual(metrics['max_queries'], 2)
+
+    @override_settings(REPEATED_QUERY_THRESHOLD=3, SLOW_REQUEST_MS=0)
+    def test_repeated_queries_are_logged(self):
+        def view(request):
+            for _ in range(3):
+                Issue.objects.filter(id=self.issue.id).first()
+            return HttpResponse()
+
+        with self.assertLogs('core_app.middleware', 'WARNING') as logs:
+            QueryInstrumentationMiddleware(view)(RequestFactory().get('/report'))
+        self.assertTrue(any('Slow request GET /report' in line and '3 queries' in line for line in logs.output))
+        self.assertTrue(any('Repeated query' in line and '3 times' in line for line in logs.output))
+
+    def test_metrics_endpoint(self):
+        self.client.get('/issues')
+        response = self.client.get('/reports/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['routes']['GET /issues']['requests'], 1)
+
+
+# The async read views served by the ASGI application must answer exactly
+# like the DRF views they stand in for.
+@override_settings(ASYNC_PARALLEL_QUERIES=False)
+class AsyncReadViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', is_staff=True)
+        cls.token = Token.objects.create(user=cls.user)
+        cls.label = Label.objects.create(name='Bug')
+        cls.issue = Issue.objects.create(title='issue', description='d', assignee=cls.user, status='open')
+        cls.issue.labels.add(cls.label)
+        for i in range(25):
+            Comment.objects.create(issue=cls.issue, author=cls.user, comment=f'comment {i}')
+
+    def get_both(self, path, **headers):
+        headers.setdefault('Authorization', f'Token {self.token.key}')
+        sync_response = self.client.get(path, headers=headers)
+        with self.settings(ROOT_URLCONF='issue_tracker.asgi_urls'):
+            async_response = async_to_sync(self.async_client.get)(path, headers=headers)
+        return sync_response, async_response
+
+    def assert_same(self, path, **headers):
+        sync_response, async_response = self.get_both(path, **headers)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'))
+        if sync_response.status_code != 304:
+            self.assertEqual(async_response.json(), sync_response.json())
+        return async_response
+
+    def test_read_endpoints(self):
+        paths = [
+            '/issues', f'/issues?id={self.issue.id}', f'/issues/{self.issue.id}', f'/issues/{self.issue.id}?limit=5',
+            '/issues/999999', '/labels/', '/labels/?keyword=bu', '/reports/top-assignees',
+            '/reports/latency', '/reports/latency?label=1&assignee=1',
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                self.assert_same(path)
+        # the second request moves the counters
+        for path in ['/reports/cache', '/reports/metrics']:
+            sync_response, async_response = self.get_both(path)
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.json().keys(), sync_response.json().keys())
+
+    def test_not_modified(self):
+        for path in ['/issues', f'/issues/{self.issue.id}', '/labels/']:
+            with self.subTest(path=path):
+                etag = self.client.get(path, headers={'Authorization': f'Token {self.token.key}'})['ETag']
+                response = self.assert_same(path, If_None_Match=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_authentication(self):
+        self.assert_same('/issues', Authorization='')
+        self.assert_same('/issues', Authorization='Token unknown')
+
+    def test_writes_go_to_drf_views(self):
+        with self.settings(ROOT_URLCONF='issue_tracker.asgi_urls'):
+            response = async_to_sync(self.async_client.post)(
+                '/issues', {'title': 'new', 'description': 'd'}, content_type='application/json',
+                headers={'Authorization': f'Token {self.token.key}'},
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Issue.objects.filter(id=response.json()['issue_id']).exists())
+
+
+# 'stale_replica' is a second SQLite database (see settings.py) that nothing
+# replicates to: it holds a copy of the test data made in setUpTestData, so
+# rows written afterwards only exist on the primary. The alias the router
+# picked is recorded for every query a request runs.
+@override_settings(DATABASE_REPLICAS=['stale_replica'], REPLICA_CHECK_SECONDS=0, ASYNC_PARALLEL_QUERIES=False)
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'stale_replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('replica')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.issue = Issue.objects.create(title='issue', description='d', status='open')
+        for queryset in [User.objects.all(), Issue.objects.all()]:
+            queryset.model.objects.using('stale_replica').bulk_create(queryset.model(**values) for values in queryset.values())
+
+    def setUp(self):
+        cache.clear()
+        replica_monitor.checked_at = None
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def read_aliases(self, request):
+        aliases = []
+
+        def record(alias):
+            def wrapper(execute, sql, params, many, context):
+                aliases.append((alias, read_database.get()))
+                return execute(sql, params, many, context)
+            return wrapper
+
+        with connections['default'].execute_wrapper(record('default')), connections['stale_replica'].execute_wrapper(record('stale_replica')):
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        return aliases
+
+    def test_reads_use_a_replica(self):
+        for path in ['/issues', f'/issues/{self.issue.id}', '/labels/', '/reports/top-assignees', '/reports/latency']:
+            self.assertIn(('stale_replica', 'stale_replica'), self.read_aliases(lambda: self.client.get(path)), path)
+        with self.settings(ROOT_URLCONF='issue_tracker.asgi_urls'):
+            aliases = self.read_aliases(lambda: async_to_sync(self.async_client.get)(
+                '/issues', headers={'Authorization': f'Token {self.token.key}'},
+            ))
+        self.assertIn(('stale_replica', 'stale_replica'), aliases)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.client.patch(f'/issues/{self.issue.id}', {'status': 'in_progress', 'version': self.issue.version}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_pinned(self.user.id))
+        self.assertEqual(Issue.objects.using('stale_replica').get(id=self.issue.id).status, 'open')
+        aliases = self.read_aliases(lambda: self.client.get(f'/issues/{self.issue.id}'))
+        self.assertEqual({alias for alias, _ in aliases}, {'default'})
+        self.assertEqual(self.client.get(f'/issues/{self.issue.id}').data['issue']['status'], 'in_progress')
+
+        # a new row, read back while the replica does not have it
+        response = self.client.post('/issues', {'title': 'new', 'description': 'd'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        issue_id = response.json()['issue_id']
+        self.assertFalse(Issue.objects.using('stale_replica').filter(id=issue_id).exists())
+        self.assertEqual(self.client.get(f'/issues/{issue_id}').status_code, 200)
+        self.assertIn(issue_id, [issue['id'] for issue in self.client.get('/issues').data['results']])
+
+        # once the pin expires, reads see the stale replica again
+        cache.clear()
+        self.assertEqual(choose_read_database(self.user), 'stale_replica')
+        self.assertEqual(self.client.get(f'/issues/{self.issue.id}').data['issue']['status'], 'open')
+        self.assertEqual(self.client.get(f'/issues/{issue_id}').status_code, 404)
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=-1)
+    def test_lagging_replica_is_skipped(self):
+        self.assertIsNone(choose_read_database(self.user))
+        self.assertEqual(replica_monitor.stats()['replicas'], {'stale_replica': {'lag_seconds': 0.0, 'healthy': False}})
+
+    def test_writes_and_migrations_use_the_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_write(Issue), 'default')
+        self.assertTrue(router.allow_migrate('default', 'core_app'))
+        self.assertFalse(router.allow_migrate('stale_replica', 'core_app'))
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertIsNone(choose_read_database(self.user))
+            self.assertTrue(router.allow_migrate('stale_replica', 'core_app'))
@@ -11,15 +11,27 @@ urlpatterns = [
 # Issue endpoints
 urlpatterns += [
     path('issues', IssueViewSet.as_view({'get': 'list', 'post': 'create'}), name='issue-list'),
+    path('issues/batch', IssueViewSet.as_view({'get': 'batch'}), name='issue-batch'),
     path('issues/<int:pk>', IssueViewSet.as_view({'patch': 'update', 'delete': 'destroy' ,'get':'retrieve'}), name='issue-detail'),
 
-    path('issues/<int:pk>/comments', IssueViewSet.as_view({'post': 'add_comment'}), name='issue-comment'),
+    path('issues/<int:pk>/comments', IssueViewSet.as_view({'get': 'list_comments', 'post': 'add_comment'}), name='issue-comment'),
     path('issues/<int:pk>/labels', IssueViewSet.as_view({'put': 'replace_labels'}), name='issue-label'),
+    path('issues/bulk', IssueViewSet.as_view({'post': 'create_bulk', 'patch': 'update_bulk'}), name='issue-bulk-create'),
     path('issues/bulk-status', IssueViewSet.as_view({'post': 'bulk_status'}), name='issue-bulk-status-update'),
 
     #import and report endpoints
+    path('issues/export', IssueImportandReportView.as_view({'get': 'export'}), name='issue-export'),
     path('issues/import', IssueImportandReportView.as_view({'post': 'import_csv'}), name='issue-import'),
+    path('issues/import/<int:job_id>', IssueImportandReportView.as_view({'get': 'import_status'}), name='issue-import-status'),
 
     path('reports/top-assignees', IssueImportandReportView.as_view({'get': 'top_assignee'}), name='issue-top-assignees'),
     path('reports/latency', IssueImportandReportView.as_view({'get': 'get_average_time'}), name='issue-average-time'),
+    path('reports/cache', IssueImportandReportView.as_view({'get': 'cache_stats'}), name='issue-cache-stats'),
+    path('reports/metrics', IssueImportandReportView.as_view({'get': 'request_metrics'}), name='request-metrics'),
+]
+
+
+# Change feed
+urlpatterns += [
+    path('changes', ChangeViewSet.as_view({'get': 'list'}), name='change-list'),
 ]
@@ -1,2 +1,3 @@
 from .label_views import LabelViewSet
-from .issue_views import IssueViewSet, IssueImportandReportView
\ No newline at end of file
+from .issue_views import IssueViewSet, IssueImportandReportView
+from .change_views import ChangeViewSet
@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'issue_tracker.settings')
 
-application = get_asgi_application()
+
+# Routes requests through ASGI_URLCONF, whose read endpoints are async views
+# that run on the event loop instead of a thread per request.
+class IssueTrackerASGIHandler(ASGIHandler):
+    async def get_response_async(self, request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+django.setup(set_prefix=False)
+application = IssueTrackerASGIHandler()
@@ -0,0 +1,14 @@
+"""
+URL configuration of the ASGI application (see asgi.py): the same routes as
+urls.py, with the read endpoints of core_app served by async views.
+"""
+from django.contrib import admin
+from django.urls import include, path
+from user_app.urls import urlpatterns as user_urlpatterns
+from core_app.async_urls import urlpatterns as core_urlpatterns
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('', include(user_urlpatterns)),
+    path('', include(core_urlpatterns)),
+]
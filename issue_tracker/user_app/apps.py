@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UserAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_app'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+        from .authentication import revoke_inactive_user, revoke_tokens
+        post_delete.connect(revoke_tokens, sender=Token, dispatch_uid='auth-token-revoke')
+        post_save.connect(revoke_inactive_user, sender=User, dispatch_uid='auth-user-deactivate')
@@ -0,0 +1,70 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from core_app.helpers import LRUCache, get_generation, invalidate_generation
+
+TOKENS_GENERATION = 'auth-tokens'
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    with _token_cache_lock:
+        if _token_cache is None:
+            _token_cache = LRUCache(getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000))
+    return _token_cache
+
+
+# TokenAuthentication that remembers token -> user for AUTH_TOKEN_CACHE_TTL
+# seconds, so an authenticated request costs a cache counter read instead of
+# the authtoken_token JOIN auth_user query. Entries are only used while the
+# 'auth-tokens' generation is unchanged; deleting a token or deactivating a
+# user bumps it (see revoke_tokens), which drops every cached token in every
+# process sharing the default cache at once. With a per-process default cache
+# (the LocMem default, see CACHES) other processes keep accepting a revoked
+# token until its entry expires, so revocation there is bounded by the TTL
+# only. Failed lookups are never cached.
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        ttl = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+        if ttl <= 0:
+            return super().authenticate_credentials(key)
+        token_cache = get_token_cache()
+        generation = get_generation(TOKENS_GENERATION)
+        entry = token_cache.get(key)
+        if entry is not None:
+            token, expires_at, entry_generation = entry
+            if entry_generation == generation and expires_at > time.monotonic():
+                # each request gets its own copies, views may set attributes
+                token = copy.copy(token)
+                token.user = copy.copy(entry[0].user)
+                return (token.user, token)
+            token_cache.pop(key)
+
+        user, token = super().authenticate_credentials(key)
+        cached = copy.copy(token)
+        cached.user = copy.copy(user)
+        token_cache.set(key, (cached, time.monotonic() + ttl, generation))
+        return (user, token)
+
+
+def revoke_tokens(**kwargs):
+    invalidate_generation(TOKENS_GENERATION)
+
+
+def revoke_inactive_user(sender, instance, **kwargs):
+    if not instance.is_active:
+        revoke_tokens()
+
+
+def token_cache_stats():
+    stats = get_token_cache().stats()
+    stats['ttl'] = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+    return stats
+
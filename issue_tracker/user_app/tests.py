@@ -1,3 +1,70 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core_app.benchmarks import ENDPOINTS, BenchmarkContext, run_endpoint
+from core_app.helpers import check_shared_cache
+
+from .authentication import get_token_cache
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBudgetTests(TestCase):
+    def test_query_budgets(self):
+        ctx = BenchmarkContext()
+        for endpoint in ENDPOINTS:
+            if not endpoint.route.startswith('user-'):
+                continue
+            with self.subTest(endpoint=endpoint.name):
+                result = run_endpoint(ctx, endpoint, iterations=2)
+                self.assertLessEqual(result['max_queries'], result['budget'])
+
+
+@override_settings(AUTH_TOKEN_CACHE_TTL=60)
+class CachedTokenAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('member')
+        cls.other = User.objects.create_user('colleague')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.other_token = Token.objects.create(user=cls.other)
+
+    def setUp(self):
+        cache.clear()
+        get_token_cache().clear()
+
+    def get(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client.get('/labels/')
+
+    def test_cached_token_skips_the_token_query(self):
+        self.assertEqual(self.get(self.token).status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get(self.token).status_code, 200)
+        self.assertFalse([query for query in context.captured_queries if 'authtoken_token' in query['sql']])
+
+    def test_deleted_token_is_revoked_at_once(self):
+        self.assertEqual(self.get(self.token).status_code, 200)
+        self.assertEqual(self.get(self.other_token).status_code, 200)
+        Token.objects.filter(key=self.token.key).delete()
+        self.assertEqual(self.get(self.token).status_code, 401)
+        # the other token is looked up again and still works
+        self.assertEqual(self.get(self.other_token).status_code, 200)
+
+    def test_deactivated_user_is_revoked_at_once(self):
+        self.assertEqual(self.get(self.token).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(self.token).status_code, 401)
+        self.assertEqual(self.get(self.other_token).status_code, 200)
+
+    def test_deploy_check_warns_about_a_per_process_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['core_app.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/0'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])